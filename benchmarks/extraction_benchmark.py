@@ -0,0 +1,95 @@
+"""
+Benchmark of item extraction from fixture pages in tests/res. Compares extraction with per-call 'select' queries
+(as spiders did before compiled selectors were introduced) with the spiders' current extraction.
+
+Pages are parsed once, only extraction is measured. Run from the repository root:
+
+    python benchmarks/extraction_benchmark.py --repeat 200
+"""
+from __future__ import annotations
+
+import argparse
+import pathlib
+import time
+from collections.abc import Callable
+
+import bs4
+
+from news_crawlers import spiders
+
+RESOURCES = pathlib.Path(__file__).parents[1] / "tests" / "res"
+
+
+def select_avtonet(content: bs4.BeautifulSoup) -> list[spiders.SpiderItem]:
+    found_listings = []
+    for listing in content.select("div[class*=GO-Results-Row]"):
+        found_listings.append(
+            {
+                "query": "benchmark",
+                "title": listing.select("div[class*=GO-Results-Naziv]")[0].select("span")[0].text,
+                "url": str(listing.select("a[class*=stretched-link]")[0].attrs["href"]),
+                "price": listing.select("div[class*=GO-Results-Price-TXT-Regular]")[0].text.strip(),
+            }
+        )
+    return found_listings
+
+
+def select_bolha(content: bs4.BeautifulSoup) -> list[spiders.SpiderItem]:
+    found_items = []
+    for listing in content.select("li.EntityList-item"):
+        listing_el = listing.select("a.link")
+        price_el = listing.select("strong.price")
+        if not listing_el or not price_el:
+            continue
+        found_items.append(
+            {
+                "query": "benchmark",
+                "title": listing_el[0].text,
+                "price": price_el[0].get_text(strip=True),
+                "url": str(listing_el[0].attrs["href"]),
+            }
+        )
+    return found_items
+
+
+def compiled_avtonet(content: bs4.BeautifulSoup) -> list[spiders.SpiderItem]:
+    return spiders.AvtonetSpider.listing_extractor.extract(content)
+
+
+def compiled_bolha(content: bs4.BeautifulSoup) -> list[spiders.SpiderItem]:
+    return spiders.BolhaSpider.listing_extractor.extract(content)
+
+
+Extract = Callable[[bs4.BeautifulSoup], list[spiders.SpiderItem]]
+
+
+def measure(extract: Extract, content: bs4.BeautifulSoup, repeat: int) -> float:
+    """
+    :return: Extracted items per second.
+    """
+    num_items = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        num_items += len(extract(content))
+    return num_items / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=100, help="Number of extractions of each page.")
+    args = parser.parse_args()
+
+    benchmarks = {
+        "avtonet_test_html.html": (select_avtonet, compiled_avtonet),
+        "bolha_test_html.html": (select_bolha, compiled_bolha),
+    }
+    print(f"{'page':<26}{'select [items/s]':>18}{'compiled [items/s]':>20}{'speedup':>10}")
+    for page, (select_extract, compiled_extract) in benchmarks.items():
+        content = bs4.BeautifulSoup((RESOURCES / page).read_text(encoding="utf8"), "html.parser")
+        select_rate = measure(select_extract, content, args.repeat)
+        compiled_rate = measure(compiled_extract, content, args.repeat)
+        print(f"{page:<26}{select_rate:>18.0f}{compiled_rate:>20.0f}{compiled_rate / select_rate:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
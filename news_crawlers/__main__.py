@@ -1,16 +1,27 @@
 from __future__ import annotations
 
 import argparse
+import datetime
+import multiprocessing
 import pathlib
-from collections.abc import Sequence
+import tempfile
+from collections.abc import Callable, Sequence
 import logging.handlers
 import importlib_metadata
 
 import yaml
 
+from news_crawlers import archive
+from news_crawlers import coalescing
 from news_crawlers import scrape
 from news_crawlers import scheduler
 from news_crawlers import configuration
+from news_crawlers import fetching
+from news_crawlers import history
+from news_crawlers import logs
+from news_crawlers import metrics
+from news_crawlers import profiling
+from news_crawlers import workqueue
 
 __version__ = importlib_metadata.version("news_crawlers")
 
@@ -29,7 +40,7 @@ def read_configuration(config_path: pathlib.Path | None = None) -> configuration
     with open(found_config_path, encoding="utf8") as file:
         config_dict = yaml.safe_load(file)
 
-    logger.debug(f"Found configuration in {found_config_path.resolve()}")
+    logger.debug("Found configuration in %s", found_config_path.resolve())
 
     if config_dict is None:
         config_dict = {}
@@ -37,56 +48,264 @@ def read_configuration(config_path: pathlib.Path | None = None) -> configuration
     return configuration.NewsCrawlersConfig(**config_dict)
 
 
-def run_crawlers(
+def run_crawlers(  # pylint: disable=too-many-arguments,too-many-positional-arguments
     config_path: pathlib.Path | None,
     spiders_to_run: list[str] | None,
     cache_folder: pathlib.Path,
-) -> None:
+    profiler: profiling.Profiler | None = None,
+    queue: workqueue.WorkQueue | None = None,
+    tick: int = 0,
+    queries: list[str] | None = None,
+) -> scrape.RunReport:
     """
     Run the selected spiders, compare results with cache, and send notifications for new items.
 
     :param config_path: Optional path to the config file.
     :param spiders_to_run: List of spider names to run, or None to run all configured spiders.
-    :param cache_folder: Directory where per-spider cache files are stored.
+    :param cache_folder: Directory where cache files are stored.
+    :param profiler: Optional profiler for spider runs. No profiling is done if None.
+    :param queue: Work queue, shared with other workers. If given, only the queries of the tick claimed by this worker
+                  are crawled and notified about.
+    :param tick: Tick to crawl, used together with the work queue.
+    :param queries: Queries to run, as 'spider:query' or 'query', or None to run all queries of selected spiders.
+    :return: Report of the run, including all errors of failed queries and notifications.
     """
-    logger.debug(f"Running crawlers with input parameters: {locals()}")
-    scrape_configuration = read_configuration(config_path)
-
-    if spiders_to_run is None:
-        spiders_to_run = list(scrape_configuration.spiders.keys())
+    logger.debug(
+        "Running crawlers %s (queries %s, tick %d) with cache in %s",
+        spiders_to_run or "all",
+        queries or "all",
+        tick,
+        cache_folder,
+    )
+    report = scrape.RunReport()
 
     try:
-        crawled_data = scrape.scrape(spiders_to_run, scrape_configuration.spiders, cache_folder)
+        scrape_configuration = read_configuration(config_path)
+        fetching.configure_rate_limits(scrape_configuration.rate_limits)
+
+        if spiders_to_run is None:
+            spiders_to_run = list(scrape_configuration.spiders.keys())
+
+        # drop cache of queries, which have been removed from configuration
+        scrape.prune_cache(cache_folder, spiders_to_run, scrape_configuration.spiders)
+
+        spiders_configuration = scrape_configuration.spiders
+        if queries is not None:
+            spiders_configuration = scrape.select_queries(spiders_configuration, queries)
+
+        # crawl and store new items to cache, query by query
+        with metrics.timer("news_crawlers_stage_seconds", stage="scrape"), fetching.deadline(
+            scrape_configuration.deadline_seconds
+        ):
+            if queue is None:
+                diff = scrape.scrape(spiders_to_run, spiders_configuration, cache_folder, report, profiler)
+            else:
+                diff = scrape.scrape_queue(queue, tick, spiders_to_run, spiders_configuration, cache_folder, report)
         logger.debug("Scraping done.")
 
-        # get difference with cached data
-        logger.debug("Checking for difference with items that were obtained previously...")
-        diff = scrape.check_diff(cache_folder, crawled_data)
-
-        if diff:
-            logger.debug(f"Found new items: {diff}")
-
-            # send notifications to users (only if difference with cached data is found)
-            logger.debug("Sending notifications")
-            scrape.notify(diff, scrape_configuration.spiders)
-            logger.debug("Notifications sent successfully.")
-        else:
-            logger.debug("No new items were found.")
+        if diff and fetching.replaying():
+            logger.info(
+                "Found new items in replayed responses, notifications are not sent: %s", logs.DiffSummary(diff)
+            )
+        elif not fetching.replaying():
+            if diff:
+                with metrics.timer("news_crawlers_stage_seconds", stage="sink"):
+                    scrape.write_sinks(diff, scrape_configuration.spiders, report)
+            send_notifications(diff, scrape_configuration, cache_folder, report)
 
     except Exception as exc:  # pylint: disable=broad-except
         logger.exception("Exception occurred when running crawlers.", exc_info=exc)
+
+    report.finish()
+    for error in report.errors:
+        source = error.query or error.notificator or error.sink or "-"
+        logger.error(
+            "%s error in spider %s (%s): %s",
+            error.stage,
+            error.spider,
+            source,
+            error.error,
+            extra={"stage": error.stage, "spider": error.spider, "source": source},
+        )
+        logger.debug(error.traceback)
+
+    unfinished_queries = [f"{query.spider}:{query.query}" for query in report.queries if query.unfinished]
+    if unfinished_queries:
+        logger.warning("Deadline exceeded, unfinished queries: %s", ", ".join(unfinished_queries))
+
+    if report.errors:
+        logger.warning("Crawlers were run with %d error(s).", len(report.errors))
     else:
         logger.debug("Crawlers were run successfully.")
 
+    return report
 
-def setup_logger(log_path: pathlib.Path, log_rotation_days: int) -> None:
-    log_handler = logging.handlers.TimedRotatingFileHandler(log_path, when="d", interval=log_rotation_days)
-    log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-8s %(message)s"))
-    logger.addHandler(log_handler)
 
+def send_notifications(
+    diff: scrape.CrawlData,
+    scrape_configuration: configuration.NewsCrawlersConfig,
+    cache_folder: pathlib.Path,
+    report: scrape.RunReport,
+) -> None:
+    """
+    Sends notifications about new items, and coalesced notifications which are due.
 
-def main(argv: Sequence[str] | None = None) -> int:
+    :param diff: Map of spider name to list of new items.
+    :param scrape_configuration: Configuration.
+    :param cache_folder: Directory where cache files (and buffers of coalesced notifications) are stored.
+    :param report: Report, to which notification errors are added.
+    """
+    # coalesced notifications may be due even if no new items were found
+    coalesced = any(spider_configuration.coalesce for spider_configuration in scrape_configuration.spiders.values())
+    if not diff and not coalesced:
+        logger.debug("No new items were found.")
+        return
+
+    logger.debug("Found new items: %s", logs.DiffSummary(diff))
+
+    # send notifications to users (only if difference with cached data is found)
+    logger.debug("Sending notifications")
+    buffer = coalescing.NotificationBuffer(cache_folder / coalescing.BUFFER_FOLDER_NAME)
+    with metrics.timer("news_crawlers_stage_seconds", stage="notify"):
+        scrape.notify(diff, scrape_configuration.spiders, report, scrape_configuration.digest, buffer)
+    logger.debug("Notifications sent.")
+
+
+def run_workers(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    config_path: pathlib.Path | None,
+    spiders_to_run: list[str] | None,
+    cache_folder: pathlib.Path,
+    queue: workqueue.WorkQueue,
+    tick: int,
+    workers: int,
+    queries: list[str] | None = None,
+) -> scrape.RunReport:
+    """
+    Crawl a tick with several worker processes, sharing the work queue. Each worker sends notifications for the new
+    items it has found.
+
+    :param config_path: Optional path to the config file.
+    :param spiders_to_run: List of spider names to run, or None to run all configured spiders.
+    :param cache_folder: Directory where cache files are stored.
+    :param queue: Work queue, shared by all workers.
+    :param tick: Tick to crawl.
+    :param workers: Number of worker processes.
+    :param queries: Queries to run, as 'spider:query' or 'query', or None to run all queries of selected spiders.
+    :return: Merged report of all workers.
+    """
+    logger.debug("Crawling tick %d with %d worker processes.", tick, workers)
+    report = scrape.RunReport()
+    worker_args = [(config_path, spiders_to_run, cache_folder, None, queue, tick, queries)] * workers
+    with multiprocessing.Pool(workers) as pool:
+        for worker_report in pool.starmap(run_crawlers, worker_args):
+            report.merge(worker_report)
+    report.finish()
+    return report
+
+
+def write_report(report: scrape.RunReport, report_path: pathlib.Path) -> None:
+    """
+    Write run report as JSON.
+
+    :param report: Report of the run.
+    :param report_path: Output file path.
+    """
+    with open(report_path, "w+", encoding="utf8") as file:
+        file.write(report.model_dump_json(indent=2))
+
+
+def show_stats(cache_folder: pathlib.Path, last_runs: int, recent: int, threshold: float) -> None:
+    """
+    Prints statistics of queries in the run history and runs or queries, whose latency or page count differs sharply
+    from their baseline.
+
+    :param cache_folder: Directory where cache files (and the run history) are stored.
+    :param last_runs: Number of most recent runs, which are included.
+    :param recent: Number of most recent runs, which are compared with the baseline of the previous ones.
+    :param threshold: Ratio between a value and its baseline (either way), from which the value differs sharply.
+    """
+    run_history = history.RunHistory(cache_folder / history.HISTORY_FILE_NAME)
+    runs = run_history.runs(last_runs)
+    if not runs:
+        print("No runs have been recorded yet.")
+        return
+
+    queries = run_history.queries(last_runs)
+    p50, p90, p99 = (history.percentile([run.duration for run in runs], fraction) for fraction in (0.5, 0.9, 0.99))
+    print(
+        f"{len(runs)} runs since {_format_time(runs[0].started)}, duration p50 {p50:.1f}s p90 {p90:.1f}s "
+        f"p99 {p99:.1f}s, {sum(run.errors for run in runs)} errors"
+    )
+    print()
+    print(
+        f"{'query':<40}{'runs':>6}{'failed':>8}{'p50 [s]':>9}{'p90 [s]':>9}{'p99 [s]':>9}{'pages':>7}{'items':>7}"
+        f"{'new':>6}{'dup':>6}"
+    )
+    for stats in history.get_query_stats(queries):
+        print(
+            f"{stats.spider + ':' + stats.query:<40}{stats.runs:>6}{stats.failures:>8}{stats.duration_p50:>9.2f}"
+            f"{stats.duration_p90:>9.2f}{stats.duration_p99:>9.2f}{stats.pages_p50:>7.0f}{stats.items_p50:>7.0f}"
+            f"{stats.new_items_total:>6}{stats.duplicates_total:>6}"
+        )
+
+    regressions = history.find_regressions(runs, queries, recent, threshold)
+    print()
+    print(f"Differences from baseline in the last {recent} run(s): {len(regressions) or 'none'}")
+    for regression in regressions:
+        print(
+            f"  {_format_time(regression.started)} {regression.subject} {regression.metric}: {regression.value:.1f}"
+            f" (baseline {regression.baseline:.1f})"
+        )
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
+
+
+def write_run_outputs(report: scrape.RunReport, args: argparse.Namespace) -> None:
+    """
+    Appends a finished run to the run history (unless responses were replayed) and writes the requested report and
+    metrics outputs.
+
+    :param report: Report of the run.
+    :param args: Parsed command line arguments.
+    """
+    if args.replay is None:
+        history.RunHistory(args.cache / history.HISTORY_FILE_NAME).record(report)
+    if args.report is not None:
+        write_report(report, args.report)
+    export_metrics(args.metrics_file, args.metrics_json)
+
+
+def export_metrics(metrics_file: pathlib.Path | None, metrics_json: pathlib.Path | None) -> None:
+    """
+    Write metrics of the last run to the requested outputs.
+
+    :param metrics_file: Path of the Prometheus textfile to write, or None.
+    :param metrics_json: Path of the JSON run summary to write, or None.
+    """
+    if metrics_file is not None:
+        metrics.write_prometheus_textfile(metrics_file)
+    if metrics_json is not None:
+        metrics.write_run_summary(metrics_json)
+
+
+def setup_logger(log_path: pathlib.Path, log_rotation_days: int, log_format: str = "text") -> None:
+    """
+    Writes records of the application's loggers to a rotating log file, on a background thread.
 
+    :param log_path: Path of the log file.
+    :param log_rotation_days: Log file is rotated after this many days.
+    :param log_format: 'text' for plain text lines or 'json' for JSON events.
+    """
+    log_handler = logs.create_file_handler(log_path, log_rotation_days, log_format)
+    logs.start_queue_logging([log_handler], [logger, logging.getLogger("news_crawlers")])
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """
+    :return: Parser of the command line arguments.
+    """
     parser = argparse.ArgumentParser(
         prog="News Crawlers",
         description="Runs web crawlers which will check for updates and alert users if there are any news.",
@@ -95,40 +314,171 @@ def main(argv: Sequence[str] | None = None) -> int:
     parser.add_argument("-v", "--version", action="version", version=importlib_metadata.version("news_crawlers"))
     parser.add_argument("-l", "--log", required=False, type=pathlib.Path)
     parser.add_argument("--log_rotation_days", default=7, required=False, type=int)
+    parser.add_argument("--log_format", default="text", choices=("text", "json"), help="Log file format.")
     subparsers = parser.add_subparsers(dest="command", required=False)
     scrape_parser = subparsers.add_parser("scrape")
     scrape_parser.add_argument("-s", "--spider", required=False, action="append")
+    scrape_parser.add_argument("-q", "--query", required=False, action="append", help="Query as spider:query or query.")
     scrape_parser.add_argument("-c", "--config", type=pathlib.Path, required=False)
-    scrape_parser.add_argument("--cache", required=False, type=pathlib.Path, default=scrape.DEFAULT_CACHE_PATH)
+    scrape_parser.add_argument(
+        "--cache", required=False, type=pathlib.Path, help="Cache folder (a temporary one when replaying)."
+    )
+    scrape_parser.add_argument("--report", required=False, type=pathlib.Path, help="JSON run report output.")
+    scrape_parser.add_argument("--metrics_file", required=False, type=pathlib.Path, help="Prometheus textfile output.")
+    scrape_parser.add_argument("--metrics_json", required=False, type=pathlib.Path, help="JSON run summary output.")
+    scrape_parser.add_argument("--metrics_port", required=False, type=int, help="Serve /metrics and /summary on port.")
+    scrape_parser.add_argument("--profile", required=False, type=pathlib.Path, help="Write profiling reports to dir.")
+    scrape_parser.add_argument("--profile_every", required=False, type=int, default=1, help="Profile every n-th run.")
+    scrape_parser.add_argument("--profile_memory", action="store_true", help="Also trace allocations (tracemalloc).")
+    scrape_parser.add_argument("--queue", required=False, type=pathlib.Path, help="Shared work queue database.")
+    scrape_parser.add_argument("--workers", required=False, type=int, default=1, help="Worker processes (with queue).")
+    scrape_parser.add_argument("--tick_seconds", required=False, type=float, help="Tick length (with queue).")
+    scrape_parser.add_argument("--lease_seconds", required=False, type=float, default=600.0, help="Unit lease time.")
+    archive_group = scrape_parser.add_mutually_exclusive_group()
+    archive_group.add_argument("--record", required=False, type=pathlib.Path, help="Record responses to archive dir.")
+    archive_group.add_argument("--replay", required=False, type=pathlib.Path, help="Replay archives from dir.")
+
+    stats_parser = subparsers.add_parser("stats", help="Show statistics and regressions from the run history.")
+    stats_parser.add_argument("--cache", required=False, type=pathlib.Path, default=scrape.DEFAULT_CACHE_PATH)
+    stats_parser.add_argument("--runs", required=False, type=int, default=200, help="Number of runs to include.")
+    stats_parser.add_argument("--recent", required=False, type=int, default=3, help="Runs to compare with baseline.")
+    stats_parser.add_argument("--threshold", required=False, type=float, default=2.0, help="Ratio to baseline.")
 
     scrape_subparsers = scrape_parser.add_subparsers(dest="scrape_command")
     schedule_parser = scrape_subparsers.add_parser("schedule")
     schedule_parser.add_argument("--every", required=False, default=1, type=int)
     schedule_parser.add_argument("--units", required=False, default="minutes")
 
+    return parser
+
+
+def get_schedule_config(
+    args: argparse.Namespace, scrape_configuration: configuration.NewsCrawlersConfig
+) -> configuration.ScheduleConfig | None:
+    """
+    Returns schedule, set either in the command line or in the configuration file.
+
+    :param args: Parsed command line arguments.
+    :param scrape_configuration: Application configuration.
+    :return: Schedule, or None if crawlers should be run only once.
+    """
+    if args.scrape_command == "schedule":
+        logger.debug("Scheduled crawling on every %d %s", args.every, args.units)
+        return configuration.ScheduleConfig(every=args.every, units=args.units)
+
+    if scrape_configuration.schedule is not None:
+        sch_config = scrape_configuration.schedule
+        logger.debug("Scheduled crawling on every %d %s", sch_config.every, sch_config.units)
+        return sch_config
+
+    logger.debug("Running crawlers without schedule.")
+    return None
+
+
+def replay_archives(archive_dir: pathlib.Path, run: Callable[[], None]) -> None:
+    """
+    Runs crawlers once for each recorded archive, one after another, serving responses from the archive.
+
+    :param archive_dir: Directory with recorded archives.
+    :param run: Runs crawlers once.
+    """
+    try:
+        for archive_path in archive.list_archives(archive_dir):
+            logger.info("Replaying %s", archive_path)
+            fetching.configure_archive(replay=archive.ArchiveReplay(archive_path))
+            run()
+    finally:
+        fetching.configure_archive()
+
+
+def replay_with_cache(args: argparse.Namespace, run: Callable[[], None]) -> None:
+    """
+    Replays archives of the 'replay' argument. Unless a cache folder is given, a temporary one is used, so that
+    replayed runs do not change caches and polling state of the real runs.
+
+    :param args: Parsed command line arguments, whose 'cache' is set to the used cache folder.
+    :param run: Runs crawlers once.
+    """
+    if args.cache is not None:
+        replay_archives(args.replay, run)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="news_crawlers_replay_") as replay_cache:
+        logger.info("Replaying with cache in temporary folder %s", replay_cache)
+        args.cache = pathlib.Path(replay_cache)
+        replay_archives(args.replay, run)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+
+    parser = create_parser()
     args = parser.parse_args(argv)
+    if args.command == "stats":
+        show_stats(args.cache, args.runs, args.recent, args.threshold)
+        return 0
+
+    if args.record is not None and args.workers > 1:
+        parser.error("responses can not be recorded with more than one worker process")
 
     if args.log:
-        setup_logger(args.log, args.log_rotation_days)
+        setup_logger(args.log, args.log_rotation_days, args.log_format)
 
     logger.info("Application started.")
 
-    logger.info(f"Running application with args: {vars(args)}")
+    logger.info("Running application with args: %s", vars(args))
 
     scrape_configuration = read_configuration(args.config)
 
-    if args.scrape_command == "schedule":
-        sch_config = configuration.ScheduleConfig(every=args.every, units=args.units)
-        logger.debug(f"Scheduled crawling on every {args.every} {args.units}")
-    elif scrape_configuration.schedule is not None:
-        sch_config = scrape_configuration.schedule
-        logger.debug(f"Scheduled crawling on every {sch_config.every} {sch_config.units}")
-    else:
-        logger.debug("Running crawlers without schedule.")
-        run_crawlers(args.config, args.spider, args.cache)
+    if args.metrics_port is not None:
+        metrics.start_http_server(args.metrics_port)
+
+    profiler = None
+    if args.profile is not None:
+        profiler = profiling.Profiler(args.profile, every=args.profile_every, trace_memory=args.profile_memory)
+
+    sch_config = get_schedule_config(args, scrape_configuration)
+
+    queue = None
+    tick_seconds = args.tick_seconds
+    if args.queue is not None:
+        queue = workqueue.WorkQueue(args.queue, lease_seconds=args.lease_seconds)
+        if tick_seconds is None:
+            tick_seconds = sch_config.interval_seconds if sch_config is not None else 60
+
+    recorder = None
+    if args.record is not None:
+        recorder = archive.ArchiveRecorder(args.record)
+        fetching.configure_archive(recorder=recorder)
+
+    def run() -> None:
+        metrics.REGISTRY.begin_run()
+        if profiler is not None:
+            profiler.start_run()
+        if recorder is not None:
+            recorder.start_run()
+        if queue is None:
+            report = run_crawlers(args.config, args.spider, args.cache, profiler, queries=args.query)
+        else:
+            tick = workqueue.current_tick(tick_seconds)
+            if args.workers > 1:
+                report = run_workers(args.config, args.spider, args.cache, queue, tick, args.workers, args.query)
+            else:
+                report = run_crawlers(args.config, args.spider, args.cache, profiler, queue, tick, args.query)
+        if recorder is not None:
+            recorder.finish_run()
+        write_run_outputs(report, args)
+
+    if args.replay is not None:
+        replay_with_cache(args, run)
+        return 0
+
+    args.cache = args.cache or scrape.DEFAULT_CACHE_PATH
+
+    if sch_config is None:
+        run()
         return 0
 
-    scheduler.schedule_func(lambda: run_crawlers(args.config, args.spider, args.cache), sch_config)
+    scheduler.schedule_func(run, sch_config)
 
     return 0
 
@@ -0,0 +1,144 @@
+"""
+HTTP archive of fetched responses. Responses fetched in a run can be recorded to an archive and replayed later
+without network access, e.g. to reproduce what a production run saw or to measure parsing throughput.
+
+Each recorded run is a separate zip file. For each response, the archive contains a JSON entry with its URL, status,
+headers and encoding, and a deflate-compressed entry with its body.
+"""
+from __future__ import annotations
+
+import collections
+import datetime
+import json
+import os
+import pathlib
+import threading
+import zipfile
+
+import requests
+import requests.structures
+
+# response headers, which are never stored in an archive
+EXCLUDED_HEADERS = ("Set-Cookie",)
+
+
+class ArchiveMissError(requests.ConnectionError):
+    """
+    Raised when a replayed URL was not recorded in the archive.
+    """
+
+
+class ArchiveRecorder:
+    """
+    Records responses to a zip archive in the output directory, a new archive is created for each run.
+    """
+
+    def __init__(self, output_dir: pathlib.Path) -> None:
+        """
+        :param output_dir: Directory, where archives will be written.
+        """
+        self.output_dir = pathlib.Path(output_dir)
+        self._lock = threading.Lock()
+        self._zip_file: zipfile.ZipFile | None = None
+        self._count = 0
+
+    def start_run(self) -> pathlib.Path:
+        """
+        Starts a new archive, to which all following responses are recorded. Previous archive is closed.
+
+        :return: Path to the new archive.
+        """
+        self.finish_run()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        path = self.output_dir / f"{timestamp}_{os.getpid()}.zip"
+        with self._lock:
+            # closed in finish_run
+            self._zip_file = zipfile.ZipFile(  # pylint: disable=consider-using-with
+                path, "w", compression=zipfile.ZIP_DEFLATED
+            )
+            self._count = 0
+        return path
+
+    def finish_run(self) -> None:
+        """
+        Closes the current archive, if any.
+        """
+        with self._lock:
+            if self._zip_file is not None:
+                self._zip_file.close()
+                self._zip_file = None
+
+    def record(self, url: str, response: requests.Response) -> None:
+        """
+        Adds response to the current archive. Nothing is recorded if no run has been started.
+
+        :param url: Requested URL.
+        :param response: Received response.
+        """
+        entry = {
+            "url": url,
+            "status_code": response.status_code,
+            "headers": {name: value for name, value in response.headers.items() if name not in EXCLUDED_HEADERS},
+            "encoding": response.encoding,
+        }
+        with self._lock:
+            if self._zip_file is None:
+                return
+            name = f"{self._count:06d}"
+            self._zip_file.writestr(f"{name}.json", json.dumps(entry))
+            self._zip_file.writestr(f"{name}.body", response.content)
+            self._count += 1
+
+
+class ArchiveReplay:
+    """
+    Serves responses from a recorded archive. If a URL was fetched several times during recording, its responses are
+    replayed in the same order and the last one is repeated afterwards.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        """
+        :param path: Path to a zip archive, written by ArchiveRecorder.
+        """
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self._responses: dict[str, collections.deque[requests.Response]] = collections.defaultdict(collections.deque)
+
+        with zipfile.ZipFile(self.path) as zip_file:
+            for entry_name in sorted(name for name in zip_file.namelist() if name.endswith(".json")):
+                entry = json.loads(zip_file.read(entry_name))
+                body = zip_file.read(entry_name.removesuffix(".json") + ".body")
+                self._responses[entry["url"]].append(_build_response(entry, body))
+
+    def get(self, url: str) -> requests.Response:
+        """
+        :param url: Requested URL.
+
+        :return: Next recorded response of the URL.
+        :raises ArchiveMissError: If URL was not recorded.
+        """
+        with self._lock:
+            responses = self._responses.get(url)
+            if not responses:
+                raise ArchiveMissError(f"{url} is not recorded in archive {self.path}.")
+            return responses.popleft() if len(responses) > 1 else responses[0]
+
+
+def _build_response(entry: dict, body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.url = entry["url"]
+    response.status_code = entry["status_code"]
+    response.headers = requests.structures.CaseInsensitiveDict(entry["headers"])
+    response.encoding = entry["encoding"]
+    response._content = body  # pylint: disable=protected-access
+    return response
+
+
+def list_archives(archive_dir: pathlib.Path) -> list[pathlib.Path]:
+    """
+    :param archive_dir: Directory with recorded archives.
+
+    :return: Archives in the order in which they were recorded.
+    """
+    return sorted(pathlib.Path(archive_dir).glob("*.zip"))
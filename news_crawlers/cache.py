@@ -0,0 +1,217 @@
+"""
+Storage of previously crawled items. Cache is partitioned by query, items of each query are stored in
+'<cache folder>/<spider>/<query>.json', so a run only reads and writes data of the queries it crawls.
+
+Cache files are replaced atomically, so a crash while writing never leaves a partially written file behind, and
+read-diff-write cycles are protected by inter-process file locks, so that overlapping runs do not lose each other's
+updates.
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import urllib.parse
+from collections.abc import Collection, Iterator
+from typing import IO, Any, cast
+
+if sys.platform == "win32":
+    import msvcrt  # pylint: disable=import-error
+
+    def _lock_file(file: IO[Any]) -> None:
+        while True:
+            try:
+                # blocks for up to 10 seconds, then raises
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(file: IO[Any]) -> None:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock_file(file: IO[Any]) -> None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(file: IO[Any]) -> None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def lock(path: pathlib.Path) -> Iterator[None]:
+    """
+    Holds an exclusive lock of the file for the duration of the context. Locks are held by processes and threads
+    alike, since each call opens its own lock file handle.
+
+    :param path: Path of the locked file. The lock itself is held on a separate '.lock' file next to it, which is
+                 never removed.
+    """
+    lock_path = path.with_name(path.name + ".lock")
+    with open(lock_path, "a+", encoding="utf8") as lock_file:
+        _lock_file(lock_file)
+        try:
+            yield
+        finally:
+            _unlock_file(lock_file)
+
+
+def read_items(path: pathlib.Path) -> list[dict[str, str]]:
+    """
+    Reads cached items from file.
+
+    :param path: Path to cache file.
+
+    :return: List of cached items. If specified file does not exist, an empty list will be returned.
+    """
+    if not path.exists():
+        return []
+
+    with open(path, "r", encoding="utf8") as cache_file:
+        return cast(list[dict[str, str]], json.load(cache_file))
+
+
+def write_items(path: pathlib.Path, items: list[dict[str, str]]) -> None:
+    """
+    Writes items to cache file atomically.
+
+    :param path: Path to cache file.
+    :param items: Items to write.
+    """
+    write_atomic(path, json.dumps(items).encode("utf8"))
+
+
+def write_atomic(path: pathlib.Path, data: bytes) -> None:
+    """
+    Writes data to file. Data is first written to a temporary file, which then atomically replaces the file, so
+    readers see either old or new content, even if the process crashes while writing.
+
+    :param path: Path to file.
+    :param data: File content.
+    """
+    file_descriptor, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_name, path)
+    finally:
+        # temporary file only remains if writing has failed
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_name)
+
+
+def spider_folder(cache_folder: pathlib.Path, spider_name: str) -> pathlib.Path:
+    """
+    :param cache_folder: Cache folder.
+    :param spider_name: Name of the spider.
+
+    :return: Folder with cache files of spider's queries. Lock this path while modifying the spider's cache.
+    """
+    return pathlib.Path(cache_folder) / spider_name
+
+
+def query_path(cache_folder: pathlib.Path, spider_name: str, query: str) -> pathlib.Path:
+    """
+    :param cache_folder: Cache folder.
+    :param spider_name: Name of the spider.
+    :param query: Name of the query.
+
+    :return: Path of the cache file for the query. Query name is percent-encoded, so it is always a valid file name.
+    """
+    return spider_folder(cache_folder, spider_name) / (urllib.parse.quote(query, safe="") + ".json")
+
+
+def query_state_path(cache_folder: pathlib.Path, spider_name: str, query: str) -> pathlib.Path:
+    """
+    :param cache_folder: Cache folder.
+    :param spider_name: Name of the spider.
+    :param query: Name of the query.
+
+    :return: Path of the file with query's state (e.g. when it was polled), next to the query's cache file.
+    """
+    return query_path(cache_folder, spider_name, query).with_suffix(".state")
+
+
+def legacy_path(cache_folder: pathlib.Path, spider_name: str) -> pathlib.Path:
+    """
+    :param cache_folder: Cache folder.
+    :param spider_name: Name of the spider.
+
+    :return: Path of the spider's cache file from before the cache was partitioned by query.
+    """
+    return pathlib.Path(cache_folder) / f"{spider_name}_cached.json"
+
+
+def read_query_items(cache_folder: pathlib.Path, spider_name: str, query: str) -> list[dict[str, str]]:
+    """
+    Reads cached items of a query. If the query has not been cached yet, but a legacy (per spider) cache file exists,
+    query's items are taken from it, so that migrated queries do not report all of their items as new. Items, which do
+    not store their query name, are assumed to belong to each of the spider's queries.
+
+    :param cache_folder: Cache folder.
+    :param spider_name: Name of the spider.
+    :param query: Name of the query.
+
+    :return: Cached items of the query.
+    """
+    path = query_path(cache_folder, spider_name, query)
+    if path.exists():
+        return read_items(path)
+
+    return [item for item in read_items(legacy_path(cache_folder, spider_name)) if item.get("query", query) == query]
+
+
+def write_query_items(cache_folder: pathlib.Path, spider_name: str, query: str, items: list[dict[str, str]]) -> None:
+    """
+    Writes cached items of a query.
+
+    :param cache_folder: Cache folder.
+    :param spider_name: Name of the spider.
+    :param query: Name of the query.
+    :param items: All items of the query.
+    """
+    path = query_path(cache_folder, spider_name, query)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_items(path, items)
+
+
+def prune(cache_folder: pathlib.Path, spider_name: str, queries: Collection[str]) -> list[str]:
+    """
+    Removes cache (and state) files of queries, which are no longer configured. Legacy (per spider) cache file is
+    removed once all configured queries have their own cache files.
+
+    :param cache_folder: Cache folder.
+    :param spider_name: Name of the spider.
+    :param queries: Names of currently configured queries.
+
+    :return: Names of removed queries.
+    """
+    folder = spider_folder(cache_folder, spider_name)
+    if not folder.exists():
+        return []
+
+    removed = []
+    with lock(folder):
+        for path in folder.glob("*.json"):
+            query = urllib.parse.unquote(path.stem)
+            if query not in queries:
+                path.unlink()
+                removed.append(query)
+
+        for path in folder.glob("*.state"):
+            if urllib.parse.unquote(path.stem) not in queries:
+                path.unlink()
+
+        legacy = legacy_path(cache_folder, spider_name)
+        if legacy.exists() and all(query_path(cache_folder, spider_name, query).exists() for query in queries):
+            legacy.unlink()
+
+    return removed
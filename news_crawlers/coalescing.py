@@ -0,0 +1,129 @@
+"""
+Coalescing of notifications. New items of a spider's notificator are buffered in a file and sent together once the
+coalescing window has passed or enough items have been buffered, so that frequent (e.g. scheduled) runs do not send
+a separate notification for each run. Buffers are kept on disk, so buffered items survive restarts. Items, which
+are due, are kept on disk as well, until their send is acknowledged, so they are sent again if the send fails.
+"""
+from __future__ import annotations
+
+import pathlib
+import re
+import time
+from collections.abc import Callable
+
+import pydantic
+
+from news_crawlers import cache
+from news_crawlers import configuration
+
+Item = dict[str, str]
+
+# name of the folder within cache folder, in which buffers are stored
+BUFFER_FOLDER_NAME = "notification_buffers"
+
+
+def is_urgent(item: Item, coalesce_config: configuration.CoalesceConfig) -> bool:
+    """
+    :param item: New item.
+    :param coalesce_config: Coalescing configuration.
+
+    :return: True if any of the item's fields matches its urgent rule.
+    """
+    return any(
+        re.search(pattern, item[field]) is not None
+        for field, pattern in coalesce_config.urgent.items()
+        if field in item
+    )
+
+
+class BufferedItems(pydantic.BaseModel):
+    # time, at which the first of the items was buffered
+    since: float
+    items: list[Item] = []
+
+
+class NotificationBuffer:
+    """
+    Durable buffers of items, which are waiting to be sent, one for each spider and notificator.
+    """
+
+    def __init__(self, folder: pathlib.Path, clock: Callable[[], float] = time.time) -> None:
+        """
+        :param folder: Folder, in which buffer files are stored.
+        :param clock: Returns current time, in seconds.
+        """
+        self.folder = pathlib.Path(folder)
+        self._clock = clock
+
+    def _get_path(self, spider_name: str, notificator_name: str) -> pathlib.Path:
+        return self.folder / f"{spider_name}_{notificator_name}.json"
+
+    def _get_pending_path(self, spider_name: str, notificator_name: str) -> pathlib.Path:
+        return self.folder / f"{spider_name}_{notificator_name}.pending.json"
+
+    def coalesce(
+        self,
+        spider_name: str,
+        notificator_name: str,
+        items: list[Item],
+        coalesce_config: configuration.CoalesceConfig,
+    ) -> list[Item]:
+        """
+        Adds new items to the buffer and returns items, which should be sent now. These are items of a previous send,
+        which has not been acknowledged, urgent new items and, if the buffer is due, all buffered items, which are then
+        moved from the buffer to the pending items. Pending items are kept until the send is acknowledged (see
+        'acknowledge'), so items of a failed send are sent again by the next call.
+
+        :param spider_name: Name of the spider.
+        :param notificator_name: Name of the notificator.
+        :param items: New items, can be empty to only check whether the buffer is due.
+        :param coalesce_config: Coalescing configuration.
+
+        :return: Items to send.
+        """
+        urgent_items = [item for item in items if is_urgent(item, coalesce_config)]
+        path = self._get_path(spider_name, notificator_name)
+        pending_path = self._get_pending_path(spider_name, notificator_name)
+        if not items and not path.exists() and not pending_path.exists():
+            return []
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with cache.lock(path):
+            now = self._clock()
+            buffer = BufferedItems.model_validate_json(path.read_bytes()) if path.exists() else BufferedItems(since=now)
+            buffer.items.extend(item for item in items if item not in urgent_items)
+            pending = (
+                BufferedItems.model_validate_json(pending_path.read_bytes())
+                if pending_path.exists()
+                else BufferedItems(since=now)
+            )
+            pending.items.extend(urgent_items)
+
+            due = (
+                now - buffer.since >= coalesce_config.window_minutes * 60
+                or len(buffer.items) >= coalesce_config.max_items
+            )
+            if due:
+                pending.items.extend(buffer.items)
+                buffer.items.clear()
+
+            if pending.items:
+                cache.write_atomic(pending_path, pending.model_dump_json().encode("utf8"))
+            if buffer.items:
+                cache.write_atomic(path, buffer.model_dump_json().encode("utf8"))
+            else:
+                path.unlink(missing_ok=True)
+            return pending.items
+
+    def acknowledge(self, spider_name: str, notificator_name: str) -> None:
+        """
+        Removes pending items, returned by 'coalesce', after they have been sent successfully.
+
+        :param spider_name: Name of the spider.
+        :param notificator_name: Name of the notificator.
+        """
+        pending_path = self._get_pending_path(spider_name, notificator_name)
+        if not pending_path.exists():
+            return
+        with cache.lock(self._get_path(spider_name, notificator_name)):
+            pending_path.unlink(missing_ok=True)
@@ -2,11 +2,14 @@ from __future__ import annotations
 
 import os
 import pathlib
+import re
 
 from typing import Literal
 
 import pydantic
 
+from news_crawlers import extraction
+
 DEFAULT_CONFIG_PATH = pathlib.Path("config") / "news_crawlers.yaml"
 
 
@@ -28,16 +31,140 @@ def find_config(config_path: pathlib.Path | None = None) -> pathlib.Path:
     )
 
 
+SCHEDULE_UNIT_SECONDS = {"seconds": 1, "minutes": 60, "hours": 3600, "days": 86400, "weeks": 604800}
+
+
 class ScheduleConfig(pydantic.BaseModel):
     every: int = 1
     units: Literal["seconds", "minutes", "hours", "days", "weeks"] = "minutes"
 
+    @property
+    def interval_seconds(self) -> int:
+        """Interval between two scheduled runs in seconds."""
+        return self.every * SCHEDULE_UNIT_SECONDS[self.units]
+
+
+class RateLimitConfig(pydantic.BaseModel):
+    requests_per_second: pydantic.PositiveFloat = 2.0
+    burst: pydantic.PositiveInt = 2
+    max_in_flight: pydantic.PositiveInt = 4
+    max_backoff_seconds: pydantic.PositiveFloat = 300.0
+
+
+class FetchConfig(pydantic.BaseModel):
+    timeout: pydantic.PositiveFloat = 10.0
+    retries: pydantic.NonNegativeInt = 2
+    backoff_seconds: pydantic.PositiveFloat = 0.5
+    max_backoff_seconds: pydantic.PositiveFloat = 30.0
+    breaker_failures: pydantic.PositiveInt = 5
+    breaker_reset_seconds: pydantic.PositiveFloat = 60.0
+
+
+class PaginationConfig(pydantic.BaseModel):
+    # query parameter, which selects the result page
+    page_param: str
+    # CSS selector of pagination links, from whose page parameter the number of pages is read (remaining pages are
+    # then fetched concurrently); if not set, pages are crawled one by one until a page without items
+    links: str | None = None
+    max_pages: pydantic.PositiveInt = 50
+
+
+class ExtractionConfig(pydantic.BaseModel):
+    # CSS selector of rows, each row is extracted to a separate item
+    rows: str
+    fields: dict[str, extraction.Field]
+    # fields, whose relative URLs are resolved against the page URL
+    url_fields: list[str] = ["url"]
+    pagination: PaginationConfig | None = None
+
+
+class CoalesceConfig(pydantic.BaseModel):
+    # buffered items are sent once this much time has passed since the first of them was buffered
+    window_minutes: pydantic.PositiveFloat = 10.0
+    # ... or as soon as this many items are buffered
+    max_items: pydantic.PositiveInt = 50
+    # items, in which any of the fields matches its regular expression, are sent immediately
+    urgent: dict[str, str] = {}
+
+    @pydantic.field_validator("urgent")
+    @classmethod
+    def _check_urgent_patterns(cls, urgent: dict[str, str]) -> dict[str, str]:
+        for field, pattern in urgent.items():
+            try:
+                re.compile(pattern)
+            except re.error as exc:
+                raise ValueError(f"invalid urgent pattern of field '{field}': {exc}") from exc
+        return urgent
+
+
+class PollingConfig(pydantic.BaseModel):
+    # queries, which find new items on each poll, are polled this often
+    min_interval_minutes: pydantic.PositiveFloat = 10.0
+    # queries without new items are polled less and less often, down to this interval
+    max_interval_minutes: pydantic.PositiveFloat = 1440.0
+    # weight of the latest poll in the moving average of query's change rate
+    smoothing: float = pydantic.Field(default=0.3, gt=0.0, le=1.0)
+
+    @pydantic.model_validator(mode="after")
+    def _check_intervals(self) -> PollingConfig:
+        if self.min_interval_minutes > self.max_interval_minutes:
+            raise ValueError("min_interval_minutes must not be greater than max_interval_minutes")
+        return self
+
+
+class SeenIndexConfig(pydantic.BaseModel):
+    # expected number of seen items of all spider's queries, false positive rate grows once more are seen
+    capacity: pydantic.PositiveInt = 1000000
+    # share of new items, which are looked up in the exact index, because the filter reports them as possibly seen
+    false_positive_rate: float = pydantic.Field(default=0.01, gt=0.0, lt=1.0)
+
 
 class SpiderConfig(pydantic.BaseModel):
+    # spider, which crawls the URLs (e.g. 'generic'), defaults to the spider's key
+    type: str | None = None
     notifications: dict[str, dict[str, str | bool]]
     urls: dict[str, str]
+    # output sinks (e.g. 'jsonl', 'sqlite', 'webhook'), to which all new items are written, by sink name
+    sinks: dict[str, dict[str, str | bool]] = {}
+    fetch: FetchConfig = FetchConfig()
+    # stop paginating a query at the first page, on which all items have already been seen in previous runs
+    stop_at_seen_page: bool = False
+    # extraction rules of the 'generic' spider
+    extraction: ExtractionConfig | None = None
+    # coalescing of notifications, by notificator name
+    coalesce: dict[str, CoalesceConfig] = {}
+    # time budget of the spider's crawl in a run, queries which are not finished by then are reported as unfinished
+    deadline_seconds: pydantic.PositiveFloat | None = None
+    # adapt the interval between polls of each query to its change rate, all queries are polled on each run if None
+    polling: PollingConfig | None = None
+    # keep seen items in an indexed store with a Bloom filter instead of query cache files, for very large queries
+    seen_index: SeenIndexConfig | None = None
+    # field, which identifies an item (e.g. 'url'), items with a known key and changed other fields are updated in
+    # place and reported as changed instead of new
+    identity_key: str | None = None
+    # events, about which notifications are sent: 'new' items and/or changes of a field, e.g. 'changed:price'
+    notify_on: list[str] = ["new"]
+    # field, which identifies a listing across spider's queries (e.g. 'url'), listings found by multiple queries in a
+    # run are notified once, with names of all those queries
+    dedup_key: str | None = None
+
+    @pydantic.model_validator(mode="after")
+    def _check_change_tracking(self) -> SpiderConfig:
+        for entry in self.notify_on:
+            if entry != "new" and not (entry.startswith("changed:") and len(entry) > len("changed:")):
+                raise ValueError(f"notify_on entry '{entry}' must be 'new' or 'changed:<field>'")
+        if self.identity_key is not None and self.seen_index is not None:
+            raise ValueError("identity_key can not be used together with seen_index")
+        if self.identity_key is None and any(entry != "new" for entry in self.notify_on):
+            raise ValueError("changes can only be tracked for items, identified with identity_key")
+        return self
 
 
 class NewsCrawlersConfig(pydantic.BaseModel):
     schedule: ScheduleConfig | None = None
+    # send new items of all spiders in a single message per notification target (e.g. email account)
+    digest: bool = False
+    # time budget of crawling in a run (notifications are sent after it), should be shorter than schedule's interval
+    deadline_seconds: pydantic.PositiveFloat | None = None
+    rate_limits: dict[str, RateLimitConfig] = {}
     spiders: dict[str, SpiderConfig]
@@ -0,0 +1,78 @@
+"""
+Deduplication of items across a spider's queries within a run. Queries of a spider can match the same listing (e.g.
+two bolha searches finding the same book), which would then be notified once for each query, since items of
+different queries differ in their 'query' field. Items are identified across queries by the spider's dedup key (e.g.
+'url'). The first query of the run, which finds a listing, claims it, later queries' items with the same key are
+dropped as duplicates and their query names are merged into the claiming query's item.
+
+Each query's cache is still updated with all of its items, so the listing is not reported as new by the other query
+in a later run.
+"""
+from __future__ import annotations
+
+import threading
+
+Item = dict[str, str]
+
+# field, to which names of all queries, which have found a merged item, are written (comma separated)
+QUERY_FIELD = "query"
+
+
+class RunDedupIndex:
+    """
+    Listings found by a spider's queries in the current run. Can be used by concurrently crawled queries.
+    """
+
+    def __init__(self, dedup_key: str) -> None:
+        """
+        :param dedup_key: Field, which identifies a listing across queries. Items without it are never duplicates.
+        """
+        self.dedup_key = dedup_key
+        self._lock = threading.Lock()
+        # map of listing's key to names of queries, which have found it, the first one has claimed it
+        self._queries: dict[str, list[str]] = {}
+
+    def claim(self, query: str, items: list[Item]) -> set[str]:
+        """
+        Claims query's listings, which have not been claimed by another query in this run.
+
+        :param query: Name of the query.
+        :param items: All items, found by the query.
+
+        :return: Keys of query's listings, which have already been claimed by other queries (duplicates).
+        """
+        duplicates = set()
+        with self._lock:
+            for item in items:
+                key = item.get(self.dedup_key)
+                if key is None:
+                    continue
+                queries = self._queries.setdefault(key, [query])
+                if queries[0] != query:
+                    duplicates.add(key)
+                    if query not in queries:
+                        queries.append(query)
+        return duplicates
+
+    def drop_duplicates(self, items: list[Item], duplicates: set[str]) -> list[Item]:
+        """
+        :param items: Items of a query.
+        :param duplicates: Keys of duplicate listings, returned by 'claim'.
+
+        :return: Items, which are not duplicates.
+        """
+        return [item for item in items if item.get(self.dedup_key) not in duplicates]
+
+    def merge_queries(self, items: list[Item]) -> list[Item]:
+        """
+        :param items: Items, which are notified.
+
+        :return: Items, in which listings found by multiple queries have names of all those queries in their query
+                 field. Merged items are copies, so that cached items are not modified.
+        """
+        merged = []
+        for item in items:
+            key = item.get(self.dedup_key)
+            queries = self._queries.get(key, []) if key is not None else []
+            merged.append({**item, QUERY_FIELD: ",".join(queries)} if len(queries) > 1 else item)
+        return merged
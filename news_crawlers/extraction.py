@@ -0,0 +1,97 @@
+"""
+Extraction of items from parsed pages. CSS selectors are compiled once (when an extractor is created) instead of on
+each 'select' call. Each field's element is looked up with a compiled pattern, which stops at the first matching
+element, and fields with the same selector share a single lookup.
+"""
+from __future__ import annotations
+
+from typing import Literal
+
+import bs4
+import pydantic
+import soupsieve
+
+
+class Field(pydantic.BaseModel):
+    """
+    Field of an extracted item.
+    """
+
+    # CSS selector of the element, from which field's value is taken (first matching element within the row)
+    selector: str
+    # element's attribute, which contains the value, element's text is used if None
+    attribute: str | None = None
+    # whitespace stripping: 'none', 'value' (around the whole value) or 'fragments' (around each text fragment of the
+    # element, fragments are then joined without separator)
+    strip: Literal["none", "value", "fragments"] = "none"
+
+
+class RowExtractor:
+    """
+    Extracts items from rows of a page, e.g. from listings of a search results page.
+    """
+
+    def __init__(self, row_selector: str, fields: dict[str, Field]) -> None:
+        """
+        :param row_selector: CSS selector of rows, each row is extracted to a separate item.
+        :param fields: Item's field names and their definitions.
+        """
+        self.fields = fields
+        self._row_pattern = soupsieve.compile(row_selector)
+        # fields with the same selector share the compiled pattern, so that their element is looked up only once
+        self._patterns = {selector: soupsieve.compile(selector) for selector in {f.selector for f in fields.values()}}
+
+    def select_rows(self, content: bs4.Tag) -> list[bs4.Tag]:
+        """
+        :param content: Parsed page.
+
+        :return: Rows of the page.
+        """
+        return list(self._row_pattern.select(content))
+
+    def extract(self, content: bs4.Tag) -> list[dict[str, str]]:
+        """
+        :param content: Parsed page.
+
+        :return: Items of all rows of the page. Rows, in which any of the fields is missing, are skipped.
+        """
+        items = []
+        for row in self.select_rows(content):
+            item = self.extract_row(row)
+            if item is not None:
+                items.append(item)
+        return items
+
+    def extract_row(self, row: bs4.Tag) -> dict[str, str] | None:
+        """
+        :param row: Row element.
+
+        :return: Item with values of all fields, or None if any of the fields is missing in the row.
+        """
+        elements: dict[str, bs4.Tag] = {}
+        for selector, pattern in self._patterns.items():
+            element = pattern.select_one(row)
+            if element is None:
+                return None
+            elements[selector] = element
+
+        item = {}
+        for name, field in self.fields.items():
+            element = elements[field.selector]
+            if field.attribute is None:
+                value = element.get_text(strip=field.strip == "fragments")
+            elif (attribute_value := element.get(field.attribute)) is not None:
+                value = str(attribute_value)
+            else:
+                return None
+            item[name] = value.strip() if field.strip != "none" else value
+        return item
+
+
+def compile_selector(selector: str) -> soupsieve.SoupSieve:
+    """
+    :param selector: CSS selector.
+
+    :return: Compiled selector, which can be reused for matching and selecting elements.
+    """
+    return soupsieve.compile(selector)
@@ -0,0 +1,603 @@
+"""
+HTTP fetch layer shared by all spiders. Takes care of per-host politeness (rate limiting), retries, failing fast
+on hosts which are down (circuit breaking) and fetch metrics.
+"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import email.utils
+import random
+import threading
+import time
+import urllib.parse
+from collections.abc import Callable, Iterator
+from typing import Any, cast
+
+import requests
+import urllib3.util.request
+
+from news_crawlers import archive
+from news_crawlers import configuration
+from news_crawlers import metrics
+
+# content encodings, which can be decoded with installed libraries (brotli and zstd are supported if 'brotli' and
+# 'zstandard' packages are installed, see the 'compression' extra)
+ACCEPT_ENCODING = urllib3.util.request.ACCEPT_ENCODING
+
+DEFAULT_HEADERS = {
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "Accept-Language": "en-US,en;q=0.8",
+    "Upgrade-Insecure-Requests": "1",
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/"
+    "56.0.2924.87 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Cache-Control": "max-age=0",
+    "Connection": "keep-alive",
+}
+
+# status codes with which servers tell us to slow down
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """
+    Parses value of the 'Retry-After' header.
+
+    :param value: Header value, either a number of seconds or an HTTP date.
+    :param now: Current UNIX time, used when value is a date. Defaults to current time.
+
+    :return: Number of seconds to wait, or None if value is missing or invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - (time.time() if now is None else now), 0.0)
+
+
+class HostRateLimiter:  # pylint: disable=too-many-instance-attributes
+    """
+    Token bucket rate limiter with a limit on concurrent requests for a single host.
+
+    The rate adapts to the server's responses: it is halved each time the server throttles us (429 or 503) and
+    recovers gradually towards the configured rate with each successful response. While throttled, no requests
+    are sent until the 'Retry-After' period (or an exponential backoff, if the header is missing) has passed, both
+    are limited to 'max_backoff_seconds'.
+    """
+
+    def __init__(
+        self,
+        config: configuration.RateLimitConfig,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.config = config
+        self._clock = clock
+        self._sleep = sleep
+
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(config.max_in_flight)
+        self._rate = config.requests_per_second
+        self._tokens = float(config.burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._backoff = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Current (adapted) number of allowed requests per second."""
+        return self._rate
+
+    def acquire(self) -> None:
+        """
+        Blocks until a request to the host can be sent. Each successful call must be followed by a call to 'release'.
+
+        :raises DeadlineExceededError: If the request can not be sent before the deadline of the current context.
+        """
+        remaining = remaining_time()
+        timeout = None if remaining is None else max(remaining, 0.0)
+        if not self._in_flight.acquire(timeout=timeout):  # pylint: disable=consider-using-with
+            raise DeadlineExceededError("Deadline exceeded while waiting for other requests to the host.")
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self._tokens + (now - self._updated) * self._rate, float(self.config.burst))
+                self._updated = now
+
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self._rate
+            remaining = remaining_time()
+            if remaining is not None and wait > remaining:
+                # waiting would only delay the failure of the request
+                self._in_flight.release()
+                raise DeadlineExceededError("Rate limit of the host does not allow a request before the deadline.")
+            self._sleep(wait)
+
+    def release(self, status_code: int | None = None, retry_after: str | None = None) -> None:
+        """
+        Marks request as finished and adapts the rate based on the response.
+
+        :param status_code: Response status code, or None if no response was received.
+        :param retry_after: Value of the 'Retry-After' response header, if any.
+        """
+        try:
+            with self._lock:
+                if status_code in THROTTLE_STATUS_CODES:
+                    self._throttle(parse_retry_after(retry_after))
+                elif status_code is not None and status_code < 500:
+                    # additive increase towards the configured rate
+                    self._rate = min(self._rate + self.config.requests_per_second / 10, self.config.requests_per_second)
+                    self._backoff = 0.0
+        finally:
+            self._in_flight.release()
+
+    def _throttle(self, retry_after: float | None) -> None:
+        self._backoff = min(max(self._backoff * 2, 1.0), self.config.max_backoff_seconds)
+        delay = min(retry_after, self.config.max_backoff_seconds) if retry_after is not None else self._backoff
+        self._blocked_until = max(self._blocked_until, self._clock() + delay)
+        self._rate = max(self._rate / 2, self.config.requests_per_second / 64)
+        self._tokens = 0.0
+
+
+_rate_limits: dict[str, configuration.RateLimitConfig] = {}
+_rate_limiters: dict[str, HostRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def configure_rate_limits(rate_limits: dict[str, configuration.RateLimitConfig]) -> None:
+    """
+    Sets rate limits per host. Limiters of hosts whose settings changed are recreated.
+
+    :param rate_limits: Map of host name to its rate limit configuration. Key 'default' sets the limit for
+                        hosts, which are not listed.
+    """
+    with _rate_limiters_lock:
+        for host in list(_rate_limiters):
+            if _get_rate_limit_config(rate_limits, host) != _rate_limiters[host].config:
+                del _rate_limiters[host]
+        _rate_limits.clear()
+        _rate_limits.update(rate_limits)
+
+
+def _get_rate_limit_config(
+    rate_limits: dict[str, configuration.RateLimitConfig], host: str
+) -> configuration.RateLimitConfig:
+    return rate_limits.get(host, rate_limits.get("default", configuration.RateLimitConfig()))
+
+
+def get_rate_limiter(host: str) -> HostRateLimiter:
+    """
+    Returns rate limiter for the host. The same limiter is shared by all spiders and queries.
+
+    :param host: Host name, e.g. 'www.bolha.com'.
+
+    :return: Rate limiter of the host.
+    """
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = HostRateLimiter(_get_rate_limit_config(_rate_limits, host))
+        return _rate_limiters[host]
+
+
+_recorder: archive.ArchiveRecorder | None = None  # pylint: disable=invalid-name
+_replay: archive.ArchiveReplay | None = None  # pylint: disable=invalid-name
+
+
+def configure_archive(
+    recorder: archive.ArchiveRecorder | None = None, replay: archive.ArchiveReplay | None = None
+) -> None:
+    """
+    Sets HTTP archive, to which all fetched responses are recorded, or from which they are replayed.
+
+    :param recorder: Recorder of fetched responses, or None to stop recording.
+    :param replay: Archive to serve responses from instead of the network, or None to fetch from the network.
+    """
+    global _recorder, _replay  # pylint: disable=global-statement
+    _recorder = recorder
+    _replay = replay
+
+
+def replaying() -> bool:
+    """
+    :return: True if responses are served from an archive instead of the network.
+    """
+    return _replay is not None
+
+
+class DeadlineExceededError(requests.Timeout):
+    """
+    Raised when a request can not be completed before the deadline of the current run or spider.
+    """
+
+
+# monotonic time, by which all requests of the current context (run, spider) must complete
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline", default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """
+    Sets a deadline for all requests sent within the context (including threads started with a copy of it). Request
+    timeouts are shortened to the remaining time and no requests are sent after the deadline has passed. Nested
+    deadlines can only shorten the remaining time.
+
+    :param seconds: Time budget, starting now. No deadline is set if None.
+    """
+    if seconds is None:
+        yield
+        return
+
+    new_deadline = time.monotonic() + seconds
+    current_deadline = _deadline.get()
+    token = _deadline.set(new_deadline if current_deadline is None else min(current_deadline, new_deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> float | None:
+    """
+    :return: Seconds left until the deadline of the current context (negative if it has passed), or None if no
+             deadline is set.
+    """
+    current_deadline = _deadline.get()
+    return None if current_deadline is None else current_deadline - time.monotonic()
+
+
+def deadline_exceeded() -> bool:
+    """
+    :return: True if the deadline of the current context has passed.
+    """
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+def get(url: str, session: requests.Session | None = None, timeout: float = 10) -> requests.Response:
+    """
+    Sends a single GET request, respecting the rate limit of the target host, and records fetch metrics. If an archive
+    is being replayed, the recorded response is returned instead.
+
+    :param url: The URL to request.
+    :param session: Optional session to send the request with (e.g. one holding login cookies).
+    :param timeout: Request timeout in seconds.
+
+    :return: Response. Its status is not checked.
+    :raises DeadlineExceededError: If the deadline of the current context has passed, before or during the request.
+    :raises requests.RequestException: On connection or other request errors.
+    """
+    host = urllib.parse.urlsplit(url).hostname or ""
+    if _replay is not None:
+        start = time.perf_counter()
+        response = _replay.get(url)
+        _record_response(url, host, response, time.perf_counter() - start)
+        return response
+
+    limiter = get_rate_limiter(host)
+
+    limiter.acquire()
+    wire_counter = _WireBytesCounter()
+    status_code = None
+    retry_after = None
+    start = time.perf_counter()
+    try:
+        response = _send_request(url, session, timeout, wire_counter)
+        status_code = response.status_code
+        retry_after = response.headers.get("Retry-After")
+    except requests.RequestException:
+        metrics.inc("news_crawlers_fetch_responses_total", host=host, status="error")
+        metrics.record_fetch(url, "error", 0, time.perf_counter() - start)
+        raise
+    finally:
+        limiter.release(status_code, retry_after)
+
+    if status_code in THROTTLE_STATUS_CODES:
+        metrics.inc("news_crawlers_throttled_total", host=host)
+
+    _record_response(url, host, response, time.perf_counter() - start, wire_counter.count)
+
+    if _recorder is not None:
+        _recorder.record(url, response)
+
+    return response
+
+
+def _record_response(
+    url: str, host: str, response: requests.Response, elapsed: float, counted_wire_bytes: int = 0
+) -> None:
+    """
+    Records metrics of a fetched (or replayed) response.
+    """
+    status = str(response.status_code)
+    num_bytes = len(response.content)
+    wire_bytes = _get_wire_bytes(response, num_bytes, counted_wire_bytes)
+    encoding = response.headers.get("Content-Encoding", "identity")
+    metrics.observe("news_crawlers_fetch_seconds", elapsed, host=host)
+    metrics.inc("news_crawlers_fetch_responses_total", host=host, status=status)
+    metrics.inc("news_crawlers_fetch_bytes_total", num_bytes, host=host)
+    metrics.inc("news_crawlers_fetch_wire_bytes_total", wire_bytes, host=host, encoding=encoding)
+    metrics.record_fetch(url, status, num_bytes, elapsed, wire_bytes=wire_bytes)
+
+
+def _send_request(
+    url: str, session: requests.Session | None, timeout: float, wire_counter: _WireBytesCounter
+) -> requests.Response:
+    """
+    Sends a GET request, whose timeout is shortened to the time remaining until the deadline of the current context.
+
+    :param wire_counter: Counts body bytes of the response, which are read from the connection.
+
+    :raises DeadlineExceededError: If the deadline has passed, before or during the request.
+    """
+    remaining = remaining_time()
+    if remaining is not None:
+        if remaining <= 0:
+            raise DeadlineExceededError(f"Deadline exceeded before request to {url}.")
+        timeout = min(timeout, remaining)
+
+    # response hooks are called before the body is read
+    hooks = {"response": wire_counter.attach}
+    try:
+        if session is None:
+            return requests.get(url, headers=DEFAULT_HEADERS, timeout=timeout, hooks=hooks)
+        return session.get(url, headers=DEFAULT_HEADERS, timeout=timeout, hooks=hooks)
+    except requests.Timeout as exc:
+        if deadline_exceeded():
+            raise DeadlineExceededError(f"Deadline exceeded during request to {url}.") from exc
+        raise
+
+
+class _WireBytesCounter:
+    """
+    Counts body bytes of a response, which are read from its connection, before they are decoded. urllib3 itself
+    ('HTTPResponse.tell') does not count bytes of chunked bodies, so the counter wraps the file object of the
+    underlying 'http.client' response, from which both chunked and non-chunked bodies are read.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self._file: Any = None
+
+    def attach(self, response: requests.Response, **_: Any) -> requests.Response:
+        """
+        Response hook, which starts counting bytes of the response's body.
+
+        :param response: Response, whose body has not been read yet.
+
+        :return: The same response.
+        """
+        connection_response: Any = getattr(response.raw, "_fp", None)
+        if getattr(connection_response, "fp", None) is not None:
+            self._file = connection_response.fp
+            connection_response.fp = self
+        return response
+
+    def read(self, *args: Any) -> bytes:
+        data = self._file.read(*args)
+        self.count += len(data)
+        return cast(bytes, data)
+
+    def read1(self, *args: Any) -> bytes:
+        data = self._file.read1(*args)
+        self.count += len(data)
+        return cast(bytes, data)
+
+    def readline(self, *args: Any) -> bytes:
+        data = self._file.readline(*args)
+        self.count += len(data)
+        return cast(bytes, data)
+
+    def readinto(self, buffer: Any) -> int:
+        num_read = self._file.readinto(buffer)
+        self.count += num_read or 0
+        return cast(int, num_read)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._file, name)
+
+
+def _get_wire_bytes(response: requests.Response, num_bytes: int, counted_wire_bytes: int) -> int:
+    """
+    Returns number of body bytes, which were transferred over the network. Body is decompressed while it is being
+    read, so this number differs from size of the content if response is compressed. If bytes were not counted (e.g.
+    of replayed responses), 'Content-Length' is used, or the size of the content if that is missing too.
+    """
+    if counted_wire_bytes > 0:
+        return counted_wire_bytes
+    content_length = response.headers.get("Content-Length", "")
+    if content_length.isdigit() and int(content_length) > 0:
+        return int(content_length)
+    return num_bytes
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised instead of sending a request to a host, which is considered to be down.
+    """
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker. After a number of consecutive failures (connection errors, timeouts or 5xx responses)
+    the circuit opens and requests to the host fail immediately. After the reset period a single trial request is
+    let through; the circuit closes if it succeeds and opens again if it fails.
+    """
+
+    def __init__(self, host: str, clock: Callable[[], float] = time.monotonic) -> None:
+        self.host = host
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_progress = False
+
+    @property
+    def is_open(self) -> bool:
+        """True if requests to the host are currently being rejected."""
+        return self._opened_at is not None
+
+    def before_request(self, config: configuration.FetchConfig) -> bool:
+        """
+        Checks whether a request may be sent to the host.
+
+        :param config: Fetch configuration of the calling spider.
+
+        :return: True if the request is the trial request of a half-open circuit, in which case 'end_trial' must be
+                 called once it has finished.
+        :raises CircuitOpenError: If circuit is open.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if self._trial_in_progress or self._clock() - self._opened_at < config.breaker_reset_seconds:
+                raise CircuitOpenError(f"Circuit for host {self.host} is open, request was not sent.")
+            self._trial_in_progress = True
+            return True
+
+    def end_trial(self) -> None:
+        """
+        Lets another trial request through, if the trial has ended without a recorded outcome (e.g. it was
+        interrupted by the deadline), so the circuit does not stay open for good.
+        """
+        with self._lock:
+            self._trial_in_progress = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self, config: configuration.FetchConfig) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= config.breaker_failures:
+                self._opened_at = self._clock()
+                self._trial_in_progress = False
+                metrics.inc("news_crawlers_circuit_opened_total", host=self.host)
+
+
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    """
+    Returns circuit breaker for the host, shared by all spiders.
+
+    :param host: Host name.
+
+    :return: Circuit breaker of the host.
+    """
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker(host)
+        return _circuit_breakers[host]
+
+
+class Fetcher:
+    """
+    Fetches pages according to a spider's fetch policy: idempotent GET requests are retried with jittered
+    exponential backoff on connection errors, timeouts, 429 and 5xx responses, while the host's circuit breaker
+    makes requests fail fast when the host is down.
+    """
+
+    def __init__(
+        self,
+        config: configuration.FetchConfig | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """
+        :param config: Fetch policy (timeout, retries and circuit breaker settings). Defaults are used if None.
+        :param sleep: Function used to wait between retries.
+        """
+        self.config = config if config is not None else configuration.FetchConfig()
+        self._sleep = sleep
+
+    def get(self, url: str, session: requests.Session | None = None) -> requests.Response:
+        """
+        Sends a GET request, retrying it if it fails with a transient error.
+
+        :param url: The URL to request.
+        :param session: Optional session to send the request with (e.g. one holding login cookies).
+
+        :return: Response. If all attempts failed with 5xx or 429 response, the last response is returned.
+        :raises CircuitOpenError: If the host's circuit breaker is open.
+        :raises DeadlineExceededError: If the deadline of the current context has passed, retries are not attempted.
+        :raises requests.RequestException: If the last attempt failed with a connection or other request error.
+        """
+        breaker = get_circuit_breaker(urllib.parse.urlsplit(url).hostname or "")
+
+        attempt = 0
+        while True:
+            is_trial = breaker.before_request(self.config)
+            try:
+                response = get(url, session=session, timeout=self.config.timeout)
+            except DeadlineExceededError:
+                raise
+            except (requests.ConnectionError, requests.Timeout):
+                breaker.record_failure(self.config)
+                if attempt >= self.config.retries:
+                    raise
+            else:
+                if response.status_code >= 500:
+                    breaker.record_failure(self.config)
+                else:
+                    breaker.record_success()
+
+                if not _is_retryable(response.status_code) or attempt >= self.config.retries:
+                    return response
+            finally:
+                if is_trial:
+                    breaker.end_trial()
+
+            if not replaying():
+                backoff = self._get_backoff(attempt)
+                remaining = remaining_time()
+                if remaining is not None and remaining <= backoff:
+                    raise DeadlineExceededError(f"Deadline does not leave time to retry request to {url}.")
+                self._sleep(backoff)
+            attempt += 1
+
+    def _get_backoff(self, attempt: int) -> float:
+        # "full jitter" backoff, which spreads retries of concurrent requests
+        return random.uniform(0, min(self.config.backoff_seconds * 2**attempt, self.config.max_backoff_seconds))
+
+    def get_html(self, url: str, session: requests.Session | None = None) -> str:
+        """
+        Fetch a URL and return its response body as text.
+
+        :param url: The URL to request.
+        :param session: Optional session to send the request with.
+        :return: The response body as a string.
+        :raises requests.HTTPError: If the response status code is not 2xx.
+        """
+        return self.read_html(url, self.get(url, session=session))
+
+    @staticmethod
+    def read_html(url: str, response: requests.Response) -> str:
+        """
+        Checks status of a fetched page and returns its body as text.
+
+        :param url: The requested URL.
+        :param response: Response to the request.
+        :return: The response body as a string.
+        :raises requests.HTTPError: If the response status code is not 2xx.
+        """
+        response.raise_for_status()
+        metrics.inc("news_crawlers_pages_total", host=urllib.parse.urlsplit(url).hostname or "")
+        return response.text
+
+
+def _is_retryable(status_code: int) -> bool:
+    return status_code in THROTTLE_STATUS_CODES or status_code >= 500
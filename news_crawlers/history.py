@@ -0,0 +1,309 @@
+"""
+History of runs, stored in a local SQLite database ('<cache folder>/history.sqlite'). Each run appends a record of
+its duration and errors and, for each crawled query, its duration, fetched pages and bytes, and found items. History
+is used to show percentiles of queries' latencies and page counts, and to detect runs and queries, whose latency or
+page count differs sharply from their baseline (median of previous runs), e.g. after a site has changed.
+"""
+from __future__ import annotations
+
+import contextlib
+import math
+import pathlib
+import sqlite3
+from collections.abc import Iterator
+
+import pydantic
+
+from news_crawlers import scrape
+
+HISTORY_FILE_NAME = "history.sqlite"
+
+# number of most recent runs, which are kept in the history
+KEEP_RUNS = 5000
+
+# compared metrics and their minimal absolute difference from baseline, smaller differences are ignored as noise
+MIN_CHANGE = {"duration": 1.0, "pages": 1.0}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    errors INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    spider TEXT NOT NULL,
+    query TEXT NOT NULL,
+    duration REAL NOT NULL,
+    pages INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    items INTEGER NOT NULL,
+    new_items INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    unfinished INTEGER NOT NULL,
+    duplicates INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS queries_run_id ON queries (run_id);
+"""
+
+
+class QueryRecord(pydantic.BaseModel):
+    started: float
+    spider: str
+    query: str
+    duration: float
+    pages: int
+    bytes: int
+    items: int
+    new_items: int
+    failed: bool
+    unfinished: bool
+    duplicates: int = 0
+
+
+class RunRecord(pydantic.BaseModel):
+    started: float
+    duration: float
+    errors: int
+
+
+class QueryStats(pydantic.BaseModel):
+    spider: str
+    query: str
+    runs: int
+    failures: int
+    duration_p50: float
+    duration_p90: float
+    duration_p99: float
+    pages_p50: float
+    items_p50: float
+    new_items_total: int
+    duplicates_total: int = 0
+
+
+class Regression(pydantic.BaseModel):
+    started: float
+    # 'run' or 'spider:query'
+    subject: str
+    # 'duration' or 'pages'
+    metric: str
+    value: float
+    baseline: float
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """
+    :param values: Values, need not be sorted.
+    :param fraction: Percentile as fraction, e.g. 0.9 for the 90th percentile.
+
+    :return: Percentile of the values (nearest rank), or 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(fraction * len(ordered)))) - 1
+    return ordered[rank]
+
+
+def differs(value: float, baseline: float, threshold: float, min_change: float) -> bool:
+    """
+    :param value: Observed value.
+    :param baseline: Baseline value.
+    :param threshold: Ratio between the value and baseline (either way), from which the value differs sharply.
+    :param min_change: Minimal absolute difference, smaller differences (e.g. of very short durations) are ignored.
+
+    :return: True if the value differs sharply from the baseline.
+    """
+    if abs(value - baseline) < min_change:
+        return False
+    return value >= baseline * threshold or value * threshold <= baseline
+
+
+class RunHistory:
+    """
+    History of runs, stored in a SQLite database. A new connection is opened for each operation.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        """
+        :param path: Path to the database file. It is created if it does not exist.
+        """
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+            # histories, recorded before duplicates were counted
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(queries)")]
+            if "duplicates" not in columns:
+                connection.execute("ALTER TABLE queries ADD COLUMN duplicates INTEGER NOT NULL DEFAULT 0")
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.path, timeout=60.0)
+        connection.execute("PRAGMA foreign_keys = ON")
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def record(self, report: scrape.RunReport) -> None:
+        """
+        Appends a run to the history. Oldest runs are removed once there are more than KEEP_RUNS runs.
+
+        :param report: Report of a finished run.
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (started, duration, errors) VALUES (?, ?, ?)",
+                (report.started, report.duration, len(report.errors)),
+            )
+            connection.executemany(
+                "INSERT INTO queries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        cursor.lastrowid,
+                        query.spider,
+                        query.query,
+                        query.duration,
+                        query.pages,
+                        query.bytes,
+                        query.items,
+                        query.new_items,
+                        query.error is not None and not query.unfinished,
+                        query.unfinished,
+                        query.duplicates,
+                    )
+                    for query in report.queries
+                ],
+            )
+            connection.execute("DELETE FROM runs WHERE id <= ?", ((cursor.lastrowid or 0) - KEEP_RUNS,))
+
+    def runs(self, last: int) -> list[RunRecord]:
+        """
+        :param last: Number of most recent runs.
+
+        :return: Most recent runs, oldest first.
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT started, duration, errors FROM runs ORDER BY id DESC LIMIT ?", (last,)
+            ).fetchall()
+        return [RunRecord(started=row[0], duration=row[1], errors=row[2]) for row in reversed(rows)]
+
+    def queries(self, last: int) -> list[QueryRecord]:
+        """
+        :param last: Number of most recent runs.
+
+        :return: Queries, crawled in the most recent runs, oldest first.
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT runs.started, spider, query, queries.duration, pages, bytes, items, new_items, failed, "
+                "unfinished, duplicates FROM queries JOIN runs ON runs.id = queries.run_id "
+                "WHERE run_id IN (SELECT id FROM runs ORDER BY id DESC LIMIT ?) ORDER BY run_id",
+                (last,),
+            ).fetchall()
+        return [QueryRecord(**dict(zip(QueryRecord.model_fields, row))) for row in rows]
+
+
+def get_query_stats(records: list[QueryRecord]) -> list[QueryStats]:
+    """
+    :param records: Records of crawled queries.
+
+    :return: Statistics of each query, sorted by spider and query name. Durations and page counts only include
+             successful crawls.
+    """
+    by_query: dict[tuple[str, str], list[QueryRecord]] = {}
+    for record in records:
+        by_query.setdefault((record.spider, record.query), []).append(record)
+
+    stats = []
+    for (spider_name, query), query_records in sorted(by_query.items()):
+        succeeded = [record for record in query_records if not record.failed and not record.unfinished]
+        durations = [record.duration for record in succeeded]
+        stats.append(
+            QueryStats(
+                spider=spider_name,
+                query=query,
+                runs=len(query_records),
+                failures=len(query_records) - len(succeeded),
+                duration_p50=percentile(durations, 0.5),
+                duration_p90=percentile(durations, 0.9),
+                duration_p99=percentile(durations, 0.99),
+                pages_p50=percentile([record.pages for record in succeeded], 0.5),
+                items_p50=percentile([record.items for record in succeeded], 0.5),
+                new_items_total=sum(record.new_items for record in query_records),
+                duplicates_total=sum(record.duplicates for record in query_records),
+            )
+        )
+    return stats
+
+
+def find_regressions(
+    runs: list[RunRecord],
+    queries: list[QueryRecord],
+    recent: int,
+    threshold: float,
+) -> list[Regression]:
+    """
+    Compares durations of the most recent runs, and durations and page counts of their queries, with the median of
+    all previous runs.
+
+    :param runs: Runs, oldest first.
+    :param queries: Queries, crawled in the runs, oldest first.
+    :param recent: Number of most recent runs, which are checked.
+    :param threshold: Ratio between a value and its baseline (either way), from which the value differs sharply.
+
+    :return: Values, which differ sharply from their baseline.
+    """
+    if len(runs) <= recent:
+        return []
+
+    baseline_duration = percentile([run.duration for run in runs[:-recent]], 0.5)
+    regressions = [
+        Regression(
+            started=run.started,
+            subject="run",
+            metric="duration",
+            value=run.duration,
+            baseline=baseline_duration,
+        )
+        for run in runs[-recent:]
+        if differs(run.duration, baseline_duration, threshold, MIN_CHANGE["duration"])
+    ]
+
+    by_query: dict[str, list[QueryRecord]] = {}
+    for record in queries:
+        if not record.failed and not record.unfinished:
+            by_query.setdefault(f"{record.spider}:{record.query}", []).append(record)
+
+    for subject, records in sorted(by_query.items()):
+        regressions.extend(_find_query_regressions(subject, records, runs[-recent].started, threshold))
+    return regressions
+
+
+def _find_query_regressions(
+    subject: str, records: list[QueryRecord], checked_since: float, threshold: float
+) -> list[Regression]:
+    baseline = [record for record in records if record.started < checked_since]
+    if not baseline:
+        return []
+
+    regressions: list[Regression] = []
+    for metric, min_change in MIN_CHANGE.items():
+        baseline_value = percentile([getattr(record, metric) for record in baseline], 0.5)
+        regressions.extend(
+            Regression(
+                started=record.started,
+                subject=subject,
+                metric=metric,
+                value=getattr(record, metric),
+                baseline=baseline_value,
+            )
+            for record in records
+            if record.started >= checked_since
+            and differs(getattr(record, metric), baseline_value, threshold, min_change)
+        )
+    return regressions
@@ -0,0 +1,169 @@
+"""
+Logging pipeline. Log records are put to a queue by the logging thread and written by handlers (e.g. a rotating log
+file) on a background thread, so slow writes do not delay crawling. Messages are only formatted on the background
+thread, and lists of new items are logged as summaries with a few sample items, instead of in full. Records can be
+written as plain text lines or as JSON events, which also contain the record's extra fields.
+"""
+from __future__ import annotations
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from collections.abc import Mapping, Sequence
+
+# number of sample items in a summary of new items
+SAMPLE_SIZE = 3
+# sample items are truncated to this many characters
+MAX_ITEM_LENGTH = 200
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-8s %(message)s"
+
+# attributes, which every log record has, all other attributes are extra fields
+_RECORD_ATTRIBUTES = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+_listener: logging.handlers.QueueListener | None = None  # pylint: disable=invalid-name
+_queue_handler: logging.Handler | None = None  # pylint: disable=invalid-name
+_loggers: list[logging.Logger] = []
+
+
+class DiffSummary:
+    """
+    Summary of new items by spider: number of items and a few sample items of each spider. Summary is formatted only
+    when it is converted to string, i.e. when the record is written.
+    """
+
+    def __init__(self, diff: Mapping[str, Sequence[Mapping[str, str]]], sample_size: int = SAMPLE_SIZE) -> None:
+        """
+        :param diff: Map of spider name to list of new items.
+        :param sample_size: Number of sample items of each spider.
+        """
+        self.diff = diff
+        self.sample_size = sample_size
+
+    def counts(self) -> dict[str, int]:
+        """
+        :return: Map of spider name to number of its new items.
+        """
+        return {spider_name: len(items) for spider_name, items in self.diff.items()}
+
+    def __str__(self) -> str:
+        spider_summaries = []
+        for spider_name, items in self.diff.items():
+            samples = [_truncate(json.dumps(item, ensure_ascii=False)) for item in items[: self.sample_size]]
+            if len(items) > self.sample_size:
+                samples.append(f"... {len(items) - self.sample_size} more")
+            spider_summaries.append(f"{spider_name}: {len(items)} new [{', '.join(samples)}]")
+        return "; ".join(spider_summaries) or "no new items"
+
+
+def _truncate(text: str) -> str:
+    return text if len(text) <= MAX_ITEM_LENGTH else text[: MAX_ITEM_LENGTH - 3] + "..."
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as single line JSON events with time, level, logger, message and extra fields of the record.
+    Numbers of new items of summaries, which are the message's arguments, are added as 'new_items' field.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        event: dict[str, object] = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        event.update((key, value) for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES)
+        args = record.args if isinstance(record.args, tuple) else ()
+        for arg in args:
+            if isinstance(arg, DiffSummary):
+                event["new_items"] = arg.counts()
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler, which leaves formatting of records to the listener's handlers. Records are passed within the
+    process only, so their arguments do not need to be converted to strings before they are queued. In processes
+    forked after logging was set up (e.g. worker processes), which have no listener, records are handled directly.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue[logging.LogRecord], handlers: Sequence[logging.Handler]) -> None:
+        super().__init__(log_queue)
+        self._handlers = handlers
+        self._pid = os.getpid()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if os.getpid() == self._pid:
+            super().emit(record)
+            return
+
+        for handler in self._handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def create_file_handler(log_path: os.PathLike[str], rotation_days: int, log_format: str = "text") -> logging.Handler:
+    """
+    :param log_path: Path of the log file.
+    :param rotation_days: Log file is rotated after this many days.
+    :param log_format: 'text' for plain text lines or 'json' for JSON events.
+
+    :return: Handler, which writes to a rotating log file.
+    """
+    handler = logging.handlers.TimedRotatingFileHandler(log_path, when="d", interval=rotation_days)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def start_queue_logging(handlers: Sequence[logging.Handler], loggers: Sequence[logging.Logger]) -> None:
+    """
+    Starts writing records of the loggers with the handlers on a background thread. Logging, which was previously
+    started, is stopped first, so this can be called repeatedly.
+
+    :param handlers: Handlers, which write the records.
+    :param loggers: Loggers, whose records are written.
+    """
+    global _listener, _queue_handler  # pylint: disable=global-statement
+
+    stop_queue_logging()
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    _queue_handler = _DeferredQueueHandler(log_queue, handlers)
+    for logger in loggers:
+        logger.addHandler(_queue_handler)
+        _loggers.append(logger)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_queue_logging() -> None:
+    """
+    Writes all queued records, then stops the background thread and closes its handlers.
+    """
+    global _listener, _queue_handler  # pylint: disable=global-statement
+
+    if _listener is None or _queue_handler is None:
+        return
+
+    for logger in _loggers:
+        logger.removeHandler(_queue_handler)
+    _loggers.clear()
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _queue_handler = None
+
+
+# queued records are written before the interpreter exits
+atexit.register(stop_queue_logging)
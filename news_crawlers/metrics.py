@@ -0,0 +1,362 @@
+"""
+In-process metrics (counters and histograms) for crawling, parsing and notifying, with Prometheus text and JSON
+run summary export.
+"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import copy
+import http.server
+import json
+import pathlib
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# metric name -> (type, help text)
+METRICS: dict[str, tuple[str, str]] = {
+    "news_crawlers_fetch_seconds": ("histogram", "Latency of HTTP fetches in seconds."),
+    "news_crawlers_fetch_responses_total": ("counter", "Number of HTTP responses by status code."),
+    "news_crawlers_fetch_bytes_total": ("counter", "Number of decoded (decompressed) response body bytes."),
+    "news_crawlers_fetch_wire_bytes_total": ("counter", "Number of response body bytes transferred over the network."),
+    "news_crawlers_throttled_total": ("counter", "Number of responses with which a host throttled us (429/503)."),
+    "news_crawlers_circuit_opened_total": ("counter", "Number of times a host's circuit breaker opened."),
+    "news_crawlers_pages_total": ("counter", "Number of pages fetched per query."),
+    "news_crawlers_parse_seconds": ("histogram", "Time spent parsing fetched pages in seconds."),
+    "news_crawlers_items_total": ("counter", "Number of items scraped."),
+    "news_crawlers_new_items_total": ("counter", "Number of new (previously unseen) items."),
+    "news_crawlers_duplicate_items_total": (
+        "counter",
+        "Number of listings, dropped because another query of the spider has found them in the same run.",
+    ),
+    "news_crawlers_seen_index_lookups_total": (
+        "counter",
+        "Number of items checked with the seen index by result (new, seen, false_positive of the Bloom filter).",
+    ),
+    "news_crawlers_notify_seconds": ("histogram", "Time spent sending notifications in seconds."),
+    "news_crawlers_notify_failures_total": ("counter", "Number of failed notification attempts."),
+    "news_crawlers_sink_seconds": ("histogram", "Time spent writing batches of new items to sinks in seconds."),
+    "news_crawlers_sink_failures_total": ("counter", "Number of failed writes of batches to sinks."),
+    "news_crawlers_stage_seconds": ("histogram", "Duration of run stages (scrape, sink, notify) in seconds."),
+}
+
+_context_labels: contextvars.ContextVar[tuple[tuple[str, str], ...]] = contextvars.ContextVar(
+    "metrics_context_labels", default=()
+)
+
+
+class Tally:
+    """
+    Number of pages and bytes fetched within a 'tally' context, including fetches in threads which run in copies of
+    the context.
+    """
+
+    def __init__(self) -> None:
+        self.pages = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, num_bytes: int) -> None:
+        with self._lock:
+            self.pages += 1
+            self.bytes += num_bytes
+
+
+_tallies: contextvars.ContextVar[tuple[Tally, ...]] = contextvars.ContextVar("metrics_tallies", default=())
+
+
+def _label_key(label_values: dict[str, str]) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in sorted(label_values.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of counter and histogram series. Series are keyed by metric name and rendered label set.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: dict[str, dict[str, Any]] = {name: {} for name in METRICS}
+        self._fetches: list[dict[str, Any]] = []
+        self._run_baseline: dict[str, dict[str, Any]] = copy.deepcopy(self._series)
+        self._run_started = time.time()
+
+    def inc(self, name: str, value: float = 1.0, **label_values: str) -> None:
+        """
+        Increments a counter.
+
+        :param name: Metric name, must be one of the counters in METRICS.
+        :param value: Amount to add.
+        :param label_values: Label values. Labels from the current 'labels' context are added automatically.
+        """
+        key = _label_key({**dict(_context_labels.get()), **label_values})
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **label_values: str) -> None:
+        """
+        Records an observation in a histogram.
+
+        :param name: Metric name, must be one of the histograms in METRICS.
+        :param value: Observed value (usually seconds).
+        :param label_values: Label values. Labels from the current 'labels' context are added automatically.
+        """
+        key = _label_key({**dict(_context_labels.get()), **label_values})
+        with self._lock:
+            series = self._series[name]
+            if key not in series:
+                series[key] = {"count": 0, "sum": 0.0, "buckets": [0] * len(self.buckets)}
+            hist = series[key]
+            hist["count"] += 1
+            hist["sum"] += value
+            for ind, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist["buckets"][ind] += 1
+
+    def record_fetch(  # pylint: disable=too-many-arguments
+        self, url: str, status: str, num_bytes: int, seconds: float, wire_bytes: int | None = None
+    ) -> None:
+        """
+        Records a single fetched URL for the per-URL section of the run summary.
+
+        :param url: Fetched URL.
+        :param status: HTTP status code, or 'error' if no response was received.
+        :param num_bytes: Size of the (decoded) response body.
+        :param seconds: Fetch latency.
+        :param wire_bytes: Size of the response body as transferred over the network. Same as 'num_bytes' if None.
+        """
+        record = {
+            **dict(_context_labels.get()),
+            "url": url,
+            "status": status,
+            "bytes": num_bytes,
+            "wire_bytes": num_bytes if wire_bytes is None else wire_bytes,
+            "seconds": seconds,
+        }
+        with self._lock:
+            self._fetches.append(record)
+
+    def begin_run(self) -> None:
+        """
+        Marks the start of a new run. The run summary only contains data recorded after this call.
+        """
+        with self._lock:
+            self._run_baseline = copy.deepcopy(self._series)
+            self._fetches = []
+            self._run_started = time.time()
+
+    def run_summary(self) -> dict[str, Any]:
+        """
+        Returns metrics recorded since the last 'begin_run' call, including every fetched URL.
+
+        :return: JSON serializable run summary.
+        """
+        with self._lock:
+            metrics: dict[str, dict[str, Any]] = {}
+            for name, series in self._series.items():
+                baseline = self._run_baseline.get(name, {})
+                delta = {key: _subtract(value, baseline.get(key)) for key, value in series.items()}
+                metrics[name] = {key: value for key, value in delta.items() if _is_nonzero(value)}
+            return {
+                "started": self._run_started,
+                "duration": time.time() - self._run_started,
+                "metrics": metrics,
+                "fetches": list(self._fetches),
+            }
+
+    def render_prometheus(self) -> str:
+        """
+        Renders all series in the Prometheus text exposition format.
+
+        :return: Metrics as Prometheus text.
+        """
+        lines = []
+        with self._lock:
+            for name, (metric_type, help_text) in METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for key, value in sorted(self._series[name].items()):
+                    if metric_type == "counter":
+                        lines.append(f"{name}{_braces(key)} {value}")
+                    else:
+                        lines.extend(self._render_histogram(name, key, value))
+        return "\n".join(lines) + "\n"
+
+    def _render_histogram(self, name: str, key: str, hist: dict[str, Any]) -> list[str]:
+        prefix = key + "," if key else ""
+        lines = [
+            f'{name}_bucket{{{prefix}le="{bound}"}} {count}' for bound, count in zip(self.buckets, hist["buckets"])
+        ]
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {hist["count"]}')
+        lines.append(f"{name}_sum{_braces(key)} {hist['sum']}")
+        lines.append(f"{name}_count{_braces(key)} {hist['count']}")
+        return lines
+
+    def reset(self) -> None:
+        """
+        Removes all recorded data.
+        """
+        with self._lock:
+            self._series = {name: {} for name in METRICS}
+            self._fetches = []
+            self._run_baseline = copy.deepcopy(self._series)
+            self._run_started = time.time()
+
+
+def _braces(key: str) -> str:
+    return f"{{{key}}}" if key else ""
+
+
+def _subtract(value: Any, baseline: Any) -> Any:
+    if baseline is None:
+        return copy.deepcopy(value)
+    if isinstance(value, dict):
+        return {
+            "count": value["count"] - baseline["count"],
+            "sum": value["sum"] - baseline["sum"],
+            "buckets": [cur - prev for cur, prev in zip(value["buckets"], baseline["buckets"])],
+        }
+    return value - baseline
+
+
+def _is_nonzero(value: Any) -> bool:
+    if isinstance(value, dict):
+        return bool(value["count"])
+    return bool(value)
+
+
+REGISTRY = MetricsRegistry()
+
+
+def inc(name: str, value: float = 1.0, **label_values: str) -> None:
+    """Increments a counter in the default registry."""
+    REGISTRY.inc(name, value, **label_values)
+
+
+def observe(name: str, value: float, **label_values: str) -> None:
+    """Records a histogram observation in the default registry."""
+    REGISTRY.observe(name, value, **label_values)
+
+
+def record_fetch(url: str, status: str, num_bytes: int, seconds: float, wire_bytes: int | None = None) -> None:
+    """Records a fetched URL in the default registry and, if it was fetched, in tallies of the current context."""
+    REGISTRY.record_fetch(url, status, num_bytes, seconds, wire_bytes)
+    if status != "error":
+        for fetch_tally in _tallies.get():
+            fetch_tally.add(num_bytes)
+
+
+@contextlib.contextmanager
+def tally() -> Iterator[Tally]:
+    """
+    Counts pages and bytes, fetched within the context (e.g. by a single query).
+
+    :return: Tally, which is updated with each fetch.
+    """
+    fetch_tally = Tally()
+    token = _tallies.set(_tallies.get() + (fetch_tally,))
+    try:
+        yield fetch_tally
+    finally:
+        _tallies.reset(token)
+
+
+@contextlib.contextmanager
+def labels(**context_labels: str) -> Iterator[None]:
+    """
+    Adds labels to all metrics recorded within the context (e.g. spider and query name), so that lower layers such
+    as the fetching code do not need to know which spider they are working for.
+
+    :param context_labels: Label names and values.
+    """
+    token = _context_labels.set(tuple({**dict(_context_labels.get()), **context_labels}.items()))
+    try:
+        yield
+    finally:
+        _context_labels.reset(token)
+
+
+@contextlib.contextmanager
+def timer(name: str, **metric_labels: str) -> Iterator[None]:
+    """
+    Observes duration of the wrapped block in the specified histogram.
+
+    :param name: Histogram metric name.
+    :param metric_labels: Additional labels for the observation.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **metric_labels)
+
+
+def write_prometheus_textfile(path: pathlib.Path) -> None:
+    """
+    Writes metrics from the default registry to a file, readable by the node exporter's textfile collector.
+    The file is replaced atomically, so the collector never reads a partially written file.
+
+    :param path: Output file path (should end with '.prom').
+    """
+    path = pathlib.Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(REGISTRY.render_prometheus(), encoding="utf8")
+    tmp_path.replace(path)
+
+
+def write_run_summary(path: pathlib.Path) -> None:
+    """
+    Writes JSON summary of the last run from the default registry.
+
+    :param path: Output file path.
+    """
+    with open(path, "w+", encoding="utf8") as file:
+        json.dump(REGISTRY.run_summary(), file, indent=2)
+
+
+class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        if self.path == "/metrics":
+            body = REGISTRY.render_prometheus().encode("utf8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/summary":
+            body = json.dumps(REGISTRY.run_summary()).encode("utf8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        # do not write access logs to stderr
+        pass
+
+
+def start_http_server(port: int, address: str = "") -> http.server.ThreadingHTTPServer:
+    """
+    Starts HTTP server in a background thread, exposing '/metrics' (Prometheus) and '/summary' (JSON) endpoints.
+
+    :param port: Port to listen on.
+    :param address: Address to bind to. Binds to all interfaces by default.
+
+    :return: Running server. Call 'shutdown' on it to stop it.
+    """
+    server = http.server.ThreadingHTTPServer((address, port), _MetricsRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
@@ -5,17 +5,35 @@ Contains various Notificator implementations.
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+import concurrent.futures
+import contextvars
+import json
 import smtplib
 import sys
 import os
 import inspect
-from typing import cast
+import threading
+import time
+from typing import NamedTuple, cast
 
 import requests
+import requests.adapters
+
+from news_crawlers import fetching
 
 NotificatorItem = dict[str, str]
 
 
+class DigestSection(NamedTuple):
+    """
+    Section of a digest message, e.g. new items of a single spider.
+    """
+
+    title: str
+    items: list[NotificatorItem]
+    item_format: str
+
+
 class Notificator(ABC):
     """
     Notificator base class. This class is meant to be subclassed for each implementation of different notification
@@ -74,6 +92,20 @@ class Notificator(ABC):
         if not send_separately:
             self.send_text(subject, text)
 
+    def send_digest(self, subject: str, sections: list[DigestSection]) -> None:
+        """
+        Sends items of several sections (e.g. spiders) as a single message, in which each section has a heading.
+
+        :param subject: Subject for message.
+        :param sections: Sections of the message.
+        """
+        self.send_text(subject, "".join(get_digest_texts(sections)))
+
+    def close(self) -> None:
+        """
+        Releases resources (e.g. connections) held by the notificator. Called after all messages have been sent.
+        """
+
 
 class EmailNotificator(Notificator):
     """
@@ -146,6 +178,10 @@ class PushoverNotificator(Notificator):
 
     name = "pushover"
 
+    def __init__(self, configuration: dict[str, str | bool]) -> None:
+        super().__init__(configuration)
+        self._session: requests.Session | None = None
+
     @staticmethod
     def _open_session() -> requests.Session:
         """
@@ -155,6 +191,21 @@ class PushoverNotificator(Notificator):
         """
         return requests.Session()
 
+    def _get_session(self) -> requests.Session:
+        """
+        Returns HTTPS session, which is opened on first call and reused for all following messages.
+
+        :return: HTTPS session handle.
+        """
+        if self._session is None:
+            self._session = self._open_session()
+        return self._session
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
     def send_text(self, subject: str, message: str):
         """
         Sends a pushover notification.
@@ -173,7 +224,7 @@ class PushoverNotificator(Notificator):
         self._post_message(subject, message, url=url)
 
     def _post_message(self, subject: str, message: str, url: str | None) -> None:
-        session = self._open_session()
+        session = self._get_session()
         recipients = cast(str, self.configuration["recipients"]).split(",")
 
         for user_key in recipients:
@@ -203,24 +254,243 @@ class PushoverNotificator(Notificator):
             # here it is assumed, that any single item's text will not exceed 1024 character limitation
             super().send_items(subject, items, item_format, send_separately=True)
         else:
-            # pushover messages are limited to 1024 characters. Items need to be divided to separate text blocks and
-            # sent separately if text would exceed that limit
-
-            temp_message = ""
-            for item in items:
-                item_txt = item_format.format(**item)
-                if len(temp_message + item_txt) > 1024:
-                    # if message together with new item exceeds character limit, send it without new item
-                    self.send_text(subject, temp_message)
-
-                    # current item's text will be sent in the next message
-                    temp_message = item_txt
-                else:
-                    # append current item's text to message
-                    temp_message += item_txt
-
-            # send 'leftover' text
-            self.send_text(subject, temp_message)
+            self._send_divided(subject, [item_format.format(**item) for item in items])
+
+    def send_digest(self, subject: str, sections: list[DigestSection]) -> None:
+        self._send_divided(subject, get_digest_texts(sections))
+
+    def _send_divided(self, subject: str, texts: list[str]) -> None:
+        """
+        Sends texts joined to as few messages as possible.
+
+        :param subject: Subject of push notifications.
+        :param texts: Texts (e.g. of single items), which are not divided between messages.
+        """
+        # pushover messages are limited to 1024 characters. Items need to be divided to separate text blocks and
+        # sent separately if text would exceed that limit
+
+        temp_message = ""
+        for item_txt in texts:
+            if len(temp_message + item_txt) > 1024:
+                # if message together with new item exceeds character limit, send it without new item
+                self.send_text(subject, temp_message)
+
+                # current item's text will be sent in the next message
+                temp_message = item_txt
+            else:
+                # append current item's text to message
+                temp_message += item_txt
+
+        # send 'leftover' text
+        self.send_text(subject, temp_message)
+
+
+class WebhookClient:  # pylint: disable=too-many-instance-attributes
+    """
+    Posts JSON payloads to webhook endpoints, over a session which keeps connections alive. Used by the webhook
+    notificator and the webhook sink. Configuration: optional 'token', which is sent as a bearer token, 'retries'
+    (default 3), 'retry_backoff_seconds' (default 1), 'max_backoff_seconds' (default 300) and 'timeout_seconds'
+    (default 30).
+
+    Requests, which fail with a connection error, timeout, 429 or 5xx response, are retried with exponential backoff,
+    unless the endpoint sends 'Retry-After'. Both are limited to 'max_backoff_seconds'. Requests and waits respect the
+    deadline of the current context (see 'fetching.deadline').
+    """
+
+    def __init__(self, configuration: dict[str, str | bool], pool_size: int = 1) -> None:
+        """
+        :param configuration: Configuration of the notificator or sink.
+        :param pool_size: Number of endpoints (hosts), to which payloads are posted concurrently.
+        """
+        self.token = configuration.get("token")
+        self.retries = int(cast(str, configuration.get("retries", 3)))
+        self.retry_backoff = float(cast(str, configuration.get("retry_backoff_seconds", 1.0)))
+        self.max_backoff = float(cast(str, configuration.get("max_backoff_seconds", 300.0)))
+        self.timeout = float(cast(str, configuration.get("timeout_seconds", 30)))
+        self.pool_size = pool_size
+        self._session: requests.Session | None = None
+        self._session_lock = threading.Lock()
+
+    def _open_session(self) -> requests.Session:
+        """
+        Opens HTTP session, with a pool of kept-alive connections for each endpoint's host.
+
+        :return: HTTP session handle.
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get_session(self) -> requests.Session:
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._open_session()
+            return self._session
+
+    def close(self) -> None:
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def post(self, url: str, payload: bytes) -> None:
+        """
+        Posts JSON payload to the endpoint, retrying failed requests.
+
+        :param url: URL of the endpoint.
+        :param payload: Encoded JSON payload.
+
+        :raises requests.RequestException: If the last attempt fails.
+        :raises fetching.DeadlineExceededError: If the deadline does not leave time for the request or its retry.
+        """
+        session = self._get_session()
+        headers = {"Content-Type": "application/json", "User-Agent": "Python"}
+        if self.token is not None:
+            headers["Authorization"] = f"Bearer {self.token}"
+
+        for attempt in range(self.retries + 1):
+            remaining = fetching.remaining_time()
+            if remaining is not None and remaining <= 0:
+                raise fetching.DeadlineExceededError(f"Deadline exceeded before request to {url}.")
+            timeout = self.timeout if remaining is None else min(self.timeout, remaining)
+
+            retry_after = None
+            try:
+                response = session.post(url, data=payload, headers=headers, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+            else:
+                retryable = response.status_code in fetching.THROTTLE_STATUS_CODES or response.status_code >= 500
+                if not retryable or attempt >= self.retries:
+                    response.raise_for_status()
+                    return
+                retry_after = fetching.parse_retry_after(response.headers.get("Retry-After"))
+            delay = min(retry_after if retry_after is not None else self.retry_backoff * 2**attempt, self.max_backoff)
+            remaining = fetching.remaining_time()
+            if remaining is not None and delay >= remaining:
+                raise fetching.DeadlineExceededError(f"Deadline does not leave time to retry request to {url}.")
+            time.sleep(delay)
+
+
+class WebhookNotificator(Notificator):
+    """
+    Webhook notification implementation.
+
+    This implementation posts items as JSON payloads to one or more HTTP endpoints (e.g. of internal chat or incident
+    systems). Items are sent in batches, each payload holds as many items as 'max_batch_items' and 'max_batch_bytes'
+    allow:
+
+    {"subject": "...", "messages": [{"text": "<formatted item>", "item": {...}, "section": "<digest section>"}]}
+
+    Batches are delivered to all endpoints concurrently, and in order to each endpoint, by a 'WebhookClient', which
+    keeps connections alive and retries failed requests.
+    """
+
+    name = "webhook"
+
+    def __init__(self, configuration: dict[str, str | bool]) -> None:
+        super().__init__(configuration)
+        self.urls = cast(str, self.configuration["urls"]).split(",")
+        self.max_batch_items = int(cast(str, self.configuration.get("max_batch_items", 100)))
+        self.max_batch_bytes = int(cast(str, self.configuration.get("max_batch_bytes", 256000)))
+        self._client = WebhookClient(self.configuration, pool_size=len(self.urls))
+
+    def close(self) -> None:
+        self._client.close()
+
+    def send_text(self, subject: str, message: str) -> None:
+        self._send_messages(subject, [{"text": message}])
+
+    def _send_single_item(self, subject: str, item: NotificatorItem, item_format: str) -> None:
+        self._send_messages(subject, [{"text": item_format.format(**item), "item": item}])
+
+    def send_items(
+        self,
+        subject: str,
+        items: list[NotificatorItem],
+        item_format: str,
+        send_separately: bool = False,
+    ) -> None:
+        if send_separately:
+            super().send_items(subject, items, item_format, send_separately=True)
+        else:
+            self._send_messages(subject, [{"text": item_format.format(**item), "item": item} for item in items])
+
+    def send_digest(self, subject: str, sections: list[DigestSection]) -> None:
+        self._send_messages(
+            subject,
+            [
+                {"text": section.item_format.format(**item), "item": item, "section": section.title}
+                for section in sections
+                for item in section.items
+            ],
+        )
+
+    def get_payloads(self, subject: str, messages: list[dict[str, object]]) -> list[bytes]:
+        """
+        Divides messages to as few payloads as batch limits allow. A message, which alone exceeds 'max_batch_bytes',
+        is sent in its own payload.
+
+        :param subject: Subject of the notification.
+        :param messages: Messages (e.g. of single items).
+
+        :return: Encoded JSON payloads.
+        """
+        # size of a payload is computed from sizes of its messages, which are separated by ', ' in the list
+        empty_size = len(self._encode(subject, []))
+        payloads = []
+        batch: list[dict[str, object]] = []
+        batch_size = empty_size
+        for message in messages:
+            message_size = len(json.dumps(message, ensure_ascii=False).encode("utf8"))
+            separator_size = 2 if batch else 0
+            if batch and (
+                len(batch) >= self.max_batch_items or batch_size + separator_size + message_size > self.max_batch_bytes
+            ):
+                payloads.append(self._encode(subject, batch))
+                batch, batch_size, separator_size = [], empty_size, 0
+            batch.append(message)
+            batch_size += separator_size + message_size
+        if batch:
+            payloads.append(self._encode(subject, batch))
+        return payloads
+
+    @staticmethod
+    def _encode(subject: str, messages: list[dict[str, object]]) -> bytes:
+        return json.dumps({"subject": subject, "messages": messages}, ensure_ascii=False).encode("utf8")
+
+    def _send_messages(self, subject: str, messages: list[dict[str, object]]) -> None:
+        payloads = self.get_payloads(subject, messages)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.urls)) as executor:
+            # each endpoint is delivered to in a copy of the current context, so that it keeps the deadline
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._deliver, url, payloads) for url in self.urls
+            ]
+        # failure of an endpoint does not prevent delivery to the others, first failure is raised once all are done
+        for future in futures:
+            future.result()
+
+    def _deliver(self, url: str, payloads: list[bytes]) -> None:
+        for payload in payloads:
+            self._client.post(url, payload)
+
+
+def get_digest_texts(sections: list[DigestSection]) -> list[str]:
+    """
+    :param sections: Sections of a digest message.
+
+    :return: Texts of each section's heading and of each of its items, in order. Sections are separated by an empty
+             line.
+    """
+    texts = []
+    for section_ind, section in enumerate(sections):
+        separator = "\n" if section_ind > 0 else ""
+        texts.append(f"{separator}{section.title} ({len(section.items)} new)\n")
+        texts.extend(section.item_format.format(**item) for item in section.items)
+    return texts
 
 
 def get_notificator_by_name(name: str) -> type[Notificator]:
@@ -0,0 +1,116 @@
+"""
+Adaptive polling of queries. For each query, a moving average of its change rate (share of recent polls, which have
+found new items) is stored next to the query's cache file. Queries, which often find new items, are polled at the
+configured minimum interval, queries without new items gradually less often, up to the configured maximum interval.
+Runs only crawl queries, whose interval has passed, so the schedule's interval should not exceed the minimum one.
+"""
+from __future__ import annotations
+
+import pathlib
+
+import pydantic
+
+from news_crawlers import cache
+from news_crawlers import configuration
+
+# a query is due slightly before its interval has passed, so that jitter of scheduled runs does not delay it by a run
+DUE_TOLERANCE = 0.05
+
+
+class PollState(pydantic.BaseModel):
+    # start time of the run, which has last polled the query
+    last_polled: float
+    # moving average of the share of polls, which have found new items
+    change_rate: float
+
+
+def read_state(cache_folder: pathlib.Path, spider_name: str, query: str) -> PollState | None:
+    """
+    :param cache_folder: Cache folder.
+    :param spider_name: Name of the spider.
+    :param query: Name of the query.
+
+    :return: Polling state of the query, or None if the query has not been polled yet.
+
+    :raises pydantic.ValidationError: If the stored state is corrupt.
+    """
+    path = cache.query_state_path(cache_folder, spider_name, query)
+    if not path.exists():
+        return None
+    return PollState.model_validate_json(path.read_bytes())
+
+
+def get_interval(state: PollState, polling_config: configuration.PollingConfig) -> float:
+    """
+    Interpolates the interval geometrically between the minimum (change rate of 1, each poll finds new items) and the
+    maximum (change rate of 0), so the interval grows by a similar factor with each poll without new items.
+
+    :param state: Polling state of the query.
+    :param polling_config: Polling configuration.
+
+    :return: Interval between polls of the query, in seconds.
+    """
+    min_interval = polling_config.min_interval_minutes * 60
+    max_interval = polling_config.max_interval_minutes * 60
+    return float(min_interval * (max_interval / min_interval) ** (1 - state.change_rate))
+
+
+def is_due(
+    cache_folder: pathlib.Path,
+    spider_name: str,
+    query: str,
+    polling_config: configuration.PollingConfig,
+    now: float,
+) -> bool:
+    """
+    :param cache_folder: Cache folder.
+    :param spider_name: Name of the spider.
+    :param query: Name of the query.
+    :param polling_config: Polling configuration.
+    :param now: Start time of the current run, in seconds.
+
+    :return: True if the query should be polled in the current run.
+    """
+    state = read_state(cache_folder, spider_name, query)
+    if state is None:
+        return True
+    return now - state.last_polled >= get_interval(state, polling_config) * (1 - DUE_TOLERANCE)
+
+
+def record_poll(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    cache_folder: pathlib.Path,
+    spider_name: str,
+    query: str,
+    new_items: int,
+    polling_config: configuration.PollingConfig,
+    now: float,
+) -> PollState:
+    """
+    Updates the query's change rate with the outcome of a poll.
+
+    :param cache_folder: Cache folder.
+    :param spider_name: Name of the spider.
+    :param query: Name of the query.
+    :param new_items: Number of new items, found by the poll.
+    :param polling_config: Polling configuration.
+    :param now: Start time of the current run, in seconds.
+
+    :return: Updated polling state.
+    """
+    path = cache.query_state_path(cache_folder, spider_name, query)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with cache.lock(path):
+        try:
+            previous = read_state(cache_folder, spider_name, query)
+        except pydantic.ValidationError:
+            # corrupt state (e.g. of an interrupted write by an older version) is replaced
+            previous = None
+        # queries are assumed to change on each poll until observed otherwise, so new queries start at min interval
+        change_rate = previous.change_rate if previous is not None else 1.0
+        changed = 1.0 if new_items else 0.0
+        state = PollState(
+            last_polled=now,
+            change_rate=polling_config.smoothing * changed + (1 - polling_config.smoothing) * change_rate,
+        )
+        cache.write_atomic(path, state.model_dump_json().encode("utf8"))
+    return state
@@ -0,0 +1,132 @@
+"""
+Optional per-spider profiling of crawler runs with cProfile and tracemalloc. cProfile only profiles the thread, on
+which it is enabled, and only one profiler can be enabled in a process, so work which is otherwise run in worker
+threads (concurrent queries and pages) is run sequentially in the profiled thread while a spider is profiled. Reports
+then attribute fetching and parsing to their callers, but do not show the effect of concurrency.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import contextlib
+import contextvars
+import cProfile
+import datetime
+import pathlib
+import tracemalloc
+from collections.abc import Callable, Iterator
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+# True within a profiled block
+_profiling: contextvars.ContextVar[bool] = contextvars.ContextVar("profiling", default=False)
+
+
+class _InlineExecutor(concurrent.futures.Executor):
+    """
+    Executor, which runs each task immediately in the submitting thread.
+    """
+
+    def submit(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> concurrent.futures.Future[T]:
+        future: concurrent.futures.Future[T] = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:  # pylint: disable=broad-except
+            future.set_exception(exc)
+        return future
+
+
+def create_executor(max_workers: int) -> concurrent.futures.Executor:
+    """
+    :param max_workers: Maximal number of concurrently run tasks.
+
+    :return: Thread pool executor, or an executor which runs tasks sequentially in the calling thread, if it is
+             called within a profiled block.
+    """
+    if _profiling.get():
+        return _InlineExecutor()
+    return concurrent.futures.ThreadPoolExecutor(max_workers)
+
+
+class Profiler:
+    """
+    Profiles spider runs and writes timestamped reports to the output directory. Only every n-th run is profiled,
+    other runs are executed without any profiling hooks installed.
+    """
+
+    def __init__(
+        self,
+        output_dir: pathlib.Path,
+        every: int = 1,
+        trace_memory: bool = False,
+        top_allocations: int = 25,
+    ) -> None:
+        """
+        :param output_dir: Directory, where '.pstats' files and allocation reports will be written.
+        :param every: Profile every n-th run (1 profiles all runs).
+        :param trace_memory: If True, allocations will also be traced with tracemalloc.
+        :param top_allocations: Number of top allocation sites to include in allocation reports.
+        """
+        self.output_dir = pathlib.Path(output_dir)
+        self.every = max(every, 1)
+        self.trace_memory = trace_memory
+        self.top_allocations = top_allocations
+
+        self._run_count = 0
+        self._run_timestamp = ""
+
+    @property
+    def active(self) -> bool:
+        """True if the current run is being profiled."""
+        return self._run_count > 0 and (self._run_count - 1) % self.every == 0
+
+    def start_run(self) -> bool:
+        """
+        Must be called at the beginning of each run. Decides whether the run will be profiled.
+
+        :return: True if the run will be profiled.
+        """
+        self._run_count += 1
+        self._run_timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        if self.active:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+        return self.active
+
+    @contextlib.contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        """
+        Profiles the wrapped block if the current run is being profiled.
+
+        :param name: Name of the profiled unit (e.g. spider name), used in the report file names.
+        """
+        if not self.active:
+            yield
+            return
+
+        profile = cProfile.Profile()
+        if self.trace_memory:
+            tracemalloc.start()
+
+        token = _profiling.set(True)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            _profiling.reset(token)
+
+            report_prefix = self.output_dir / f"{self._run_timestamp}_run{self._run_count}_{name}"
+            profile.dump_stats(report_prefix.with_name(report_prefix.name + ".pstats"))
+
+            if self.trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                self._write_allocations(snapshot, report_prefix.with_name(report_prefix.name + "_allocations.txt"))
+
+    def _write_allocations(self, snapshot: tracemalloc.Snapshot, path: pathlib.Path) -> None:
+        top_stats = snapshot.statistics("lineno")
+
+        with open(path, "w+", encoding="utf8") as file:
+            file.write(f"Top {self.top_allocations} allocation sites (total {len(top_stats)}):\n")
+            for stat in top_stats[: self.top_allocations]:
+                file.write(f"{stat}\n")
@@ -3,18 +3,89 @@ Main module. Runs defined crawler and send notifications to user, if any news ar
 """
 from __future__ import annotations
 
+import contextlib
+import contextvars
+import functools
 import json
+import logging
 import pathlib
-from typing import cast
+import time
+import traceback
+from collections.abc import Callable, Iterable
+from typing import ContextManager, Literal, NamedTuple, cast
 
+import pydantic
+
+from news_crawlers import cache
+from news_crawlers import coalescing
+from news_crawlers import dedup
+from news_crawlers import fetching
 from news_crawlers import notificators
 from news_crawlers import spiders
 from news_crawlers import configuration
+from news_crawlers import metrics
+from news_crawlers import polling
+from news_crawlers import profiling
+from news_crawlers import seenindex
+from news_crawlers import sinks
+from news_crawlers import tracking
+from news_crawlers import workqueue
 
 DEFAULT_CACHE_PATH = pathlib.Path("data") / ".nc_cache"
 
 CrawlData = dict[str, list[spiders.SpiderItem]]
 
+# notificator configuration keys, which only define how items are formatted, not where they are sent
+MESSAGE_FORMAT_KEYS = ("message_body_format", "send_separately")
+
+
+class OutgoingNotification(NamedTuple):
+    spider: str
+    notificator: str
+    items: list[spiders.SpiderItem]
+
+
+class ItemStore(NamedTuple):
+    """
+    Where spider's seen items are stored, and how crawled items are matched with them.
+    """
+
+    # index of seen items, if they are not stored in query cache files
+    seen_index: seenindex.SeenIndex | None = None
+    # field, which identifies an item, so its changes are tracked instead of it being reported as a new item
+    identity_key: str | None = None
+    # listings, found by spider's queries in the current run, if duplicates across queries are dropped
+    dedup_index: dedup.RunDedupIndex | None = None
+
+    def drop_duplicates(
+        self, query: str, crawled_items: list[spiders.SpiderItem], new_items: list[spiders.SpiderItem]
+    ) -> tuple[list[spiders.SpiderItem], int]:
+        """
+        :param query: Name of the query.
+        :param crawled_items: All items, found by the query.
+        :param new_items: New items of the query.
+
+        :return: New items without listings, which other queries have found earlier in the run, and number of
+                 dropped duplicate listings.
+        """
+        if self.dedup_index is None:
+            return new_items, 0
+        duplicates = self.dedup_index.claim(query, crawled_items)
+        return self.dedup_index.drop_duplicates(new_items, duplicates), len(duplicates)
+
+    def merge_queries(self, items: list[spiders.SpiderItem]) -> list[spiders.SpiderItem]:
+        """
+        :return: Items with names of all queries, which have found them (see dedup.RunDedupIndex.merge_queries).
+        """
+        return items if self.dedup_index is None else self.dedup_index.merge_queries(items)
+
+    def close(self) -> None:
+        if self.seen_index is not None:
+            self.seen_index.close()
+
+
+logger = logging.getLogger(__name__)
+
 
 def get_cached_items(cached_items_path: pathlib.Path) -> list[spiders.SpiderItem]:
     """
@@ -26,102 +97,794 @@ def get_cached_items(cached_items_path: pathlib.Path) -> list[spiders.SpiderItem
     :return: List of cached items. If specified file does not exist, an empty list
                                    will be returned.
     """
-    if cached_items_path.exists():
-        with open(cached_items_path, "r+", encoding="utf8") as cache_file:
-            cached_data = cast(list[spiders.SpiderItem], json.load(cache_file))
-    else:
-        cached_data = []
+    return cache.read_items(cached_items_path)
+
+
+class QueryReport(pydantic.BaseModel):  # pylint: disable=too-many-instance-attributes
+    spider: str
+    query: str
+    items: int = 0
+    new_items: int = 0
+    # number of known items (by identity key), whose fields have changed
+    changed_items: int = 0
+    # number of query's listings, which were dropped because another query has found them earlier in the run
+    duplicates: int = 0
+    duration: float = 0.0
+    # number of fetched pages (responses) and their size in bytes
+    pages: int = 0
+    bytes: int = 0
+    error: str | None = None
+    # query was not (fully) crawled because the deadline has passed
+    unfinished: bool = False
+
+
+class RunError(pydantic.BaseModel):
+    stage: Literal["crawl", "notify", "sink"]
+    spider: str
+    query: str | None = None
+    notificator: str | None = None
+    sink: str | None = None
+    error: str
+    traceback: str
+
+
+class RunReport(pydantic.BaseModel):
+    """
+    Report of a single run. Contains outcome of each crawled query and all errors, which occurred during the run.
+    """
 
-    return cached_data
+    started: float = pydantic.Field(default_factory=time.time)
+    duration: float = 0.0
+    queries: list[QueryReport] = []
+    errors: list[RunError] = []
+
+    def add_error(
+        self, exc: Exception, stage: Literal["crawl", "notify", "sink"], spider: str, **context: str
+    ) -> None:
+        """
+        Adds an error to the report.
+
+        :param exc: Exception which occurred.
+        :param stage: Stage of the run in which the error occurred.
+        :param spider: Name of the spider.
+        :param context: Additional context, 'query', 'notificator' or 'sink' name.
+        """
+        self.errors.append(
+            RunError(
+                stage=stage,
+                spider=spider,
+                error=f"{type(exc).__name__}: {exc}",
+                traceback="".join(traceback.format_exception(exc)),
+                **context,
+            )
+        )
+
+    def finish(self) -> None:
+        self.duration = time.time() - self.started
+
+    def merge(self, other: RunReport) -> None:
+        """
+        Adds queries and errors of another report (e.g. of a worker process) to this report.
+
+        :param other: Report to merge.
+        """
+        self.queries.extend(other.queries)
+        self.errors.extend(other.errors)
 
 
 def scrape(
     spiders_to_run: list[str],
     spiders_configuration: dict[str, configuration.SpiderConfig],
     cache_folder: pathlib.Path = DEFAULT_CACHE_PATH,
+    report: RunReport | None = None,
+    profiler: profiling.Profiler | None = None,
 ) -> CrawlData:
+    """
+    Run the specified spiders and commit newly found items to cache as soon as each query is crawled. Failure of a
+    spider or a query is recorded in the report and does not affect other spiders or queries.
+
+    :param spiders_to_run: List of spider names to run.
+    :param spiders_configuration: Map of spider name to its config (URLs, etc.).
+    :param cache_folder: Directory where cache files are stored.
+    :param report: Report, to which outcome of each query and errors are added.
+    :param profiler: Optional profiler, which profiles each spider's run separately.
+    :return: Map of spider name to list of new items.
+    """
+    if report is None:
+        report = RunReport()
 
-    # create cache folder in which *_cache.json files will be stored
+    # create cache folder, in which each spider's folder with query cache files will be stored
     if not cache_folder.exists():
         cache_folder.mkdir(parents=True, exist_ok=True)
 
-    return run_crawlers(spiders_configuration, spiders_to_run)
+    # polling intervals are measured between starts of runs, so that crawl durations do not shift them
+    started = time.time()
+    diff: CrawlData = {}
+    for spider_name in spiders_to_run:
+        profile_context = profiler.profile(spider_name) if profiler is not None else contextlib.nullcontext()
+        with metrics.labels(spider=spider_name), profile_context:
+            try:
+                spider_configuration = spiders_configuration[spider_name]
+                store = _open_item_store(cache_folder, spider_name, spider_configuration)
+            except Exception as exc:  # pylint: disable=broad-except
+                report.add_error(exc, "crawl", spider_name)
+                continue
+
+            try:
+                new_items = _crawl_spider(spider_name, spider_configuration, cache_folder, report, started, store)
+            finally:
+                store.close()
+            if new_items:
+                diff[spider_name] = new_items
 
+    return diff
 
-def run_crawlers(spiders_configuration: dict[str, configuration.SpiderConfig], spiders_to_run: list[str]) -> CrawlData:
+
+def _crawl_spider(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    spider_name: str,
+    spider_configuration: configuration.SpiderConfig,
+    cache_folder: pathlib.Path,
+    report: RunReport,
+    started: float,
+    store: ItemStore,
+) -> list[spiders.SpiderItem]:
     """
-    Run the specified spiders with their configurations and return combined crawl results.
+    Crawls spider's due queries and updates their polling state.
 
-    :param spiders_configuration: Map of spider name to its config (URLs, etc.).
+    :return: New items of all crawled queries.
+    """
+    try:
+        spider = _create_spider(spider_name, spider_configuration, cache_folder, store.seen_index)
+    except Exception as exc:  # pylint: disable=broad-except
+        report.add_error(exc, "crawl", spider_name)
+        return []
+
+    polling_config = spider_configuration.polling
+    queries = _get_due_queries(spider_name, list(spider.queries), polling_config, cache_folder, started)
+    first_report = len(report.queries)
+    new_items: list[spiders.SpiderItem] = []
+    try:
+        with fetching.deadline(spider_configuration.deadline_seconds):
+            for query_new_items in _crawl_queries(spider, spider_name, queries, cache_folder, report, store):
+                new_items.extend(query_new_items)
+    finally:
+        spider.close()
+
+    _record_polls(report.queries[first_report:], polling_config, cache_folder, started)
+    return store.merge_queries(new_items)
+
+
+def _open_item_store(
+    cache_folder: pathlib.Path,
+    spider_name: str,
+    spider_configuration: configuration.SpiderConfig,
+) -> ItemStore:
+    """
+    :return: Store of spider's seen items.
+    """
+    seen_index = None
+    if spider_configuration.seen_index is not None:
+        spider_folder = cache.spider_folder(cache_folder, spider_name)
+        seen_index = seenindex.SeenIndex(spider_folder, spider_configuration.seen_index)
+    dedup_index = None
+    if spider_configuration.dedup_key is not None:
+        dedup_index = dedup.RunDedupIndex(spider_configuration.dedup_key)
+    return ItemStore(seen_index, spider_configuration.identity_key, dedup_index)
+
+
+def _create_spider(
+    spider_name: str,
+    spider_configuration: configuration.SpiderConfig,
+    cache_folder: pathlib.Path,
+    seen_index: seenindex.SeenIndex | None = None,
+) -> spiders.Spider:
+    """
+    Creates a spider of the configured type (or the one named as the spider) from its configuration. Spider keeps its
+    state in the cache folder and, if configured to stop paginating at seen pages, looks up seen items of its queries
+    in the cache (or in the seen index).
+    """
+    all_seen: Callable[[str, list[spiders.SpiderItem]], bool] | None = None
+    if spider_configuration.stop_at_seen_page:
+        all_seen = seen_index.all_seen if seen_index is not None else _get_cached_items_check(cache_folder, spider_name)
+    spider_class = spiders.get_spider_by_name(spider_configuration.type or spider_name)
+    return spider_class.from_config(spider_configuration, cache_folder, all_seen)
+
+
+def _get_cached_items_check(
+    cache_folder: pathlib.Path, spider_name: str
+) -> Callable[[str, list[spiders.SpiderItem]], bool]:
+    """
+    :return: Function, which returns True if all given items of a query are cached. Cache of each query is read once.
+    """
+    cached_keys: dict[str, set[str]] = {}
+
+    def all_cached(query: str, items: list[spiders.SpiderItem]) -> bool:
+        if query not in cached_keys:
+            cached_keys[query] = {
+                json.dumps(item, sort_keys=True) for item in cache.read_query_items(cache_folder, spider_name, query)
+            }
+        return all(json.dumps(item, sort_keys=True) in cached_keys[query] for item in items)
+
+    return all_cached
+
+
+def _get_due_queries(
+    spider_name: str,
+    queries: list[str],
+    polling_config: configuration.PollingConfig | None,
+    cache_folder: pathlib.Path,
+    now: float,
+) -> list[str]:
+    """
+    :return: Queries, which should be polled in the current run. All queries are due, if polling is not adaptive.
+             Queries, whose polling state can not be read, are due as well, so they are not skipped indefinitely.
+    """
+    if polling_config is None:
+        return queries
+
+    due_queries = []
+    for query in queries:
+        try:
+            due = polling.is_due(cache_folder, spider_name, query, polling_config, now)
+        except Exception:  # pylint: disable=broad-except
+            logger.warning(
+                "Could not read polling state of query %s:%s, polling it.", spider_name, query, exc_info=True
+            )
+            due = True
+        if due:
+            due_queries.append(query)
+        else:
+            logger.debug("Query %s:%s is not due yet, skipping it.", spider_name, query)
+    return due_queries
+
+
+def _record_polls(
+    query_reports: list[QueryReport],
+    polling_config: configuration.PollingConfig | None,
+    cache_folder: pathlib.Path,
+    now: float,
+) -> None:
+    """
+    Updates polling state of crawled queries, if polling is adaptive. Queries, which have failed or were not finished,
+    remain due. Failure to update the state of a query is logged and does not affect other queries.
+    """
+    if polling_config is None:
+        return
+
+    for query_report in query_reports:
+        if query_report.error is not None:
+            continue
+        try:
+            state = polling.record_poll(
+                cache_folder, query_report.spider, query_report.query, query_report.new_items, polling_config, now
+            )
+        except Exception:  # pylint: disable=broad-except
+            logger.warning(
+                "Could not update polling state of query %s:%s.", query_report.spider, query_report.query, exc_info=True
+            )
+            continue
+        logger.debug(
+            "Query %s:%s will be polled again in %.1f minutes.",
+            query_report.spider,
+            query_report.query,
+            polling.get_interval(state, polling_config) / 60,
+        )
+
+
+def _crawl_queries(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    spider: spiders.Spider,
+    spider_name: str,
+    queries: list[str],
+    cache_folder: pathlib.Path,
+    report: RunReport,
+    store: ItemStore = ItemStore(),
+) -> list[list[spiders.SpiderItem]]:
+    """
+    Crawls given queries of the spider, running up to spider's 'max_concurrent_queries' of them at the same time.
+
+    :return: New items of each query, in order of given queries.
+    """
+    if spider.max_concurrent_queries <= 1 or len(queries) <= 1:
+        return [
+            _crawl_query(spider, spider_name, query, cache_folder, report, store=store) for query in queries
+        ]
+
+    with profiling.create_executor(spider.max_concurrent_queries) as executor:
+        # each query runs in a copy of the current context, so that it keeps the spider's metric labels
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                _crawl_query,
+                spider,
+                spider_name,
+                query,
+                cache_folder,
+                report,
+                contextlib.nullcontext,
+                store,
+            )
+            for query in queries
+        ]
+        return [future.result() for future in futures]
+
+
+def scrape_queue(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    queue: workqueue.WorkQueue,
+    tick: int,
+    spiders_to_run: list[str],
+    spiders_configuration: dict[str, configuration.SpiderConfig],
+    cache_folder: pathlib.Path = DEFAULT_CACHE_PATH,
+    report: RunReport | None = None,
+) -> CrawlData:
+    """
+    Enqueues queries of the specified spiders as units of a tick, then claims units from the work queue and crawls
+    them, until no units are left. Several workers (processes or hosts) can process the same tick in parallel, each
+    unit is crawled and committed to cache by only one of them.
+
+    :param queue: Work queue, shared by all workers.
+    :param tick: Tick, whose units will be crawled.
     :param spiders_to_run: List of spider names to run.
-    :return: Map of spider name to list of scraped items.
+    :param spiders_configuration: Map of spider name to its config (URLs, etc.).
+    :param cache_folder: Directory where cache files are stored, shared by all workers.
+    :param report: Report, to which outcome of each query crawled by this worker and errors are added.
+    :return: Map of spider name to list of new items, found by this worker.
+    """
+    if report is None:
+        report = RunReport()
+
+    cache_folder.mkdir(parents=True, exist_ok=True)
+
+    started = time.time()
+    _enqueue_tick(queue, tick, spiders_to_run, spiders_configuration, cache_folder, report, started)
+
+    owner = workqueue.default_owner()
+    diff: CrawlData = {}
+    spider_instances: dict[str, spiders.Spider] = {}
+    stores: dict[str, ItemStore] = {}
+    try:
+        # units are not claimed after the run's deadline has passed, other workers or the next tick can crawl them
+        while not fetching.deadline_exceeded() and (unit := queue.claim(tick, owner, spiders_to_run)) is not None:
+            with metrics.labels(spider=unit.spider):
+                try:
+                    if unit.spider not in stores:
+                        stores[unit.spider] = _open_item_store(
+                            cache_folder, unit.spider, spiders_configuration[unit.spider]
+                        )
+                    if unit.spider not in spider_instances:
+                        spider_instances[unit.spider] = _create_spider(
+                            unit.spider,
+                            spiders_configuration[unit.spider],
+                            cache_folder,
+                            stores[unit.spider].seen_index,
+                        )
+                except Exception as exc:  # pylint: disable=broad-except
+                    report.add_error(exc, "crawl", unit.spider, query=unit.query)
+                    queue.fail(unit, f"{type(exc).__name__}: {exc}")
+                    continue
+
+                new_items = _crawl_query(
+                    spider_instances[unit.spider],
+                    unit.spider,
+                    unit.query,
+                    cache_folder,
+                    report,
+                    functools.partial(queue.committing, unit),
+                    stores[unit.spider],
+                )
+
+            if report.queries[-1].error is not None:
+                queue.fail(unit, report.queries[-1].error)
+            elif new_items:
+                diff.setdefault(unit.spider, []).extend(new_items)
+
+            _record_polls(report.queries[-1:], spiders_configuration[unit.spider].polling, cache_folder, started)
+    finally:
+        _close_spiders(spider_instances.values(), stores.values())
+
+    return {spider_name: stores[spider_name].merge_queries(items) for spider_name, items in diff.items()}
+
+
+def _close_spiders(spider_instances: Iterable[spiders.Spider], stores: Iterable[ItemStore]) -> None:
+    for spider in spider_instances:
+        spider.close()
+    for store in stores:
+        store.close()
+
+
+def _enqueue_tick(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    queue: workqueue.WorkQueue,
+    tick: int,
+    spiders_to_run: list[str],
+    spiders_configuration: dict[str, configuration.SpiderConfig],
+    cache_folder: pathlib.Path,
+    report: RunReport,
+    now: float,
+) -> None:
+    """
+    Enqueues due queries of the specified spiders as units of the tick.
     """
-    crawled_data: CrawlData = {}
+    units: list[tuple[str, str]] = []
     for spider_name in spiders_to_run:
-        spider_configuration = spiders_configuration[spider_name]
+        if spider_name in spiders_configuration:
+            spider_configuration = spiders_configuration[spider_name]
+            queries = _get_due_queries(
+                spider_name, list(spider_configuration.urls), spider_configuration.polling, cache_folder, now
+            )
+            units.extend((spider_name, query) for query in queries)
+        else:
+            report.add_error(KeyError(spider_name), "crawl", spider_name)
+    queue.enqueue(tick, units)
+
+
+def _crawl_query(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    spider: spiders.Spider,
+    spider_name: str,
+    query: str,
+    cache_folder: pathlib.Path,
+    report: RunReport,
+    committing: Callable[[], ContextManager[None]] = contextlib.nullcontext,
+    store: ItemStore = ItemStore(),
+) -> list[spiders.SpiderItem]:
+    """
+    Crawls a single query and commits its new items to cache.
 
-        spider = spiders.get_spider_by_name(spider_name)(spider_configuration.urls)
+    :param committing: Returns context, within which new items are committed to cache (e.g. work queue lease).
+    :param store: Store of spider's seen items.
+    :return: New (and changed) items.
+    """
+    query_report = QueryReport(spider=spider_name, query=query)
+    report.queries.append(query_report)
+
+    if fetching.deadline_exceeded():
+        query_report.unfinished = True
+        query_report.error = "DeadlineExceededError: Deadline exceeded before the query was started."
+        return []
+
+    start = time.perf_counter()
+    interruption: Exception | None = None
+    try:
+        with metrics.labels(query=query), metrics.tally() as fetch_tally:
+            try:
+                items = spider.run_query(query, spider.queries[query])
+            except spiders.PartialCrawlError as exc:
+                # items found until the crawl was interrupted are committed, the query is reported as unfinished
+                items, interruption = exc.items, exc
+            finally:
+                query_report.pages, query_report.bytes = fetch_tally.pages, fetch_tally.bytes
+            metrics.inc("news_crawlers_items_total", len(items))
+        with committing():
+            new_items = check_diff(cache_folder, spider_name, query, items, store)
+        new_items, query_report.duplicates = store.drop_duplicates(query, items, new_items)
+        metrics.inc("news_crawlers_duplicate_items_total", query_report.duplicates)
+    except fetching.DeadlineExceededError as exc:
+        query_report.unfinished = True
+        query_report.error = f"{type(exc).__name__}: {exc}"
+        new_items = []
+    except Exception as exc:  # pylint: disable=broad-except
+        query_report.error = f"{type(exc).__name__}: {exc}"
+        report.add_error(exc, "crawl", spider_name, query=query)
+        new_items = []
+    else:
+        query_report.items = len(items)
+        query_report.changed_items = sum(tracking.is_change(item) for item in new_items)
+        query_report.new_items = len(new_items) - query_report.changed_items
+        if interruption is not None:
+            query_report.unfinished = True
+            query_report.error = f"{type(interruption).__name__}: {interruption}"
+    finally:
+        query_report.duration = time.perf_counter() - start
 
-        crawled_data[spider_name] = spider.run()
-    return crawled_data
+    return new_items
 
 
 def check_diff(
     cache_folder: pathlib.Path,
-    crawled_data: CrawlData,
-) -> CrawlData:
-    diff: CrawlData = {}
-    for spider_name, crawled_spider_items in crawled_data.items():
-        cache_file = pathlib.Path(cache_folder) / f"{spider_name}_cached.json"
+    spider_name: str,
+    query: str,
+    crawled_items: list[spiders.SpiderItem],
+    store: ItemStore = ItemStore(),
+) -> list[spiders.SpiderItem]:
+    """
+    Compares crawled items of a query with its cache and adds new items to the cache.
+
+    :param cache_folder: Directory where cache files are stored.
+    :param spider_name: Name of the spider.
+    :param query: Name of the query.
+    :param crawled_items: Items, found by the query.
+    :param store: Store of spider's seen items. If it has an index, it is used instead of the query's cache file. If
+                  it has an identity key, cached items, whose fields have changed, are updated and returned as well.
+
+    :return: New (previously not cached) items, followed by changed items (see tracking.diff_items).
+    """
+    seen_index = store.seen_index
+    # hold the lock for the whole read-diff-write cycle, so that concurrent runs do not lose each other's items
+    with cache.lock(cache.spider_folder(cache_folder, spider_name)):
+        if seen_index is not None:
+            # items of queries, which were cached before the index was enabled, are moved to the index
+            if not seen_index.has_query(query):
+                seen_index.add_new(query, cache.read_query_items(cache_folder, spider_name, query))
+            new_items = seen_index.add_new(query, crawled_items)
+            metrics.inc("news_crawlers_new_items_total", len(new_items), spider=spider_name)
+            return new_items
 
         # get previously crawled cached items
-        cached_spider_data = get_cached_items(cache_file)
+        cached_items = cache.read_query_items(cache_folder, spider_name, query)
+
+        if store.identity_key is not None:
+            tracked = tracking.diff_items(cached_items, crawled_items, store.identity_key)
+            new_items, cached_items, modified = tracked.items, tracked.cached_items, tracked.modified
+        else:
+            new_items = [item for item in crawled_items if item not in cached_items]
+            cached_items, modified = cached_items + new_items, bool(new_items)
+
+        metrics.inc(
+            "news_crawlers_new_items_total",
+            sum(not tracking.is_change(item) for item in new_items),
+            spider=spider_name,
+        )
 
-        new_data = [item for item in crawled_spider_items if item not in cached_spider_data]
+        # if new items have been found, add that data to cached items (query's cache file is always created on first
+        # run, so that items migrated from legacy cache are stored with the query)
+        if modified or not cache.query_path(cache_folder, spider_name, query).exists():
+            cache.write_query_items(cache_folder, spider_name, query, cached_items)
 
-        # if new items have been found, add that data to cached items
-        if new_data:
-            diff[spider_name] = new_data
-            # write old + new items to cache file
-            with open(cache_file, "w+", encoding="utf8") as file:
-                json.dump(cached_spider_data + new_data, file)
+    return new_items
 
-    return diff
 
+def select_queries(
+    spiders_configuration: dict[str, configuration.SpiderConfig],
+    selection: list[str],
+) -> dict[str, configuration.SpiderConfig]:
+    """
+    Returns configuration with only the selected queries left in spiders' URLs.
+
+    :param spiders_configuration: Map of spider name to its config.
+    :param selection: Selected queries, either as 'spider:query' or as 'query', which selects the query of any spider.
+
+    :return: Map of spider name to its config, with unselected queries removed.
+    """
+    selected_configuration = {}
+    for spider_name, spider_configuration in spiders_configuration.items():
+        urls = {
+            query: url
+            for query, url in spider_configuration.urls.items()
+            if query in selection or f"{spider_name}:{query}" in selection
+        }
+        selected_configuration[spider_name] = spider_configuration.model_copy(update={"urls": urls})
+    return selected_configuration
+
+
+def prune_cache(
+    cache_folder: pathlib.Path,
+    spiders_to_run: list[str],
+    spiders_configuration: dict[str, configuration.SpiderConfig],
+) -> None:
+    """
+    Removes cached items of queries, which have been removed from spiders' configuration.
+
+    :param cache_folder: Directory where cache files are stored.
+    :param spiders_to_run: Names of spiders, whose cache will be pruned.
+    :param spiders_configuration: Map of spider name to its config.
+    """
+    for spider_name in spiders_to_run:
+        if spider_name in spiders_configuration:
+            queries = spiders_configuration[spider_name].urls
+            for query in cache.prune(cache_folder, spider_name, queries):
+                logger.info("Removed cache of query %s:%s, which is no longer configured.", spider_name, query)
+            for query in seenindex.prune(cache.spider_folder(cache_folder, spider_name), queries):
+                logger.info("Removed seen items of query %s:%s, which is no longer configured.", spider_name, query)
+
+
+def write_sinks(
+    diff: CrawlData,
+    spiders_configuration: dict[str, configuration.SpiderConfig],
+    report: RunReport | None = None,
+) -> None:
+    """
+    Writes new items of all spiders to their configured sinks. Items of spiders, which configure the same sink (sink
+    type and configuration), are written to it in a single batch.
 
-def notify(diff: CrawlData, spiders_configuration: dict[str, configuration.SpiderConfig]) -> None:
+    :param diff: Map of spider name to list of new items.
+    :param spiders_configuration: Map of spider name to its config (including sinks).
+    :param report: Report, to which sink errors are added. If None, errors are raised.
+    :raises Exception: If any of the sinks fails to write the items and no report is given.
+    """
+    targets: dict[tuple[str, str], tuple[dict[str, str | bool], list[sinks.SinkRecord]]] = {}
+    for spider_name, spider_configuration in spiders_configuration.items():
+        new_items = diff.get(spider_name, [])
+        if not new_items:
+            continue
+        for sink_name, sink_config in spider_configuration.sinks.items():
+            target = targets.setdefault((sink_name, json.dumps(sink_config, sort_keys=True)), (sink_config, []))
+            target[1].extend(sinks.SinkRecord(spider_name, item) for item in new_items)
+
+    for (sink_name, _), (sink_config, records) in targets.items():
+        try:
+            with metrics.timer("news_crawlers_sink_seconds", sink=sink_name):
+                sinks.get_sink(sink_name, sink_config).write(records)
+        except Exception as exc:  # pylint: disable=broad-except
+            metrics.inc("news_crawlers_sink_failures_total", sink=sink_name)
+            if report is None:
+                raise
+            for spider_name in dict.fromkeys(record.spider for record in records):
+                report.add_error(exc, "sink", spider_name, sink=sink_name)
+
+
+def notify(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    diff: CrawlData,
+    spiders_configuration: dict[str, configuration.SpiderConfig],
+    report: RunReport | None = None,
+    digest: bool = False,
+    buffer: coalescing.NotificationBuffer | None = None,
+) -> None:
     """
     Send notifications for each spider that has new items, using that spider's configured notificators.
 
     :param diff: Map of spider name to list of new items.
     :param spiders_configuration: Map of spider name to its config (including notifications).
+    :param report: Report, to which notification errors are added. If None, errors are raised.
+    :param digest: If True, new items of all spiders are sent in a single message per notification target, see
+                   'send_digests'.
+    :param buffer: Buffer of notificators, whose notifications are coalesced (see spider's 'coalesce' config). If
+                   None, new items are sent immediately.
+    """
+    outgoing = get_outgoing_notifications(diff, spiders_configuration, buffer, report)
+    if digest:
+        sent = send_digests(outgoing, spiders_configuration, report)
+    else:
+        sent = []
+        for notification in outgoing:
+            notificator_config = spiders_configuration[notification.spider].notifications[notification.notificator]
+            if send_notifications(
+                {notification.notificator: notificator_config}, notification.spider, notification.items, report
+            ):
+                sent.append(notification)
+
+    if buffer is not None:
+        # pending coalesced items are removed only once they have been sent, failed sends are retried next run
+        for notification in sent:
+            if notification.notificator in spiders_configuration[notification.spider].coalesce:
+                buffer.acknowledge(notification.spider, notification.notificator)
+
+
+def get_outgoing_notifications(
+    diff: CrawlData,
+    spiders_configuration: dict[str, configuration.SpiderConfig],
+    buffer: coalescing.NotificationBuffer | None = None,
+    report: RunReport | None = None,
+) -> list[OutgoingNotification]:
+    """
+    Returns items, which should be sent by each spider's notificator now. Items of notificators, whose
+    notifications are coalesced, are added to the buffer instead, until the buffer is due or an item is urgent.
+
+    :param diff: Map of spider name to list of new items.
+    :param spiders_configuration: Map of spider name to its config (including notifications).
+    :param buffer: Buffer of coalesced notifications. If None, all new items are sent immediately.
+    :param report: Report, to which coalescing errors (e.g. of a corrupt buffer) are added, so that they only prevent
+                   notifications of the affected notificator. If None, errors are raised.
+
+    :return: Spider name, notificator name and items to send, for each notificator which has items to send.
+
+    :raises Exception: If coalescing of any of the notificators fails and no report is given.
+    """
+    outgoing = []
+    for spider_name, spider_configuration in spiders_configuration.items():
+        new_items = tracking.select_notified(diff.get(spider_name, []), spider_configuration.notify_on)
+        for notificator_type_str in spider_configuration.notifications:
+            coalesce_config = spider_configuration.coalesce.get(notificator_type_str)
+            if buffer is not None and coalesce_config is not None:
+                try:
+                    items = buffer.coalesce(spider_name, notificator_type_str, new_items, coalesce_config)
+                except Exception as exc:  # pylint: disable=broad-except
+                    if report is None:
+                        raise
+                    report.add_error(exc, "notify", spider_name, notificator=notificator_type_str)
+                    continue
+            else:
+                items = new_items
+            if items:
+                outgoing.append(OutgoingNotification(spider_name, notificator_type_str, items))
+    return outgoing
+
+
+def send_digests(
+    outgoing: list[OutgoingNotification],
+    spiders_configuration: dict[str, configuration.SpiderConfig],
+    report: RunReport | None = None,
+) -> list[OutgoingNotification]:
+    """
+    Send items of all spiders as digests. Spiders, whose notificators have the same target (notificator type and
+    configuration other than message format), are grouped together, and a single message with a section for each
+    spider is sent to each target, through a single notificator instance.
+
+    :param outgoing: Items to send by each spider's notificator.
+    :param spiders_configuration: Map of spider name to its config (including notifications).
+    :param report: Report, to which notification errors are added. If None, errors are raised.
+
+    :return: Notifications, which have been sent.
+
+    :raises Exception: If any of the notificators fails to send the digest and no report is given.
     """
-    for spider_name, new_data in diff.items():
-        send_notifications(spiders_configuration[spider_name].notifications, spider_name, new_data)
+    sent: list[OutgoingNotification] = []
+    targets: dict[tuple[str, str], list[tuple[OutgoingNotification, dict[str, str | bool]]]] = {}
+    for notification in outgoing:
+        notificator_data = spiders_configuration[notification.spider].notifications[notification.notificator]
+        target_data = {key: val for key, val in notificator_data.items() if key not in MESSAGE_FORMAT_KEYS}
+        target = (notification.notificator, json.dumps(target_data, sort_keys=True))
+        targets.setdefault(target, []).append((notification, notificator_data))
+
+    for (notificator_type_str, _), notifications_data in targets.items():
+        spider_names = [notification.spider for notification, _ in notifications_data]
+        try:
+            notificator = notificators.get_notificator_by_name(notificator_type_str)(notifications_data[0][1])
+            try:
+                with metrics.timer("news_crawlers_notify_seconds", spider="digest", notificator=notificator_type_str):
+                    notificator.send_digest(
+                        f"News digest: {', '.join(spider_names)}",
+                        [
+                            notificators.DigestSection(
+                                notification.spider, notification.items, cast(str, data["message_body_format"])
+                            )
+                            for notification, data in notifications_data
+                        ],
+                    )
+            finally:
+                notificator.close()
+        except Exception as exc:  # pylint: disable=broad-except
+            metrics.inc("news_crawlers_notify_failures_total", spider="digest", notificator=notificator_type_str)
+            if report is None:
+                raise
+            for spider_name in spider_names:
+                report.add_error(exc, "notify", spider_name, notificator=notificator_type_str)
+        else:
+            sent.extend(notification for notification, _ in notifications_data)
+    return sent
 
 
 def send_notifications(
     notificators_config: dict[str, dict[str, str | bool]],
     spider_name: str,
     new_data: list[spiders.SpiderItem],
-) -> None:
+    report: RunReport | None = None,
+) -> bool:
     """
-    Send new items to all configured notificators (e.g. email, Pushover) for a single spider.
+    Send new items to all configured notificators (e.g. email, Pushover) for a single spider. If a report is given,
+    failure of one notificator is recorded in it and does not prevent the others from sending.
 
     :param notificators_config: Map of notificator type name to its config (e.g. message_body_format).
     :param spider_name: Name of the spider (used in the notification subject/title).
     :param new_data: List of new items to send.
+    :param report: Report, to which notification errors are added. If None, errors are raised.
+
+    :return: True if all notificators have sent the items.
+
+    :raises Exception: If any of the notificators fails to send the items and no report is given.
     """
+    sent = True
     # send message with each configured notificator
     for (notificator_type_str, notificator_data) in notificators_config.items():
-        notificator = notificators.get_notificator_by_name(notificator_type_str)(notificator_data)
-
-        message_body_format = cast(str, notificator_data["message_body_format"])
-        send_separately = cast(bool, notificator_data.get("send_separately", False))
-
-        notificator.send_items(
-            spider_name + " news",
-            new_data,
-            message_body_format,
-            send_separately=send_separately,
-        )
+        try:
+            notificator = notificators.get_notificator_by_name(notificator_type_str)(notificator_data)
+
+            message_body_format = cast(str, notificator_data["message_body_format"])
+            send_separately = cast(bool, notificator_data.get("send_separately", False))
+
+            try:
+                with metrics.timer(
+                    "news_crawlers_notify_seconds", spider=spider_name, notificator=notificator_type_str
+                ):
+                    notificator.send_items(
+                        spider_name + " news",
+                        new_data,
+                        message_body_format,
+                        send_separately=send_separately,
+                    )
+            finally:
+                notificator.close()
+        except Exception as exc:  # pylint: disable=broad-except
+            metrics.inc("news_crawlers_notify_failures_total", spider=spider_name, notificator=notificator_type_str)
+            if report is None:
+                raise
+            report.add_error(exc, "notify", spider_name, notificator=notificator_type_str)
+            sent = False
+    return sent
@@ -0,0 +1,283 @@
+"""
+Index of seen items for spiders with very large numbers of items (e.g. archive-style queries), which does not need to
+load all seen items of a query on each run. Seen items are stored in an exact on-disk index (SQLite database, keyed
+by a digest of the query and item), in front of which is a memory-mapped Bloom filter. Items, which are not in the
+filter, are definitely new and are not looked up in the database at all. Only items which may have been seen are
+looked up, a small share of them (configured false positive rate) turns out to be new.
+
+Both files are stored in the spider's cache folder, 'seen.sqlite' and 'seen.bloom'. The filter is rebuilt from the
+database if it is missing or its configuration has changed.
+"""
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import pathlib
+import sqlite3
+import struct
+import tempfile
+from collections.abc import Collection, Iterator
+
+from news_crawlers import configuration
+from news_crawlers import metrics
+
+Item = dict[str, str]
+
+INDEX_FILE_NAME = "seen.sqlite"
+FILTER_FILE_NAME = "seen.bloom"
+
+# magic, number of hash functions and number of bits
+_HEADER = struct.Struct("<4sIQ")
+_MAGIC = b"NCBF"
+
+# maximum number of digests in a single lookup query
+_LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    digest BLOB PRIMARY KEY,
+    query TEXT NOT NULL,
+    item TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    query TEXT PRIMARY KEY
+);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def get_digest(query: str, item: Item) -> bytes:
+    """
+    :param query: Name of the query, which has found the item.
+    :param item: Item.
+
+    :return: Digest, which identifies the item within the spider's queries.
+    """
+    return hashlib.blake2b(json.dumps([query, item], sort_keys=True).encode("utf8"), digest_size=16).digest()
+
+
+@contextlib.contextmanager
+def _connect(path: pathlib.Path) -> Iterator[sqlite3.Connection]:
+    connection = sqlite3.connect(path, timeout=60.0)
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+class BloomFilter:
+    """
+    Bloom filter, stored in a memory-mapped file. Changes are visible to other processes, which have mapped the same
+    file. Callers must serialize modifications (e.g. with the spider's cache lock).
+    """
+
+    def __init__(self, path: pathlib.Path, capacity: int, false_positive_rate: float) -> None:
+        """
+        Opens the filter, or creates an empty one if the file does not exist or was created with different
+        parameters, in which case 'created' is set.
+
+        :param path: Path of the filter file.
+        :param capacity: Expected number of items.
+        :param false_positive_rate: Probability that an item, which was not added, is reported as possibly added, once
+                                    the filter holds 'capacity' items.
+        """
+        self.path = pathlib.Path(path)
+        self.num_bits = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.created = not self._matches()
+        if self.created:
+            self._create()
+
+        with open(self.path, "r+b") as file:
+            self._map = mmap.mmap(file.fileno(), 0)
+
+    def _matches(self) -> bool:
+        if not self.path.exists():
+            return False
+        with open(self.path, "rb") as file:
+            header = file.read(_HEADER.size)
+        return len(header) == _HEADER.size and _HEADER.unpack(header) == (_MAGIC, self.num_hashes, self.num_bits)
+
+    def _create(self) -> None:
+        file_descriptor, tmp_name = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name + ".", suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as tmp_file:
+                tmp_file.write(_HEADER.pack(_MAGIC, self.num_hashes, self.num_bits))
+                tmp_file.truncate(_HEADER.size + math.ceil(self.num_bits / 8))
+            os.replace(tmp_name, self.path)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_name)
+
+    def _positions(self, digest: bytes) -> Iterator[int]:
+        # double hashing, both hashes are taken from the (uniformly distributed) digest
+        first, second = struct.unpack_from("<QQ", digest)
+        for index in range(self.num_hashes):
+            yield (first + index * second) % self.num_bits
+
+    def add(self, digest: bytes) -> None:
+        """
+        :param digest: Digest of an item, at least 16 bytes long.
+        """
+        for position in self._positions(digest):
+            self._map[_HEADER.size + position // 8] |= 1 << (position % 8)
+
+    def might_contain(self, digest: bytes) -> bool:
+        """
+        :param digest: Digest of an item, at least 16 bytes long.
+
+        :return: False if the item has definitely not been added, True if it may have been added.
+        """
+        return all(
+            self._map[_HEADER.size + position // 8] & (1 << (position % 8)) for position in self._positions(digest)
+        )
+
+    def flush(self) -> None:
+        """
+        Writes changes of the filter to its file.
+        """
+        self._map.flush()
+
+    def close(self) -> None:
+        if not self._map.closed:
+            self._map.flush()
+            self._map.close()
+
+
+class SeenIndex:
+    """
+    Seen items of a spider's queries. Callers must hold the spider's cache lock while checking and adding items.
+    """
+
+    def __init__(self, folder: pathlib.Path, index_config: configuration.SeenIndexConfig) -> None:
+        """
+        :param folder: Spider's cache folder.
+        :param index_config: Configuration of the index.
+        """
+        self.folder = pathlib.Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+
+        self.bloom_filter = BloomFilter(
+            self.folder / FILTER_FILE_NAME, index_config.capacity, index_config.false_positive_rate
+        )
+        if self.bloom_filter.created:
+            self._rebuild_filter()
+
+    def _connect(self) -> contextlib.AbstractContextManager[sqlite3.Connection]:
+        # a new connection is opened for each operation, so the index can be used by concurrently crawled queries
+        return _connect(self.folder / INDEX_FILE_NAME)
+
+    def _rebuild_filter(self) -> None:
+        with self._connect() as connection:
+            num_items = 0
+            for (digest,) in connection.execute("SELECT digest FROM items"):
+                self.bloom_filter.add(digest)
+                num_items += 1
+        logger.info("Rebuilt filter of seen items in %s from %d items.", self.folder, num_items)
+
+    def has_query(self, query: str) -> bool:
+        """
+        :param query: Name of the query.
+
+        :return: True if items of the query have already been added to the index (possibly none).
+        """
+        with self._connect() as connection:
+            return connection.execute("SELECT 1 FROM queries WHERE query = ?", (query,)).fetchone() is not None
+
+    def _select_seen(self, connection: sqlite3.Connection, digests: list[bytes]) -> set[bytes]:
+        seen: set[bytes] = set()
+        for start in range(0, len(digests), _LOOKUP_BATCH):
+            batch = digests[start : start + _LOOKUP_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            seen.update(
+                digest
+                for (digest,) in connection.execute(f"SELECT digest FROM items WHERE digest IN ({placeholders})", batch)
+            )
+        return seen
+
+    def add_new(self, query: str, items: list[Item]) -> list[Item]:
+        """
+        Adds items, which have not been seen yet, to the index. New items are added to the filter (and the filter is
+        flushed) before they are committed to the database, so the filter never misses a committed item.
+
+        :param query: Name of the query, which has found the items.
+        :param items: Found items.
+
+        :return: New (previously not seen) items, without duplicates.
+        """
+        digests = {get_digest(query, item): item for item in items}
+        maybe_seen = [digest for digest in digests if self.bloom_filter.might_contain(digest)]
+
+        with self._connect() as connection:
+            seen = self._select_seen(connection, maybe_seen)
+            candidates = [digest for digest in digests if digest not in seen]
+            for digest in candidates:
+                self.bloom_filter.add(digest)
+            self.bloom_filter.flush()
+
+            # items, which were missed by the filter (e.g. of a filter file restored from a backup), are ignored
+            new_digests = [
+                digest
+                for digest in candidates
+                if connection.execute(
+                    "INSERT OR IGNORE INTO items (digest, query, item) VALUES (?, ?, ?)",
+                    (digest, query, json.dumps(digests[digest])),
+                ).rowcount
+            ]
+            connection.execute("INSERT OR IGNORE INTO queries (query) VALUES (?)", (query,))
+
+        metrics.inc("news_crawlers_seen_index_lookups_total", len(digests) - len(maybe_seen), result="new")
+        metrics.inc("news_crawlers_seen_index_lookups_total", len(seen), result="seen")
+        metrics.inc("news_crawlers_seen_index_lookups_total", len(maybe_seen) - len(seen), result="false_positive")
+        return [digests[digest] for digest in new_digests]
+
+    def all_seen(self, query: str, items: list[Item]) -> bool:
+        """
+        Only items, which the filter reports as possibly seen, are looked up in the database, so a page with a new
+        item is usually recognized without a lookup.
+
+        :param query: Name of the query.
+        :param items: Items, e.g. of a single page.
+
+        :return: True if all items have been seen by the query.
+        """
+        digests = list(dict.fromkeys(get_digest(query, item) for item in items))
+        if not all(self.bloom_filter.might_contain(digest) for digest in digests):
+            return False
+        with self._connect() as connection:
+            return len(self._select_seen(connection, digests)) == len(digests)
+
+    def close(self) -> None:
+        self.bloom_filter.close()
+
+
+def prune(folder: pathlib.Path, queries: Collection[str]) -> list[str]:
+    """
+    Removes seen items of queries, which are no longer configured. Their digests remain in the filter until it is
+    rebuilt, so they slightly increase its false positive rate.
+
+    :param folder: Spider's cache folder.
+    :param queries: Names of currently configured queries.
+
+    :return: Names of removed queries.
+    """
+    path = pathlib.Path(folder) / INDEX_FILE_NAME
+    if not path.exists():
+        return []
+
+    with _connect(path) as connection:
+        indexed = [query for (query,) in connection.execute("SELECT query FROM queries")]
+        removed = [query for query in indexed if query not in queries]
+        for query in removed:
+            connection.execute("DELETE FROM items WHERE query = ?", (query,))
+            connection.execute("DELETE FROM queries WHERE query = ?", (query,))
+    return removed
@@ -0,0 +1,110 @@
+"""
+Persistent storage of login sessions (cookie jars), so that spiders which require login do not need to log in on
+every run. Cookies are encrypted with a key derived from the account's password and are only stored if the optional
+'cryptography' package is installed (see the 'session' extra).
+"""
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import os
+import pathlib
+from typing import TYPE_CHECKING
+
+import requests.cookies
+
+from news_crawlers import cache
+
+if TYPE_CHECKING:
+    from cryptography.fernet import Fernet
+
+SALT_SIZE = 16
+KDF_ITERATIONS = 480000
+
+logger = logging.getLogger(__name__)
+
+
+def _get_cipher(password: str, salt: bytes) -> Fernet | None:
+    try:
+        # pylint: disable=import-outside-toplevel,redefined-outer-name
+        from cryptography.fernet import Fernet
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    except ImportError:
+        return None
+
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=KDF_ITERATIONS)
+    return Fernet(base64.urlsafe_b64encode(kdf.derive(password.encode("utf8"))))
+
+
+class SessionStore:
+    """
+    Encrypted file with cookies of a logged in session.
+    """
+
+    def __init__(self, path: pathlib.Path, password: str) -> None:
+        """
+        :param path: Path of the session file.
+        :param password: Password, from which the encryption key is derived. Stored session can not be loaded after
+                         the password changes, so a new login is performed.
+        """
+        self.path = pathlib.Path(path)
+        self._password = password
+
+    def load(self) -> requests.cookies.RequestsCookieJar | None:
+        """
+        :return: Stored cookies, or None if there is no stored session or it can not be decrypted.
+        """
+        if not self.path.exists():
+            return None
+
+        data = self.path.read_bytes()
+        cipher = _get_cipher(self._password, data[:SALT_SIZE])
+        if cipher is None:
+            return None
+
+        try:
+            cookies = json.loads(cipher.decrypt(data[SALT_SIZE:]))
+        except Exception:  # pylint: disable=broad-except
+            logger.info("Stored session %s could not be decrypted and will be replaced.", self.path)
+            return None
+
+        jar = requests.cookies.RequestsCookieJar()
+        for cookie in cookies:
+            jar.set(**cookie)
+        return jar
+
+    def save(self, cookies: requests.cookies.RequestsCookieJar) -> bool:
+        """
+        Stores cookies of a session.
+
+        :param cookies: Session's cookies.
+        :return: True if cookies were stored, False if encryption is not available.
+        """
+        salt = os.urandom(SALT_SIZE)
+        cipher = _get_cipher(self._password, salt)
+        if cipher is None:
+            logger.debug("Package 'cryptography' is not installed, login session is not stored.")
+            return False
+
+        serialized = [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "expires": cookie.expires,
+                "secure": cookie.secure,
+            }
+            for cookie in cookies
+        ]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        cache.write_atomic(self.path, salt + cipher.encrypt(json.dumps(serialized).encode("utf8")))
+        return True
+
+    def clear(self) -> None:
+        """
+        Removes stored session.
+        """
+        self.path.unlink(missing_ok=True)
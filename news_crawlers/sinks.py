@@ -0,0 +1,212 @@
+"""
+Output sinks, which deliver new items to other systems (e.g. a data pipeline), in addition to notificators, which
+notify users. Sinks are configured per spider, each sink writes all new items of a run in a single batch: a single
+write to a JSON lines file, a single SQLite transaction or a single HTTP POST request.
+
+Sinks are kept open between runs of the same process (e.g. scheduled runs), so their file handles, database
+connections and HTTP sessions are reused. Spiders, which configure the same sink target, share a sink instance and
+are written in the same batch.
+"""
+from __future__ import annotations
+
+import atexit
+import inspect
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import IO, NamedTuple, cast
+
+from news_crawlers import notificators
+
+SinkItem = dict[str, str]
+
+_sinks: dict[tuple[str, str], Sink] = {}
+_sinks_pid = os.getpid()  # pylint: disable=invalid-name
+
+
+class SinkRecord(NamedTuple):
+    spider: str
+    item: SinkItem
+
+
+def get_record_data(record: SinkRecord, written: float) -> dict[str, object]:
+    """
+    :param record: Record to write.
+    :param written: Time of writing, in seconds since epoch.
+
+    :return: Record as a JSON serializable dictionary.
+    """
+    return {"spider": record.spider, "written": written, "item": record.item}
+
+
+class Sink(ABC):
+    """
+    Sink base class. This class is meant to be subclassed for each output system.
+    """
+
+    # name, with which the sink is configured
+    name: str
+
+    def __init__(self, configuration: dict[str, str | bool]):
+        self.configuration = notificators.handle_secrets_in_configuration(configuration)
+
+    @abstractmethod
+    def write(self, records: list[SinkRecord]) -> None:
+        """
+        Writes records as a single batch.
+
+        :param records: New items, together with names of spiders which have found them.
+        """
+
+    def close(self) -> None:
+        """
+        Releases resources (e.g. connections) held by the sink.
+        """
+
+
+class JsonLinesSink(Sink):
+    """
+    Appends each record as a JSON object to a file, one record per line. Configuration: 'path' of the file.
+    """
+
+    name = "jsonl"
+
+    def __init__(self, configuration: dict[str, str | bool]) -> None:
+        super().__init__(configuration)
+        self.path = cast(str, self.configuration["path"])
+        self._file: IO[str] | None = None
+
+    def write(self, records: list[SinkRecord]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf8")  # pylint: disable=consider-using-with
+        written = time.time()
+        self._file.write(
+            "".join(json.dumps(get_record_data(record, written), ensure_ascii=False) + "\n" for record in records)
+        )
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SqliteSink(Sink):
+    """
+    Inserts records into a table of a SQLite database, which is created if it does not exist. Configuration: 'path'
+    of the database and optional 'table' name (default 'items').
+    """
+
+    name = "sqlite"
+
+    def __init__(self, configuration: dict[str, str | bool]) -> None:
+        super().__init__(configuration)
+        self.path = cast(str, self.configuration["path"])
+        self.table = cast(str, self.configuration.get("table", "items"))
+        if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", self.table) is None:
+            raise ValueError(f"Invalid SQLite sink table name '{self.table}'.")
+        self._connection: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=60.0)
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(spider TEXT NOT NULL, written REAL NOT NULL, item TEXT NOT NULL)"
+            )
+        return self._connection
+
+    def write(self, records: list[SinkRecord]) -> None:
+        connection = self._connect()
+        written = time.time()
+        with connection:
+            connection.executemany(
+                f"INSERT INTO {self.table} (spider, written, item) VALUES (?, ?, ?)",
+                [(record.spider, written, json.dumps(record.item, ensure_ascii=False)) for record in records],
+            )
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class WebhookSink(Sink):
+    """
+    Posts records as a JSON object with a list of 'records' to a URL. Configuration: 'url' and options of the webhook
+    client (see 'notificators.WebhookClient'): optional 'token', which is sent as a bearer token, 'retries',
+    'retry_backoff_seconds', 'max_backoff_seconds' and 'timeout_seconds'.
+    """
+
+    name = "webhook"
+
+    def __init__(self, configuration: dict[str, str | bool]) -> None:
+        super().__init__(configuration)
+        self.url = cast(str, self.configuration["url"])
+        self._client = notificators.WebhookClient(self.configuration)
+
+    def write(self, records: list[SinkRecord]) -> None:
+        written = time.time()
+        self._client.post(
+            self.url,
+            json.dumps({"records": [get_record_data(record, written) for record in records]}).encode("utf8"),
+        )
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def get_sink_by_name(name: str) -> type[Sink]:
+    """
+    Finds sink class with the 'name' attribute equal to the one specified.
+
+    :param name: Value of the 'name' attribute within the sink class to match.
+
+    :return: Sink class.
+
+    :raises KeyError: If sink could not be found.
+    """
+    for _, obj in inspect.getmembers(sys.modules[__name__], inspect.isclass):
+        if issubclass(obj, Sink) and obj is not Sink and obj.name == name:
+            return obj
+    raise KeyError(f"Could not find sink with name attribute set to {name}.")
+
+
+def get_sink(name: str, configuration: dict[str, str | bool]) -> Sink:
+    """
+    Returns an open sink with the given configuration, which is created on first call and reused by all following
+    calls (and runs) in the same process.
+
+    :param name: Name of the sink, e.g. 'jsonl'.
+    :param configuration: Sink configuration.
+
+    :return: Sink.
+    """
+    global _sinks_pid  # pylint: disable=global-statement
+
+    if os.getpid() != _sinks_pid:
+        # sinks of the parent process are not shared with forked processes (e.g. workers)
+        _sinks.clear()
+        _sinks_pid = os.getpid()
+
+    key = (name, json.dumps(configuration, sort_keys=True))
+    if key not in _sinks:
+        _sinks[key] = get_sink_by_name(name)(configuration)
+    return _sinks[key]
+
+
+def close_sinks() -> None:
+    """
+    Closes all open sinks.
+    """
+    if os.getpid() == _sinks_pid:
+        for sink in _sinks.values():
+            sink.close()
+    _sinks.clear()
+
+
+atexit.register(close_sinks)
@@ -1,25 +1,85 @@
 from __future__ import annotations
 
+import contextvars
 import os
 from abc import ABC, abstractmethod
 import sys
 import inspect
+import pathlib
+import threading
+import urllib.parse
 from collections.abc import Callable
+from typing import cast
 
 import bs4
 import requests
+import soupsieve
+
+from news_crawlers import configuration
+from news_crawlers import extraction
+from news_crawlers import fetching
+from news_crawlers import metrics
+from news_crawlers import profiling
+from news_crawlers import sessions
 
 SpiderItem = dict[str, str]
 
 
+class PartialCrawlError(Exception):
+    """
+    Raised when crawling of a query is interrupted after some of its pages have been crawled (e.g. because the
+    deadline has passed). Contains items, found until then.
+    """
+
+    def __init__(self, items: list[SpiderItem], cause: Exception) -> None:
+        super().__init__(f"Crawl was interrupted after {len(items)} items: {cause}")
+        self.items = items
+
+
 class Spider(ABC):
-    def __init__(self, queries: dict[str, str]) -> None:
+    # number of queries, which may be crawled at the same time (from separate threads)
+    max_concurrent_queries = 1
+
+    def __init__(
+        self,
+        queries: dict[str, str],
+        fetch_config: configuration.FetchConfig | None = None,
+        state_folder: pathlib.Path | None = None,
+        all_seen: Callable[[str, list[SpiderItem]], bool] | None = None,
+    ) -> None:
         """
         Constructs a spider. Spider has a "run" method, which will crawl all set queries when invoked.
 
         :param queries: Query name and url pairs to be crawled.
+        :param fetch_config: Fetch policy (timeout, retries, circuit breaker). Defaults are used if None.
+        :param state_folder: Folder, in which spider can keep its state between runs (e.g. login sessions). Nothing
+                             is kept if None.
+        :param all_seen: Returns True if all given items of a query have been seen in previous runs. If set,
+                         paginating spiders stop at the first page which contains only seen items, otherwise all pages
+                         are crawled.
         """
         self.queries = queries
+        self.fetcher = fetching.Fetcher(fetch_config)
+        self.state_folder = state_folder
+        self.all_seen = all_seen
+
+    @classmethod
+    def from_config(
+        cls,
+        spider_configuration: configuration.SpiderConfig,
+        state_folder: pathlib.Path | None = None,
+        all_seen: Callable[[str, list[SpiderItem]], bool] | None = None,
+    ) -> Spider:
+        """
+        Constructs a spider from its configuration.
+
+        :param spider_configuration: Spider's configuration.
+        :param state_folder: Folder, in which spider can keep its state between runs.
+        :param all_seen: Returns True if all given items of a query have been seen in previous runs.
+
+        :return: Spider.
+        """
+        return cls(spider_configuration.urls, spider_configuration.fetch, state_folder, all_seen)
 
     @property
     @abstractmethod
@@ -29,42 +89,150 @@ class Spider(ABC):
         the spiders from the CLI.
         """
 
-    @abstractmethod
     def run(self) -> list[SpiderItem]:
         """
         Runs crawling on all set queries.
         """
+        found_items: list[SpiderItem] = []
+        try:
+            for query, url in self.queries.items():
+                with metrics.labels(query=query):
+                    found_items.extend(self.run_query(query, url))
+        finally:
+            self.close()
+        return found_items
+
+    @abstractmethod
+    def run_query(self, query: str, url: str) -> list[SpiderItem]:
+        """
+        Crawls a single query. Queries are crawled independently, so that a failure of one query does not affect
+        the others.
+
+        :param query: Query name.
+        :param url: Query URL.
+
+        :return: Items found for the query.
+        """
+
+    def close(self) -> None:
+        """
+        Releases resources held by the spider (e.g. sessions). Called after all queries have been crawled.
+        """
+
+    def _crawl_pages(
+        self,
+        query: str,
+        page_urls: list[str],
+        first_page_items: list[SpiderItem],
+        crawl_page: Callable[[str, str], list[SpiderItem]],
+    ) -> list[SpiderItem]:
+        """
+        Crawls the remaining result pages of a query, whose number is known from the first page. Pages are fetched
+        concurrently, up to the host's 'max_in_flight' limit. If seen items are available, pages are instead crawled
+        one by one, until a page with only seen items is found. Results are expected to be sorted newest first, so
+        the following pages contain only items, which have been seen as well.
+
+        :param query: Query name.
+        :param page_urls: URLs of the remaining pages, in order.
+        :param first_page_items: Items, found on the first page.
+        :param crawl_page: Fetches and parses a single page, called with query name and page URL.
+
+        :return: Items of the crawled pages, in order of pages.
+        :raises PartialCrawlError: If the deadline has passed before all pages were crawled, contains items of the
+                                   first page and of all pages crawled before the first unfinished one.
+        """
+        if not page_urls:
+            return []
+        if self.all_seen is not None:
+            return self._crawl_pages_until_seen(query, page_urls, first_page_items, crawl_page)
+
+        found_items: list[SpiderItem] = []
+        host = urllib.parse.urlsplit(page_urls[0]).hostname or ""
+        max_workers = min(fetching.get_rate_limiter(host).config.max_in_flight, len(page_urls))
+        with profiling.create_executor(max_workers) as executor:
+            # each page is fetched in a copy of the current context, so that it keeps the query's metric labels and
+            # deadline
+            futures = [
+                executor.submit(contextvars.copy_context().run, crawl_page, query, page_url) for page_url in page_urls
+            ]
+            for future in futures:
+                try:
+                    found_items.extend(future.result())
+                except fetching.DeadlineExceededError as exc:
+                    for pending_future in futures:
+                        pending_future.cancel()
+                    raise PartialCrawlError(first_page_items + found_items, exc) from exc
+        return found_items
+
+    def _crawl_pages_until_seen(
+        self,
+        query: str,
+        page_urls: list[str],
+        first_page_items: list[SpiderItem],
+        crawl_page: Callable[[str, str], list[SpiderItem]],
+    ) -> list[SpiderItem]:
+        """
+        Crawls pages one by one, until a page with only seen items is found.
+
+        :raises PartialCrawlError: If the deadline has passed before all pages were crawled.
+        """
+        all_seen = cast(Callable[[str, list[SpiderItem]], bool], self.all_seen)
+
+        found_items: list[SpiderItem] = []
+        page_items = first_page_items
+        for page_url in page_urls:
+            if all_seen(query, page_items):
+                break
+            try:
+                page_items = crawl_page(query, page_url)
+            except fetching.DeadlineExceededError as exc:
+                raise PartialCrawlError(first_page_items + found_items, exc) from exc
+            found_items.extend(page_items)
+        return found_items
 
 
 class AvtonetSpider(Spider):
     """
-    Spider for avtonet.si vehicle listings. Extracts title, URL, and price from search result rows.
+    Spider for avtonet.si vehicle listings. Extracts title, URL, and price from search result rows of all result
+    pages. Number of pages is read from the pagination of the first page, remaining pages are fetched concurrently,
+    up to the host's 'max_in_flight' limit.
     """
 
     name = "avtonet"
 
-    def run(self) -> list[SpiderItem]:
-        found_listings = []
-        for query, url in self.queries.items():
-            avtonet_html = get_html_from_url(url)
+    # safety limit for the number of crawled result pages of a single query
+    max_pages = 50
 
+    listing_extractor = extraction.RowExtractor(
+        "div[class*=GO-Results-Row]",
+        {
+            "title": extraction.Field(selector="div[class*=GO-Results-Naziv] span"),
+            "url": extraction.Field(selector="a[class*=stretched-link]", attribute="href"),
+            "price": extraction.Field(selector="div[class*=GO-Results-Price-TXT-Regular]", strip="value"),
+        },
+    )
+    page_link_selector = extraction.compile_selector("ul.pagination a[href]")
+
+    def run_query(self, query: str, url: str) -> list[SpiderItem]:
+        avtonet_html = self.fetcher.get_html(url)
+
+        with metrics.timer("news_crawlers_parse_seconds"):
             avtonet_content = bs4.BeautifulSoup(avtonet_html, "html.parser")
+            found_listings = self._get_listings(avtonet_content, query)
+            num_pages = min(_get_page_count(avtonet_content, self.page_link_selector, "stran"), self.max_pages)
 
-            for listing in avtonet_content.select("div[class*=GO-Results-Row]"):
-                listing_title = listing.select("div[class*=GO-Results-Naziv]")[0].select("span")[0].text
-                listing_href = listing.select("a[class*=stretched-link]")[0].attrs["href"]
-                listing_price = listing.select("div[class*=GO-Results-Price-TXT-Regular]")[0].text.strip()
+        page_urls = [_get_page_url(url, "stran", page) for page in range(2, num_pages + 1)]
+        return found_listings + self._crawl_pages(query, page_urls, found_listings, self._crawl_page)
 
-                listing_dict = {
-                    "query": query,
-                    "title": listing_title,
-                    "url": listing_href,
-                    "price": listing_price,
-                }
+    def _crawl_page(self, query: str, url: str) -> list[SpiderItem]:
+        avtonet_html = self.fetcher.get_html(url)
 
-                found_listings.append(listing_dict)
+        with metrics.timer("news_crawlers_parse_seconds"):
+            return self._get_listings(bs4.BeautifulSoup(avtonet_html, "html.parser"), query)
 
-        return found_listings
+    @classmethod
+    def _get_listings(cls, avtonet_content: bs4.BeautifulSoup, query: str) -> list[SpiderItem]:
+        return [{"query": query, **listing} for listing in cls.listing_extractor.extract(avtonet_content)]
 
 
 class CarobniSvetSpider(Spider):
@@ -74,6 +242,9 @@ class CarobniSvetSpider(Spider):
     """
 
     name = "carobni_svet"
+    max_concurrent_queries = 2
+
+    LOGIN_URL = "https://carobni-svet.com/portal/parents/login"
 
     @staticmethod
     def _get_images(bs_content: bs4.BeautifulSoup) -> list[SpiderItem]:
@@ -96,27 +267,102 @@ class CarobniSvetSpider(Spider):
 
         return [{"type": "blog", "data": text}]
 
-    def run(self) -> list[SpiderItem]:
-        login_url = "https://carobni-svet.com/portal/parents/login"
+    def __init__(
+        self,
+        queries: dict[str, str],
+        fetch_config: configuration.FetchConfig | None = None,
+        state_folder: pathlib.Path | None = None,
+        all_seen: Callable[[str, list[SpiderItem]], bool] | None = None,
+    ) -> None:
+        super().__init__(queries, fetch_config, state_folder, all_seen)
+        self._session: requests.Session | None = None
+        self._session_lock = threading.Lock()
+
+    def _get_session(self) -> requests.Session:
+        """
+        Returns session, which is logged in to the portal. Session, stored by one of the previous runs, is reused if
+        available, otherwise login is performed. Login is performed on first call only.
+
+        :return: Logged in session.
+        """
+        with self._session_lock:
+            if self._session is None:
+                session_store = self._get_session_store()
+                stored_cookies = session_store.load() if session_store is not None else None
+                if stored_cookies is not None:
+                    self._session = requests.Session()
+                    self._session.cookies = stored_cookies
+                else:
+                    self._session = self._login()
+            return self._session
+
+    def _refresh_session(self, expired_session: requests.Session) -> requests.Session:
+        """
+        Logs in again after the session has expired. If another thread has already done that, its session is used.
+
+        :param expired_session: Session, which is no longer logged in.
+        :return: Logged in session.
+        """
+        with self._session_lock:
+            if self._session is expired_session:
+                expired_session.close()
+                self._session = None
+                self._session = self._login()
+            return cast(requests.Session, self._session)
+
+    def _login(self) -> requests.Session:
         login_info = {"email": os.environ["CS_EMAIL"], "password": os.environ["CS_PASS"]}
 
+        session = requests.Session()
+        try:
+            login_response = session.post(self.LOGIN_URL, data=login_info)
+            login_response.raise_for_status()
+        except Exception:
+            session.close()
+            raise
+
+        session_store = self._get_session_store()
+        if session_store is not None:
+            session_store.save(session.cookies)
+        return session
+
+    def _get_session_store(self) -> sessions.SessionStore | None:
+        if self.state_folder is None:
+            return None
+        return sessions.SessionStore(self.state_folder / f"{self.name}.session", os.environ["CS_PASS"])
+
+    @staticmethod
+    def _is_logged_out(response: requests.Response) -> bool:
+        redirected_to_login = urllib.parse.urlsplit(response.url).path.rstrip("/").endswith("/login")
+        return response.status_code in (401, 403) or redirected_to_login
+
+    def _get_html(self, url: str) -> str:
+        # replayed responses do not need a logged in session
+        if fetching.replaying():
+            return self.fetcher.get_html(url)
+
+        session = self._get_session()
+        response = self.fetcher.get(url, session=session)
+        if self._is_logged_out(response):
+            response = self.fetcher.get(url, session=self._refresh_session(session))
+        return self.fetcher.read_html(url, response)
+
+    def run_query(self, query: str, url: str) -> list[SpiderItem]:
         query_to_handler_map: dict[str, Callable[[bs4.BeautifulSoup], list[SpiderItem]]] = {
             "photos": self._get_images,
             "blog": self._get_blog,
         }
 
-        found_items = []
-        with requests.Session() as session:
-            login_response = session.post(login_url, data=login_info)
-            login_response.raise_for_status()
-
-            for query, url in self.queries.items():
-                carobni_svet_html = session.get(url, timeout=10).text
-                carobni_svet_bs = bs4.BeautifulSoup(carobni_svet_html, "html.parser")
+        carobni_svet_html = self._get_html(url)
 
-                found_items += query_to_handler_map[query](carobni_svet_bs)
+        with metrics.timer("news_crawlers_parse_seconds"):
+            carobni_svet_bs = bs4.BeautifulSoup(carobni_svet_html, "html.parser")
+            return query_to_handler_map[query](carobni_svet_bs)
 
-        return found_items
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
 
 class BolhaSpider(Spider):
@@ -127,88 +373,223 @@ class BolhaSpider(Spider):
 
     name = "bolha"
 
-    def run(self) -> list[SpiderItem]:
+    listing_extractor = extraction.RowExtractor(
+        "li.EntityList-item",
+        {
+            "title": extraction.Field(selector="a.link"),
+            "url": extraction.Field(selector="a.link", attribute="href"),
+            "price": extraction.Field(selector="strong.price", strip="fragments"),
+        },
+    )
 
+    def run_query(self, query: str, url: str) -> list[SpiderItem]:
         found_items: list[SpiderItem] = []
 
-        for query_name, query_url in self.queries.items():
+        # crawl initial page
+        html = self.fetcher.get_html(url)
+        found_items.extend(self._get_items_from_current_page(html, query))
 
-            # crawl initial page
-            html = get_html_from_url(query_url)
-            found_items.extend(self._get_items_from_current_page(html, query_name))
-
-            current_page_ind = 2
-            while True:
-                if current_page_ind > 1000:
-                    raise RuntimeError("Something has gone wrong, to many iterations have been performed.")
+        current_page_ind = 2
+        while True:
+            if current_page_ind > 1000:
+                raise RuntimeError("Something has gone wrong, to many iterations have been performed.")
 
-                # crawl initial page
-                try:
-                    html = get_html_from_url(f"{query_url}&page={current_page_ind}")
-                except requests.HTTPError:
-                    break
+            # crawl initial page
+            try:
+                html = self.fetcher.get_html(f"{url}&page={current_page_ind}")
+            except fetching.DeadlineExceededError as exc:
+                raise PartialCrawlError(found_items, exc) from exc
+            except requests.HTTPError:
+                break
 
-                found_items_on_current_page = self._get_items_from_current_page(html, query_name)
+            found_items_on_current_page = self._get_items_from_current_page(html, query)
 
-                if not found_items_on_current_page:
-                    break
+            if not found_items_on_current_page:
+                break
 
-                found_items.extend(found_items_on_current_page)
+            found_items.extend(found_items_on_current_page)
 
-                current_page_ind += 1
+            current_page_ind += 1
 
         return found_items
 
     @staticmethod
     def _get_items_from_current_page(html: str, query_name: str) -> list[SpiderItem]:
-        bolha_bs = bs4.BeautifulSoup(html, features="html.parser")
+        with metrics.timer("news_crawlers_parse_seconds"):
+            return BolhaSpider._parse_page(html, query_name)
 
-        listings = bolha_bs.select("li.EntityList-item")
+    @staticmethod
+    def _parse_page(html: str, query_name: str) -> list[SpiderItem]:
+        bolha_bs = bs4.BeautifulSoup(html, features="html.parser")
 
         found_items: list[SpiderItem] = []
-        for listing in listings:
-            listing_el = listing.select("a.link")
-            price_el = listing.select("strong.price")
-
-            if not listing_el or not price_el:
-                continue
-
-            title = listing_el[0].text
-            url = listing_el[0].attrs["href"]
+        for listing in BolhaSpider.listing_extractor.extract(bolha_bs):
+            url = listing["url"]
 
             if not url.startswith("https://www.bolha.com"):
                 url = "https://www.bolha.com" + url
 
-            price = price_el[0].get_text(strip=True)
+            found_items.append({"query": query_name, "title": listing["title"], "price": listing["price"], "url": url})
+
+        return found_items
 
-            found_items.append({"query": query_name, "title": title, "price": price, "url": url})
 
+class GenericSpider(Spider):
+    """
+    Spider, whose extraction rules (row and field selectors, pagination) are defined in configuration instead of
+    code. All queries are fetched through a single pooled session, so connections to the site are reused.
+    """
+
+    name = "generic"
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        queries: dict[str, str],
+        extraction_config: configuration.ExtractionConfig,
+        fetch_config: configuration.FetchConfig | None = None,
+        state_folder: pathlib.Path | None = None,
+        all_seen: Callable[[str, list[SpiderItem]], bool] | None = None,
+    ) -> None:
+        """
+        :param queries: Query name and url pairs to be crawled.
+        :param extraction_config: Extraction rules.
+        :param fetch_config: Fetch policy (timeout, retries, circuit breaker). Defaults are used if None.
+        :param state_folder: Folder, in which spider can keep its state between runs.
+        :param all_seen: Returns True if all given items of a query have been seen in previous runs.
+        """
+        super().__init__(queries, fetch_config, state_folder, all_seen)
+        self.extraction_config = extraction_config
+        self.extractor = extraction.RowExtractor(extraction_config.rows, extraction_config.fields)
+        pagination = extraction_config.pagination
+        self._page_link_pattern = (
+            extraction.compile_selector(pagination.links)
+            if pagination is not None and pagination.links is not None
+            else None
+        )
+        self._session = requests.Session()
+
+    @classmethod
+    def from_config(
+        cls,
+        spider_configuration: configuration.SpiderConfig,
+        state_folder: pathlib.Path | None = None,
+        all_seen: Callable[[str, list[SpiderItem]], bool] | None = None,
+    ) -> Spider:
+        """
+        :raises ValueError: If configuration does not contain extraction rules.
+        """
+        if spider_configuration.extraction is None:
+            raise ValueError("Generic spider requires 'extraction' configuration.")
+        return cls(
+            spider_configuration.urls,
+            spider_configuration.extraction,
+            spider_configuration.fetch,
+            state_folder,
+            all_seen,
+        )
+
+    def run_query(self, query: str, url: str) -> list[SpiderItem]:
+        pagination = self.extraction_config.pagination
+        html = self.fetcher.get_html(url, session=self._session)
+
+        with metrics.timer("news_crawlers_parse_seconds"):
+            content = bs4.BeautifulSoup(html, "html.parser")
+            found_items = self._get_items(content, query, url)
+            if pagination is None or self._page_link_pattern is None:
+                num_pages = 1
+            else:
+                num_pages = min(
+                    _get_page_count(content, self._page_link_pattern, pagination.page_param), pagination.max_pages
+                )
+
+        if pagination is None:
+            return found_items
+        if self._page_link_pattern is None:
+            return found_items + self._crawl_until_empty(query, url, pagination, found_items)
+
+        page_urls = [_get_page_url(url, pagination.page_param, page) for page in range(2, num_pages + 1)]
+        return found_items + self._crawl_pages(query, page_urls, found_items, self._crawl_page)
+
+    def _crawl_until_empty(
+        self,
+        query: str,
+        url: str,
+        pagination: configuration.PaginationConfig,
+        first_page_items: list[SpiderItem],
+    ) -> list[SpiderItem]:
+        """
+        Crawls pages one by one, until a page without items (or with only seen items) is found, or the page does
+        not exist.
+        """
+        found_items: list[SpiderItem] = []
+        page_items = first_page_items
+        for page in range(2, pagination.max_pages + 1):
+            if not page_items or (self.all_seen is not None and self.all_seen(query, page_items)):
+                break
+            try:
+                page_items = self._crawl_page(query, _get_page_url(url, pagination.page_param, page))
+            except fetching.DeadlineExceededError as exc:
+                raise PartialCrawlError(first_page_items + found_items, exc) from exc
+            except requests.HTTPError:
+                break
+            found_items.extend(page_items)
         return found_items
 
+    def _crawl_page(self, query: str, url: str) -> list[SpiderItem]:
+        html = self.fetcher.get_html(url, session=self._session)
+
+        with metrics.timer("news_crawlers_parse_seconds"):
+            return self._get_items(bs4.BeautifulSoup(html, "html.parser"), query, url)
+
+    def _get_items(self, content: bs4.BeautifulSoup, query: str, page_url: str) -> list[SpiderItem]:
+        items = []
+        for item in self.extractor.extract(content):
+            for url_field in self.extraction_config.url_fields:
+                if url_field in item:
+                    item[url_field] = urllib.parse.urljoin(page_url, item[url_field])
+            items.append({"query": query, **item})
+        return items
+
+    def close(self) -> None:
+        self._session.close()
+
+
+def _get_page_count(content: bs4.BeautifulSoup, page_link_pattern: soupsieve.SoupSieve, page_param: str) -> int:
+    """
+    :return: Highest page number, found in page parameter of pagination links, or 1 if there are no such links.
+    """
+    pages = [1]
+    for page_link in page_link_pattern.select(content):
+        page_params = urllib.parse.parse_qs(urllib.parse.urlsplit(str(page_link.get("href", ""))).query)
+        pages.extend(int(page) for page in page_params.get(page_param, []) if page.isdigit())
+    return max(pages)
+
+
+def _get_page_url(url: str, page_param: str, page: int) -> str:
+    """
+    :return: URL with page parameter set to the page number.
+    """
+    split_url = urllib.parse.urlsplit(url)
+    params = [
+        (name, value)
+        for name, value in urllib.parse.parse_qsl(split_url.query, keep_blank_values=True)
+        if name != page_param
+    ]
+    params.append((page_param, str(page)))
+    return urllib.parse.urlunsplit(split_url._replace(query=urllib.parse.urlencode(params)))
+
 
-def get_html_from_url(url: str) -> str:
+def get_html_from_url(url: str, session: requests.Session | None = None) -> str:
     """
     Fetch a URL and return its response body as text.
 
     :param url: The URL to request.
+    :param session: Optional session to send the request with (e.g. one holding login cookies).
     :return: The response body as a string.
     :raises requests.HTTPError: If the response status code is not 2xx.
     :raises requests.RequestException: On connection or other request errors.
     """
-    headers = {
-        "Accept-Encoding": "gzip, deflate, sdch",
-        "Accept-Language": "en-US,en;q=0.8",
-        "Upgrade-Insecure-Requests": "1",
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/"
-        "56.0.2924.87 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Cache-Control": "max-age=0",
-        "Connection": "keep-alive",
-    }
-
-    response = requests.get(url, headers=headers, timeout=10)
-    response.raise_for_status()
-    return response.text
+    return fetching.Fetcher().get_html(url, session=session)
 
 
 def get_spider_by_name(name: str) -> type[Spider]:
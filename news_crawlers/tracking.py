@@ -0,0 +1,114 @@
+"""
+Identity of items and tracking of their changes. Items of spiders with an identity key (e.g. 'url') are looked up in
+the cache by their key, so an item whose other fields (e.g. price) have changed is updated in place instead of being
+stored and reported as a new item. Changed items are reported with the names of changed fields and their previous
+values, so notifications can be sent for new items, changes of specific fields, or both.
+"""
+from __future__ import annotations
+
+from typing import NamedTuple
+
+Item = dict[str, str]
+
+# field of a reported changed item, with comma separated names of its changed fields
+CHANGED_FIELD = "changed"
+# prefix of fields of a reported changed item, with previous values of its changed fields
+PREVIOUS_PREFIX = "previous_"
+
+# notify_on entry for new items, changes of a field are selected with 'changed:<field>'
+NOTIFY_NEW = "new"
+NOTIFY_CHANGED_PREFIX = "changed:"
+
+
+class TrackedDiff(NamedTuple):
+    # new items, followed by changed items with their changes
+    items: list[Item]
+    # all items of the query, which should be stored to cache
+    cached_items: list[Item]
+    # True if cached items differ from those which were read from cache
+    modified: bool
+
+
+def is_change(item: Item) -> bool:
+    """
+    :param item: Reported item.
+
+    :return: True if the item is a changed item, False if it is a new one.
+    """
+    return CHANGED_FIELD in item
+
+
+def get_changed_fields(previous: Item, item: Item) -> list[str]:
+    """
+    :param previous: Cached item.
+    :param item: Crawled item with the same identity.
+
+    :return: Names of fields, whose values differ, in order of crawled item's fields.
+    """
+    return [field for field in {**item, **previous} if previous.get(field) != item.get(field)]
+
+
+def diff_items(cached_items: list[Item], crawled_items: list[Item], identity_key: str) -> TrackedDiff:
+    """
+    Compares crawled items with cached items by their identity key. Crawled items without the key are compared as a
+    whole. Cached items with duplicate keys (e.g. stored before the key was configured) are merged, the last one is
+    kept.
+
+    :param cached_items: Cached items of the query.
+    :param crawled_items: Crawled items of the query.
+    :param identity_key: Field, which identifies an item.
+
+    :return: New and changed items, and items to store to cache.
+    """
+    by_key: dict[str, Item] = {}
+    keyless: list[Item] = []
+    for item in cached_items:
+        if identity_key in item:
+            by_key[item[identity_key]] = item
+        else:
+            keyless.append(item)
+    modified = len(by_key) + len(keyless) != len(cached_items)
+
+    new_items: list[Item] = []
+    changed_items: list[Item] = []
+    for item in crawled_items:
+        if identity_key not in item:
+            if item not in keyless:
+                keyless.append(item)
+                new_items.append(item)
+            continue
+
+        previous = by_key.get(item[identity_key])
+        if previous is None:
+            new_items.append(item)
+        elif previous != item:
+            changed_fields = get_changed_fields(previous, item)
+            changed_items.append(
+                {
+                    **item,
+                    CHANGED_FIELD: ",".join(changed_fields),
+                    **{PREVIOUS_PREFIX + field: previous.get(field, "") for field in changed_fields},
+                }
+            )
+        else:
+            continue
+        by_key[item[identity_key]] = item
+        modified = True
+
+    return TrackedDiff(new_items + changed_items, list(by_key.values()) + keyless, modified)
+
+
+def select_notified(items: list[Item], notify_on: list[str]) -> list[Item]:
+    """
+    :param items: New and changed items.
+    :param notify_on: Events, about which notifications are sent: 'new' and/or 'changed:<field>'.
+
+    :return: Items, about which notifications should be sent.
+    """
+    notified_fields = {entry.removeprefix(NOTIFY_CHANGED_PREFIX) for entry in notify_on if entry != NOTIFY_NEW}
+    return [
+        item
+        for item in items
+        if (NOTIFY_NEW in notify_on and not is_change(item))
+        or (is_change(item) and notified_fields.intersection(item[CHANGED_FIELD].split(",")))
+    ]
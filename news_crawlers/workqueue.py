@@ -0,0 +1,217 @@
+"""
+Lease-based work queue on a shared SQLite database. Used to shard crawling between several worker processes, which
+may run on different hosts, as long as they share the database file (and the cache folder).
+
+Each tick (e.g. one scheduled run) consists of work units, one for each spider query. Every worker enqueues the units
+of the current tick (enqueueing is idempotent), then claims units one by one. A claimed unit is leased to its worker
+for a limited time, after which it can be claimed by another worker (e.g. if the first one crashed). Diff with cache is
+committed while holding the database write lock and only if the lease is still held, so each unit is crawled and
+diffed exactly once per tick.
+"""
+from __future__ import annotations
+
+import contextlib
+import os
+import pathlib
+import socket
+import sqlite3
+import time
+from collections.abc import Callable, Collection, Iterable, Iterator
+
+import pydantic
+
+# number of past ticks to keep in the database, so that workers lagging behind do not enqueue finished ticks again
+KEEP_TICKS = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_units (
+    tick INTEGER NOT NULL,
+    spider TEXT NOT NULL,
+    query TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    PRIMARY KEY (tick, spider, query)
+)
+"""
+
+
+class LeaseLostError(Exception):
+    """
+    Raised when a worker tries to commit a unit, whose lease has expired and was claimed by another worker.
+    """
+
+
+class WorkUnit(pydantic.BaseModel):
+    tick: int
+    spider: str
+    query: str
+    owner: str
+
+
+def current_tick(tick_seconds: float, now: float | None = None) -> int:
+    """
+    Returns number of the tick at the given time. Workers on all hosts agree on the tick as long as their clocks do.
+
+    :param tick_seconds: Length of a tick in seconds (usually the schedule interval).
+    :param now: Current UNIX time. Current time is used if None.
+
+    :return: Tick number.
+    """
+    if now is None:
+        now = time.time()
+    return int(now // tick_seconds)
+
+
+def default_owner() -> str:
+    """
+    :return: Owner name, which is unique for each worker process.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    Work queue, stored in a SQLite database. A new connection is opened for each operation, so queue objects can be
+    passed to worker processes.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        lease_seconds: float = 600.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        :param path: Path to the database file. It is created if it does not exist.
+        :param lease_seconds: Time after which units claimed by an unresponsive worker can be claimed again.
+        :param clock: Function returning current UNIX time.
+        """
+        self.path = pathlib.Path(path)
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # transactions are managed explicitly, write transactions are always started with 'BEGIN IMMEDIATE'
+        connection = sqlite3.connect(self.path, timeout=60.0, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def enqueue(self, tick: int, units: Iterable[tuple[str, str]]) -> int:
+        """
+        Adds units of a tick to the queue. Units which already exist (enqueued by another worker) are left as they are.
+
+        :param tick: Tick number.
+        :param units: Spider and query name pairs.
+
+        :return: Number of newly added units.
+        """
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM work_units WHERE tick < ?", (tick - KEEP_TICKS,))
+            cursor = connection.executemany(
+                "INSERT OR IGNORE INTO work_units (tick, spider, query) VALUES (?, ?, ?)",
+                [(tick, spider, query) for spider, query in units],
+            )
+            return cursor.rowcount
+
+    def claim(self, tick: int, owner: str, spiders: Collection[str]) -> WorkUnit | None:
+        """
+        Claims a pending unit of the tick, or a unit whose lease has expired.
+
+        :param tick: Tick number.
+        :param owner: Name of the claiming worker.
+        :param spiders: Only units of these spiders are claimed.
+
+        :return: Claimed unit, or None if there are no units left to claim.
+        """
+        now = self.clock()
+        spiders = list(spiders)
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT spider, query FROM work_units WHERE tick = ? AND "
+                "(state = 'pending' OR (state = 'leased' AND lease_expires < ?)) "
+                f"AND spider IN ({', '.join('?' * len(spiders))}) ORDER BY spider, query LIMIT 1",
+                (tick, now, *spiders),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE work_units SET state = 'leased', owner = ?, lease_expires = ? "
+                "WHERE tick = ? AND spider = ? AND query = ?",
+                (owner, now + self.lease_seconds, tick, *row),
+            )
+        return WorkUnit(tick=tick, spider=row[0], query=row[1], owner=owner)
+
+    @contextlib.contextmanager
+    def committing(self, unit: WorkUnit) -> Iterator[None]:
+        """
+        Context in which the results of a unit are committed (e.g. diff with cache). The unit is marked as done when
+        the context exits without errors. Commits of all workers are serialized by the database write lock.
+
+        :param unit: Claimed unit.
+
+        :raises LeaseLostError: If the unit is no longer leased to its owner.
+        """
+        with self._transaction() as connection:
+            self._check_lease(connection, unit)
+            yield
+            self._set_state(connection, unit, "done")
+
+    def fail(self, unit: WorkUnit, error: str) -> None:
+        """
+        Marks a claimed unit as failed, so that it is not crawled again in the same tick.
+
+        :param unit: Claimed unit.
+        :param error: Error description.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE work_units SET state = 'failed', error = ? "
+                "WHERE tick = ? AND spider = ? AND query = ? AND state = 'leased' AND owner = ?",
+                (error, unit.tick, unit.spider, unit.query, unit.owner),
+            )
+
+    def states(self, tick: int) -> dict[tuple[str, str], str]:
+        """
+        :param tick: Tick number.
+
+        :return: State ('pending', 'leased', 'done' or 'failed') of each spider and query pair of the tick.
+        """
+        with self._connect() as connection:
+            rows = connection.execute("SELECT spider, query, state FROM work_units WHERE tick = ?", (tick,))
+            return {(spider, query): state for spider, query, state in rows}
+
+    @staticmethod
+    def _check_lease(connection: sqlite3.Connection, unit: WorkUnit) -> None:
+        row = connection.execute(
+            "SELECT state, owner FROM work_units WHERE tick = ? AND spider = ? AND query = ?",
+            (unit.tick, unit.spider, unit.query),
+        ).fetchone()
+        if row != ("leased", unit.owner):
+            raise LeaseLostError(f"Lease of {unit.spider}:{unit.query} in tick {unit.tick} was lost.")
+
+    @staticmethod
+    def _set_state(connection: sqlite3.Connection, unit: WorkUnit, state: str) -> None:
+        connection.execute(
+            "UPDATE work_units SET state = ? WHERE tick = ? AND spider = ? AND query = ?",
+            (state, unit.tick, unit.spider, unit.query),
+        )
@@ -1,8 +1,19 @@
 import pytest
 import requests
+
+from news_crawlers import configuration
+from news_crawlers import fetching
 from tests import mocks
 
 
 @pytest.fixture(name="mock_request_avtonet")
 def mock_request_avtonet_fixture(monkeypatch):
     monkeypatch.setattr(requests, "get", mocks.mock_requests_get("avtonet_test_html.html"))
+
+
+@pytest.fixture(autouse=True)
+def unlimited_rate_fixture():
+    # rate limiters are shared by the whole process, do not let tests throttle each other
+    fetching.configure_rate_limits({"default": configuration.RateLimitConfig(requests_per_second=1000, burst=1000)})
+    yield
+    fetching.configure_rate_limits({})
@@ -1,7 +1,10 @@
 """
 Contains various mock classes which can be used in tests.
 """
+import http.server
+import json
 import pathlib
+import threading
 from collections.abc import Callable
 
 import requests
@@ -21,6 +24,61 @@ class HttpsSessionMock:
     def post(self, url, data, headers):
         self.simulated_messages.append(data["message"])
 
+    def close(self):
+        pass
+
+
+class LocalHttpServer:
+    """
+    HTTP server on localhost, which records JSON bodies of POST requests and the client ports they were sent from
+    (each new connection has a different port). Responds with queued status codes, then with 200. Responses with
+    queued status codes have the 'Retry-After' header, if it is set.
+    """
+
+    def __init__(self):
+        self.bodies = []
+        self.client_ports = []
+        self.statuses = []
+        self.retry_after: str | None = None
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._create_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/hook"
+
+    def _create_handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:  # pylint: disable=protected-access
+                    server.bodies.append(body)
+                    server.client_ports.append(self.client_address[1])
+                    status = server.statuses.pop(0) if server.statuses else 200
+                self.send_response(status)
+                if status != 200 and server.retry_after is not None:
+                    self.send_header("Retry-After", server.retry_after)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
 
 class SmtpMock:
     """
@@ -62,15 +120,19 @@ class MockRequestObject:
     def __init__(self, mock_html):
         self.mock_html = mock_html
         self.request_counter = 0
+        self.headers = {}
 
     @property
     def text(self) -> str:
-        self.request_counter += 1
         return mock_get_raw_html(self.mock_html)
 
+    @property
+    def content(self) -> bytes:
+        return self.text.encode("utf8")
+
     @property
     def status_code(self) -> int:
-        return 200 if self.request_counter < 1 else 404
+        return 200 if self.request_counter <= 1 else 404
 
     def raise_for_status(self) -> None:
         """Mimic requests.Response: raise on 4xx/5xx (mock uses 404 after first call)."""
@@ -83,7 +145,8 @@ class MockRequestObject:
 def mock_requests_get(mock_html: str) -> Callable[[str, str, str], MockRequestObject]:
     mock_request_obj = MockRequestObject(mock_html)
 
-    def mock_request_func(url: str, headers: str, timeout: str) -> MockRequestObject:
+    def mock_request_func(url: str, headers: str, timeout: str, **kwargs) -> MockRequestObject:
+        mock_request_obj.request_counter += 1
         return mock_request_obj
 
     return mock_request_func
@@ -0,0 +1,129 @@
+import json
+import pathlib
+
+import pytest
+import requests
+
+from news_crawlers import archive
+from news_crawlers import fetching
+from news_crawlers import notificators
+from news_crawlers import spiders
+from news_crawlers.__main__ import main
+from tests import mocks
+
+# pylint: disable=unused-argument
+
+AVTONET_URL = "https://www.avto.net/results"
+
+
+@pytest.fixture(name="reset_archive", autouse=True)
+def reset_archive_fixture():
+    yield
+    fetching.configure_archive()
+
+
+def _response(url: str, body: bytes, status_code: int = 200, headers: dict[str, str] | None = None):
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    response.encoding = "utf-8"
+    response._content = body  # pylint: disable=protected-access
+    return response
+
+
+def _offline_get(url: str, headers: dict[str, str], timeout: float, **kwargs) -> requests.Response:
+    raise requests.ConnectionError("network is not available")
+
+
+def _record_avtonet_run(monkeypatch, archive_dir: pathlib.Path) -> list[spiders.SpiderItem]:
+    html = mocks.mock_get_raw_html("avtonet_test_html.html").encode("utf8")
+    monkeypatch.setattr(requests, "get", lambda url, headers, timeout, **kwargs: _response(url, html))
+
+    recorder = archive.ArchiveRecorder(archive_dir)
+    fetching.configure_archive(recorder=recorder)
+    recorder.start_run()
+    items = spiders.AvtonetSpider({"cars": AVTONET_URL}).run()
+    recorder.finish_run()
+    fetching.configure_archive()
+
+    return items
+
+
+def test_recorded_responses_are_replayed_without_network(monkeypatch, tmp_path: pathlib.Path):
+    recorded_items = _record_avtonet_run(monkeypatch, tmp_path)
+
+    monkeypatch.setattr(requests, "get", _offline_get)
+    fetching.configure_archive(replay=archive.ArchiveReplay(archive.list_archives(tmp_path)[0]))
+    replayed_items = spiders.AvtonetSpider({"cars": AVTONET_URL}).run()
+
+    assert recorded_items
+    assert replayed_items == recorded_items
+
+
+def test_replay_repeats_responses_in_recorded_order(monkeypatch, tmp_path: pathlib.Path):
+    responses = [_response("https://a.com", b"first", 503), _response("https://a.com", b"second")]
+    recorder = archive.ArchiveRecorder(tmp_path)
+    recorder.start_run()
+    for response in responses:
+        recorder.record("https://a.com", response)
+    recorder.finish_run()
+
+    replay = archive.ArchiveReplay(archive.list_archives(tmp_path)[0])
+
+    assert [replay.get("https://a.com").content for _ in range(3)] == [b"first", b"second", b"second"]
+    with pytest.raises(archive.ArchiveMissError):
+        replay.get("https://b.com")
+
+
+def test_cookies_are_not_recorded(tmp_path: pathlib.Path):
+    recorder = archive.ArchiveRecorder(tmp_path)
+    recorder.start_run()
+    recorder.record("https://a.com", _response("https://a.com", b"", headers={"Set-Cookie": "session=secret"}))
+    recorder.finish_run()
+
+    assert "Set-Cookie" not in archive.ArchiveReplay(archive.list_archives(tmp_path)[0]).get("https://a.com").headers
+
+
+def test_replay_command_does_not_send_notifications(monkeypatch, tmp_path: pathlib.Path):
+    _record_avtonet_run(monkeypatch, tmp_path / "archive")
+    monkeypatch.setattr(requests, "get", _offline_get)
+    monkeypatch.chdir(tmp_path)
+
+    sent_messages = []
+    monkeypatch.setattr(notificators.PushoverNotificator, "send_text", lambda _, title, msg: sent_messages.append(msg))
+    with open(tmp_path / "news_crawlers.yaml", "w+", encoding="utf8") as file:
+        json.dump(
+            {
+                "spiders": {
+                    "avtonet": {
+                        "urls": {"cars": AVTONET_URL},
+                        "notifications": {
+                            "pushover": {"app_token": "token", "recipients": "user", "message_body_format": "{url}"}
+                        },
+                    }
+                }
+            },
+            file,
+        )
+
+    main(
+        [
+            "scrape",
+            "--replay",
+            str(tmp_path / "archive"),
+            "--config",
+            str(tmp_path / "news_crawlers.yaml"),
+            "--report",
+            str(tmp_path / "report.json"),
+        ]
+    )
+
+    with open(tmp_path / "report.json", encoding="utf8") as file:
+        query_report = json.load(file)["queries"][0]
+    assert query_report["new_items"] > 0
+    assert query_report["pages"] == 1 and query_report["bytes"] > 0
+    # replayed runs use a temporary cache, so that the default cache is not changed
+    assert not (tmp_path / "data").exists()
+    assert not sent_messages
+    assert not fetching.replaying()
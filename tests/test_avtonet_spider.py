@@ -4,6 +4,8 @@ import requests
 from tests import mocks
 from news_crawlers import spiders
 
+# pylint: disable=unused-argument
+
 
 @pytest.fixture(name="mock_request_avtonet")
 def mock_request_avtonet_fixture(monkeypatch):
@@ -20,3 +22,58 @@ def test_avtonet_spider_finds_expected_listings(avtonet_spider):
     listings = avtonet_spider.run()
 
     assert len(listings) == 2
+
+
+RESULTS_URL = "https://www.avto.net/Ads/results.asp?znamka=Kia&stran=1"
+
+
+def _page_url(page: int) -> str:
+    return f"https://www.avto.net/Ads/results.asp?znamka=Kia&stran={page}"
+
+
+def _results_page(listing_ids: list[int], num_pages: int) -> str:
+    rows = "".join(
+        f'<div class="row GO-Results-Row"><div class="GO-Results-Naziv"><span>Car {listing_id}</span></div>'
+        f'<a class="stretched-link" href="details.asp?id={listing_id}"></a>'
+        f'<div class="GO-Results-Price-TXT-Regular"> {listing_id} EUR </div></div>'
+        for listing_id in listing_ids
+    )
+    pagination = "".join(f'<li><a href="{_page_url(page)}">{page}</a></li>' for page in range(1, num_pages + 1))
+    return f'<html><body>{rows}<ul class="pagination">{pagination}</ul></body></html>'
+
+
+@pytest.fixture(name="requested_urls")
+def requested_urls_fixture(monkeypatch) -> list[str]:
+    pages = {_page_url(page): _results_page([page * 10 + 1, page * 10 + 2], 3) for page in range(1, 4)}
+    requested_urls = []
+
+    def mock_get(url: str, headers: dict[str, str], timeout: float, **kwargs) -> requests.Response:
+        requested_urls.append(url)
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200
+        response.encoding = "utf8"
+        response._content = pages[url].encode("utf8")  # pylint: disable=protected-access
+        return response
+
+    monkeypatch.setattr(requests, "get", mock_get)
+    return requested_urls
+
+
+def test_avtonet_spider_crawls_all_result_pages(requested_urls: list[str]):
+    listings = spiders.AvtonetSpider({"kia": RESULTS_URL}).run()
+
+    assert [listing["title"] for listing in listings] == ["Car 11", "Car 12", "Car 21", "Car 22", "Car 31", "Car 32"]
+    assert sorted(requested_urls) == [_page_url(1), _page_url(2), _page_url(3)]
+
+
+def test_avtonet_spider_stops_at_page_with_seen_listings(requested_urls: list[str]):
+    seen_listings = spiders.AvtonetSpider({"kia": _page_url(2)}).run_query("kia", _page_url(2))
+    requested_urls.clear()
+
+    listings = spiders.AvtonetSpider(
+        {"kia": RESULTS_URL}, all_seen=lambda query, items: all(item in seen_listings for item in items)
+    ).run()
+
+    assert [listing["title"] for listing in listings] == ["Car 11", "Car 12", "Car 21", "Car 22"]
+    assert requested_urls == [_page_url(1), _page_url(2)]
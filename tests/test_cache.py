@@ -0,0 +1,39 @@
+import multiprocessing
+import os
+import pathlib
+
+import pytest
+
+from news_crawlers import cache
+from news_crawlers import scrape
+
+# pylint: disable=unused-argument
+
+
+def test_failed_write_keeps_previous_content(monkeypatch, tmp_path: pathlib.Path):
+    cache_file = tmp_path / "bolha_cached.json"
+    cache.write_items(cache_file, [{"title": "old"}])
+
+    def failing_fsync(file_descriptor: int) -> None:
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(os, "fsync", failing_fsync)
+
+    with pytest.raises(OSError):
+        cache.write_items(cache_file, [{"title": "old"}, {"title": "new"}])
+
+    monkeypatch.undo()
+    assert cache.read_items(cache_file) == [{"title": "old"}]
+    assert list(tmp_path.iterdir()) == [cache_file]
+
+
+def _add_items(cache_folder: pathlib.Path, worker: int) -> None:
+    for ind in range(25):
+        scrape.check_diff(cache_folder, "bolha", "query", [{"title": f"item_{worker}_{ind}"}])
+
+
+def test_concurrent_diffs_do_not_lose_items(tmp_path: pathlib.Path):
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        pool.starmap(_add_items, [(tmp_path, worker) for worker in range(4)])
+
+    assert len(cache.read_query_items(tmp_path, "bolha", "query")) == 100
@@ -0,0 +1,120 @@
+import os
+import pathlib
+import threading
+
+import pytest
+import requests
+
+from news_crawlers import configuration
+from news_crawlers import scrape
+from news_crawlers import sessions
+from news_crawlers import spiders
+
+# pylint: disable=unused-argument
+
+PHOTOS_URL = "https://carobni-svet.com/portal/parents/photos"
+BLOG_URL = "https://carobni-svet.com/portal/parents/blog"
+
+PAGES = {
+    PHOTOS_URL: '<ul id="images"><img data-original-src="image_1.jpg"><img data-original-src="image_2.jpg"></ul>',
+    BLOG_URL: '<div id="blogs"><div class="bodyBesedilo">Title</div>'
+    '<div class="bodyBesedilo14">First</div><div class="bodyBesedilo14">Second</div></div>',
+}
+
+
+def _response(url: str, status_code: int = 200, text: str = "") -> requests.Response:
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response.encoding = "utf8"
+    response._content = text.encode("utf8")  # pylint: disable=protected-access
+    return response
+
+
+class FakePortal:
+    """
+    Simulates the portal, which only serves pages to sessions with a valid login cookie.
+    """
+
+    def __init__(self):
+        self.logins = 0
+        self.valid_token = ""
+        self.lock = threading.Lock()
+
+    def post(self, session: requests.Session, url: str, data: dict[str, str]) -> requests.Response:
+        with self.lock:
+            self.logins += 1
+            self.valid_token = f"token_{self.logins}"
+        session.cookies.set("auth", self.valid_token, domain="carobni-svet.com", path="/")
+        return _response(url)
+
+    def get(
+        self, session: requests.Session, url: str, headers: dict[str, str], timeout: float, **kwargs
+    ) -> requests.Response:
+        if session.cookies.get("auth") != self.valid_token:
+            return _response(spiders.CarobniSvetSpider.LOGIN_URL, text="login form")
+        return _response(url, text=PAGES[url])
+
+
+@pytest.fixture(name="portal")
+def portal_fixture(monkeypatch) -> FakePortal:
+    portal = FakePortal()
+    # functions (unlike bound methods) receive the session as first argument when set on the class
+    # pylint: disable=unnecessary-lambda
+    monkeypatch.setattr(requests.Session, "post", lambda session, url, **kwargs: portal.post(session, url, **kwargs))
+    monkeypatch.setattr(requests.Session, "get", lambda session, url, **kwargs: portal.get(session, url, **kwargs))
+    monkeypatch.setattr(os, "environ", {"CS_EMAIL": "parent@example.com", "CS_PASS": "secret"})
+    return portal
+
+
+def _run_spider(state_folder: pathlib.Path) -> list[spiders.SpiderItem]:
+    return spiders.CarobniSvetSpider({"photos": PHOTOS_URL, "blog": BLOG_URL}, state_folder=state_folder).run()
+
+
+def test_stored_session_is_reused_by_next_run(portal: FakePortal, tmp_path: pathlib.Path):
+    pytest.importorskip("cryptography")
+
+    first_items = _run_spider(tmp_path)
+    second_items = _run_spider(tmp_path)
+
+    assert portal.logins == 1
+    assert first_items == second_items
+    assert first_items[:2] == [{"type": "image", "data": "image_1.jpg"}, {"type": "image", "data": "image_2.jpg"}]
+    assert b"token_1" not in (tmp_path / "carobni_svet.session").read_bytes()
+
+
+def test_expired_session_is_refreshed(portal: FakePortal, tmp_path: pathlib.Path):
+    pytest.importorskip("cryptography")
+
+    _run_spider(tmp_path)
+    # portal invalidates the session, e.g. after it has expired
+    portal.valid_token = "expired"
+
+    items = _run_spider(tmp_path)
+
+    assert portal.logins == 2
+    assert len(items) == 3
+
+
+def test_session_is_not_stored_with_different_password(tmp_path: pathlib.Path):
+    pytest.importorskip("cryptography")
+
+    cookies = requests.cookies.RequestsCookieJar()
+    cookies.set("auth", "token", domain="carobni-svet.com", path="/")
+    sessions.SessionStore(tmp_path / "session", "secret").save(cookies)
+
+    assert sessions.SessionStore(tmp_path / "session", "secret").load().get("auth") == "token"
+    assert sessions.SessionStore(tmp_path / "session", "changed").load() is None
+
+
+def test_queries_share_single_login_when_crawled_concurrently(portal: FakePortal, tmp_path: pathlib.Path):
+    spiders_configuration = {
+        "carobni_svet": configuration.SpiderConfig(notifications={}, urls={"photos": PHOTOS_URL, "blog": BLOG_URL})
+    }
+    report = scrape.RunReport()
+
+    diff = scrape.scrape(["carobni_svet"], spiders_configuration, tmp_path, report)
+
+    assert portal.logins == 1
+    assert len(diff["carobni_svet"]) == 3
+    assert not report.errors
@@ -0,0 +1,142 @@
+import pathlib
+
+import pydantic
+import pytest
+
+from news_crawlers import coalescing
+from news_crawlers import configuration
+from news_crawlers import notificators
+from news_crawlers import scrape
+
+# pylint: disable=unused-argument
+
+
+@pytest.fixture(name="clock")
+def clock_fixture() -> list[float]:
+    # current time, which tests can move forward
+    return [1000.0]
+
+
+@pytest.fixture(name="buffer")
+def buffer_fixture(tmp_path: pathlib.Path, clock: list[float]) -> coalescing.NotificationBuffer:
+    return coalescing.NotificationBuffer(tmp_path, clock=lambda: clock[0])
+
+
+COALESCE_CONFIG = configuration.CoalesceConfig(window_minutes=10, max_items=3, urgent={"title": "(?i)urgent"})
+
+
+def test_items_are_buffered_until_window_passes(buffer: coalescing.NotificationBuffer, clock: list[float]):
+    assert not buffer.coalesce("bolha", "email", [{"title": "a"}], COALESCE_CONFIG)
+    clock[0] += 300
+    assert not buffer.coalesce("bolha", "email", [{"title": "b"}], COALESCE_CONFIG)
+    clock[0] += 300
+
+    assert buffer.coalesce("bolha", "email", [], COALESCE_CONFIG) == [{"title": "a"}, {"title": "b"}]
+    buffer.acknowledge("bolha", "email")
+    assert not buffer.coalesce("bolha", "email", [], COALESCE_CONFIG)
+
+
+def test_unacknowledged_items_are_sent_again(buffer: coalescing.NotificationBuffer, clock: list[float]):
+    buffer.coalesce("bolha", "email", [{"title": "a"}], COALESCE_CONFIG)
+    clock[0] += 600
+    assert buffer.coalesce("bolha", "email", [], COALESCE_CONFIG) == [{"title": "a"}]
+
+    # send has failed, so items are sent again, together with new urgent items
+    items = buffer.coalesce("bolha", "email", [{"title": "b"}, {"title": "URGENT: c"}], COALESCE_CONFIG)
+
+    assert items == [{"title": "a"}, {"title": "URGENT: c"}]
+
+
+def test_buffer_is_flushed_when_max_items_are_buffered(buffer: coalescing.NotificationBuffer):
+    assert not buffer.coalesce("bolha", "email", [{"title": "a"}, {"title": "b"}], COALESCE_CONFIG)
+
+    assert len(buffer.coalesce("bolha", "email", [{"title": "c"}], COALESCE_CONFIG)) == 3
+
+
+def test_urgent_items_skip_buffer(buffer: coalescing.NotificationBuffer):
+    items = buffer.coalesce("bolha", "email", [{"title": "a"}, {"title": "URGENT: b"}], COALESCE_CONFIG)
+
+    assert items == [{"title": "URGENT: b"}]
+
+
+def test_buffer_is_kept_between_instances(tmp_path: pathlib.Path, clock: list[float]):
+    first_run_buffer = coalescing.NotificationBuffer(tmp_path, clock=lambda: clock[0])
+    first_run_buffer.coalesce("bolha", "email", [{"t": "a"}], COALESCE_CONFIG)
+    clock[0] += 600
+
+    next_run_buffer = coalescing.NotificationBuffer(tmp_path, clock=lambda: clock[0])
+    items = next_run_buffer.coalesce("bolha", "email", [], COALESCE_CONFIG)
+
+    assert items == [{"t": "a"}]
+
+
+def test_only_coalesced_notificators_are_buffered(monkeypatch, buffer: coalescing.NotificationBuffer):
+    sent = []
+    monkeypatch.setattr(notificators.EmailNotificator, "send_text", lambda obj, subject, msg: sent.append("email"))
+    monkeypatch.setattr(notificators.PushoverNotificator, "send_text", lambda obj, subject, msg: sent.append("push"))
+
+    notifications = {
+        "email": {"email_user": "user", "email_password": "pass", "recipients": "a", "message_body_format": "{url}"},
+        "pushover": {"app_token": "token", "recipients": "b", "message_body_format": "{url}"},
+    }
+    spiders_configuration = {
+        "bolha": configuration.SpiderConfig(notifications=notifications, urls={}, coalesce={"email": COALESCE_CONFIG})
+    }
+
+    scrape.notify({"bolha": [{"url": "url_1"}]}, spiders_configuration, scrape.RunReport(), buffer=buffer)
+
+    assert sent == ["push"]
+
+
+def test_failed_send_is_retried_next_run(monkeypatch, buffer: coalescing.NotificationBuffer, clock: list[float]):
+    sent = []
+
+    def send_text(obj, subject, msg):
+        if not sent:
+            sent.append("failed")
+            raise ConnectionError("Email server is unreachable.")
+        sent.append(msg)
+
+    monkeypatch.setattr(notificators.EmailNotificator, "send_text", send_text)
+    notifications = {
+        "email": {"email_user": "user", "email_password": "pass", "recipients": "a", "message_body_format": "{url}"}
+    }
+    spiders_configuration = {
+        "bolha": configuration.SpiderConfig(notifications=notifications, urls={}, coalesce={"email": COALESCE_CONFIG})
+    }
+    scrape.notify({"bolha": [{"url": "url_1"}]}, spiders_configuration, scrape.RunReport(), buffer=buffer)
+    clock[0] += 600
+
+    report = scrape.RunReport()
+    scrape.notify({}, spiders_configuration, report, buffer=buffer)
+    assert sent == ["failed"] and report.errors
+    scrape.notify({}, spiders_configuration, scrape.RunReport(), buffer=buffer)
+    scrape.notify({}, spiders_configuration, scrape.RunReport(), buffer=buffer)
+
+    assert sent == ["failed", "url_1"]
+
+
+def test_corrupt_buffer_only_fails_its_notificator(monkeypatch, buffer: coalescing.NotificationBuffer):
+    sent = []
+    monkeypatch.setattr(notificators.EmailNotificator, "send_text", lambda obj, subject, msg: sent.append("email"))
+    monkeypatch.setattr(notificators.PushoverNotificator, "send_text", lambda obj, subject, msg: sent.append("push"))
+    buffer.folder.mkdir(parents=True, exist_ok=True)
+    (buffer.folder / "bolha_email.json").write_text("{", encoding="utf8")
+
+    notifications = {
+        "email": {"email_user": "user", "email_password": "pass", "recipients": "a", "message_body_format": "{url}"},
+        "pushover": {"app_token": "token", "recipients": "b", "message_body_format": "{url}"},
+    }
+    spiders_configuration = {
+        "bolha": configuration.SpiderConfig(notifications=notifications, urls={}, coalesce={"email": COALESCE_CONFIG})
+    }
+    report = scrape.RunReport()
+    scrape.notify({"bolha": [{"url": "url_1"}]}, spiders_configuration, report, buffer=buffer)
+
+    assert sent == ["push"]
+    assert [(error.stage, error.notificator) for error in report.errors] == [("notify", "email")]
+
+
+def test_invalid_urgent_pattern_is_rejected():
+    with pytest.raises(pydantic.ValidationError):
+        configuration.CoalesceConfig(urgent={"title": "(unclosed"})
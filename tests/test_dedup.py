@@ -0,0 +1,66 @@
+import sqlite3
+
+from news_crawlers import cache
+from news_crawlers import configuration
+from news_crawlers import dedup
+from news_crawlers import history
+from news_crawlers import scrape
+from news_crawlers import spiders
+
+BOOK = {"title": "Pet prijateljev", "url": "https://www.bolha.com/1"}
+
+
+class OverlappingSpider(spiders.Spider):
+    name = "overlapping"
+
+    def run_query(self, query: str, url: str) -> list[spiders.SpiderItem]:
+        return [{"query": query, **BOOK}, {"query": query, "title": url, "url": url}]
+
+
+def test_listing_found_by_multiple_queries_is_notified_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(spiders, "get_spider_by_name", lambda name: OverlappingSpider)
+    spiders_configuration = {
+        "overlapping": configuration.SpiderConfig(
+            notifications={}, urls={"pet_prijateljev": "url_1", "enid_blyton": "url_2"}, dedup_key="url"
+        )
+    }
+
+    report = scrape.RunReport()
+    diff = scrape.scrape(["overlapping"], spiders_configuration, tmp_path, report)
+
+    merged_query = {"pet_prijateljev,enid_blyton", "enid_blyton,pet_prijateljev"}
+    assert len(diff["overlapping"]) == 3
+    assert [item["query"] for item in diff["overlapping"] if item["url"] == BOOK["url"]][0] in merged_query
+    assert sorted(query_report.duplicates for query_report in report.queries) == [0, 1]
+
+    # both queries have cached the listing, so neither reports it in later runs
+    for query in ("pet_prijateljev", "enid_blyton"):
+        assert {"query": query, **BOOK} in cache.read_query_items(tmp_path, "overlapping", query)
+    assert not scrape.scrape(["overlapping"], spiders_configuration, tmp_path)
+
+
+def test_items_without_dedup_key_are_not_duplicates():
+    index = dedup.RunDedupIndex("url")
+
+    assert not index.claim("first", [{"title": "a"}, {"url": "1"}])
+    assert index.claim("second", [{"title": "a"}, {"url": "1"}, {"url": "2"}]) == {"1"}
+    assert index.merge_queries([{"title": "a"}, {"url": "1"}, {"url": "2"}]) == [
+        {"title": "a"},
+        {"url": "1", "query": "first,second"},
+        {"url": "2"},
+    ]
+
+
+def test_duplicates_are_added_to_existing_history(tmp_path):
+    path = tmp_path / history.HISTORY_FILE_NAME
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE queries (run_id INTEGER, spider TEXT, query TEXT, duration REAL, pages INTEGER, "
+            "bytes INTEGER, items INTEGER, new_items INTEGER, failed INTEGER, unfinished INTEGER)"
+        )
+    connection.close()
+
+    run_history = history.RunHistory(path)
+    run_history.record(scrape.RunReport(queries=[scrape.QueryReport(spider="bolha", query="books", duplicates=2)]))
+
+    assert history.get_query_stats(run_history.queries(last=1))[0].duplicates_total == 2
@@ -0,0 +1,34 @@
+import bs4
+
+from news_crawlers import extraction
+
+PAGE = """
+<ul>
+    <li class="row"><a class="link" href="/a">  First  </a><b>1<span> EUR</span></b></li>
+    <li class="row"><a class="link">Without href</a><b>2</b></li>
+    <li class="row"><a class="link" href="/c">Without price</a></li>
+</ul>
+"""
+
+
+def test_row_extractor_extracts_fields_of_complete_rows():
+    extractor = extraction.RowExtractor(
+        "li.row",
+        {
+            "title": extraction.Field(selector="a.link", strip="value"),
+            "url": extraction.Field(selector="a.link", attribute="href"),
+            "price": extraction.Field(selector="b", strip="fragments"),
+        },
+    )
+
+    items = extractor.extract(bs4.BeautifulSoup(PAGE, "html.parser"))
+
+    assert items == [{"title": "First", "url": "/a", "price": "1EUR"}]
+
+
+def test_unstripped_text_is_kept():
+    extractor = extraction.RowExtractor("li.row", {"title": extraction.Field(selector="a.link")})
+
+    items = extractor.extract(bs4.BeautifulSoup(PAGE, "html.parser"))
+
+    assert [item["title"] for item in items] == ["  First  ", "Without href", "Without price"]
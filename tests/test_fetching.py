@@ -0,0 +1,346 @@
+import gzip
+import http.server
+import threading
+import time
+from collections.abc import Iterator
+
+import pytest
+import requests
+
+from news_crawlers import configuration
+from news_crawlers import fetching
+from news_crawlers import metrics
+
+# pylint: disable=unused-argument
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(name="clock")
+def clock_fixture() -> FakeClock:
+    return FakeClock()
+
+
+def _limiter(clock: FakeClock, **config) -> fetching.HostRateLimiter:
+    return fetching.HostRateLimiter(configuration.RateLimitConfig(**config), clock=clock.time, sleep=clock.sleep)
+
+
+def test_rate_limiter_allows_burst_then_waits_for_tokens(clock: FakeClock):
+    limiter = _limiter(clock, requests_per_second=2, burst=2)
+
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release(200)
+
+    # two requests are allowed immediately, each of the next two waits for half a second
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_rate_limiter_honors_retry_after_and_slows_down(clock: FakeClock):
+    limiter = _limiter(clock, requests_per_second=4, burst=1)
+
+    limiter.acquire()
+    limiter.release(429, "30")
+    assert limiter.rate == 2
+
+    limiter.acquire()
+    assert clock.now == 30
+
+
+def test_rate_limiter_backs_off_exponentially_without_retry_after(clock: FakeClock):
+    limiter = _limiter(clock, requests_per_second=1000, burst=1)
+
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(503)
+
+    # first request goes through immediately, then 1s and 2s backoff periods
+    assert sum(clock.sleeps) == pytest.approx(3, abs=0.01)
+
+
+def test_rate_limiter_caps_retry_after(clock: FakeClock):
+    limiter = _limiter(clock, requests_per_second=4, burst=1, max_backoff_seconds=60)
+
+    limiter.acquire()
+    limiter.release(429, "86400")
+
+    limiter.acquire()
+    assert clock.now == 60
+
+
+def test_rate_limiter_does_not_wait_past_deadline(clock: FakeClock):
+    limiter = _limiter(clock, requests_per_second=4, burst=1, max_in_flight=1)
+    limiter.acquire()
+    limiter.release(429, "30")
+
+    with fetching.deadline(10), pytest.raises(fetching.DeadlineExceededError):
+        limiter.acquire()
+
+    # the in-flight slot is released, so requests can be sent once the host allows it
+    assert not clock.sleeps
+    limiter.acquire()
+    assert clock.now == 30
+
+
+def test_rate_limiter_recovers_rate_after_successful_responses(clock: FakeClock):
+    limiter = _limiter(clock, requests_per_second=10, burst=1)
+
+    limiter.acquire()
+    limiter.release(429, "0")
+    assert limiter.rate == 5
+
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(200)
+
+    assert limiter.rate == 10
+
+
+def test_rate_limiter_is_shared_per_host():
+    assert fetching.get_rate_limiter("www.bolha.com") is fetching.get_rate_limiter("www.bolha.com")
+    assert fetching.get_rate_limiter("www.bolha.com") is not fetching.get_rate_limiter("www.avto.net")
+
+
+def test_rate_limits_are_configurable_per_host():
+    fetching.configure_rate_limits({"www.avto.net": configuration.RateLimitConfig(requests_per_second=0.5)})
+
+    assert fetching.get_rate_limiter("www.avto.net").config.requests_per_second == 0.5
+    assert fetching.get_rate_limiter("www.bolha.com").config == configuration.RateLimitConfig()
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [(None, None), ("120", 120.0), ("Wed, 21 Oct 2015 07:28:30 GMT", 30.0), ("invalid", None)],
+)
+def test_parse_retry_after(value, expected):
+    assert fetching.parse_retry_after(value, now=1445412480) == expected
+
+
+class ResponseStub:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b""
+        self.text = ""
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+
+def _mock_responses(monkeypatch, outcomes: list) -> list[str]:
+    requested_urls = []
+
+    def mock_get(url: str, headers: dict[str, str], timeout: float, **kwargs) -> ResponseStub:
+        requested_urls.append(url)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return ResponseStub(outcome)
+
+    monkeypatch.setattr(requests, "get", mock_get)
+    return requested_urls
+
+
+def test_fetcher_retries_transient_errors(monkeypatch):
+    requested_urls = _mock_responses(monkeypatch, [requests.ConnectionError(), 503, 200])
+    sleeps = []
+    fetcher = fetching.Fetcher(configuration.FetchConfig(retries=2), sleep=sleeps.append)
+
+    response = fetcher.get("https://retry.example.com/")
+
+    assert response.status_code == 200
+    assert len(requested_urls) == 3
+    assert len(sleeps) == 2
+    assert sleeps[0] <= 0.5 and sleeps[1] <= 1.0
+
+
+def test_fetcher_does_not_retry_client_errors(monkeypatch):
+    requested_urls = _mock_responses(monkeypatch, [404])
+    fetcher = fetching.Fetcher(configuration.FetchConfig(retries=2), sleep=lambda _: None)
+
+    with pytest.raises(requests.HTTPError):
+        fetcher.get_html("https://no-retry.example.com/")
+
+    assert len(requested_urls) == 1
+
+
+def test_fetcher_raises_last_error_when_retries_are_exhausted(monkeypatch):
+    _mock_responses(monkeypatch, [requests.Timeout(), requests.Timeout()])
+    fetcher = fetching.Fetcher(configuration.FetchConfig(retries=1), sleep=lambda _: None)
+
+    with pytest.raises(requests.Timeout):
+        fetcher.get("https://exhausted.example.com/")
+
+
+def test_circuit_breaker_fails_fast_while_host_is_down(monkeypatch):
+    requested_urls = _mock_responses(monkeypatch, [requests.ConnectionError()] * 2)
+    fetcher = fetching.Fetcher(
+        configuration.FetchConfig(retries=0, breaker_failures=2, breaker_reset_seconds=60), sleep=lambda _: None
+    )
+
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            fetcher.get("https://down.example.com/")
+
+    with pytest.raises(fetching.CircuitOpenError):
+        fetcher.get("https://down.example.com/")
+
+    assert len(requested_urls) == 2
+
+
+def test_circuit_breaker_closes_after_successful_trial(clock: FakeClock):
+    config = configuration.FetchConfig(breaker_failures=1, breaker_reset_seconds=10)
+    breaker = fetching.CircuitBreaker("flaky.example.com", clock=clock.time)
+
+    breaker.record_failure(config)
+    with pytest.raises(fetching.CircuitOpenError):
+        breaker.before_request(config)
+
+    clock.now = 10
+    breaker.before_request(config)
+    # only a single trial request is allowed while half-open
+    with pytest.raises(fetching.CircuitOpenError):
+        breaker.before_request(config)
+
+    breaker.record_success()
+    breaker.before_request(config)
+    assert not breaker.is_open
+
+
+def test_circuit_breaker_trial_without_outcome_does_not_keep_circuit_open(monkeypatch):
+    requested_urls = _mock_responses(
+        monkeypatch, [requests.ConnectionError(), requests.exceptions.ChunkedEncodingError(), 200]
+    )
+    fetcher = fetching.Fetcher(
+        configuration.FetchConfig(retries=0, breaker_failures=1, breaker_reset_seconds=0.001), sleep=lambda _: None
+    )
+
+    with pytest.raises(requests.ConnectionError):
+        fetcher.get("https://half-open.example.com/")
+    time.sleep(0.01)
+    # trial requests fail with an error, which is not a host failure, and are interrupted by the deadline
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        fetcher.get("https://half-open.example.com/")
+    with fetching.deadline(0), pytest.raises(fetching.DeadlineExceededError):
+        fetcher.get("https://half-open.example.com/")
+
+    assert fetcher.get("https://half-open.example.com/").status_code == 200
+    assert len(requested_urls) == 3
+    assert not fetching.get_circuit_breaker("half-open.example.com").is_open
+
+
+class _GzipHandler(http.server.BaseHTTPRequestHandler):
+    body = b"<html>" + b"<p>listing</p>" * 1000 + b"</html>"
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        compressed = gzip.compress(self.body)
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(compressed)))
+        self.end_headers()
+        self.wfile.write(compressed)
+
+    def log_message(self, format: str, *args) -> None:  # pylint: disable=redefined-builtin
+        pass
+
+
+class _ChunkedGzipHandler(_GzipHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        compressed = gzip.compress(self.body)
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for start in range(0, len(compressed), 50):
+            chunk = compressed[start : start + 50]
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def _serve(handler: type[http.server.BaseHTTPRequestHandler]) -> Iterator[str]:
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(name="gzip_server_url")
+def gzip_server_url_fixture() -> Iterator[str]:
+    yield from _serve(_GzipHandler)
+
+
+@pytest.fixture(name="chunked_gzip_server_url")
+def chunked_gzip_server_url_fixture() -> Iterator[str]:
+    yield from _serve(_ChunkedGzipHandler)
+
+
+def test_accept_encoding_only_offers_decodable_encodings():
+    offered = [encoding.strip() for encoding in fetching.DEFAULT_HEADERS["Accept-Encoding"].split(",")]
+
+    assert "sdch" not in offered
+    assert {"gzip", "deflate"} <= set(offered)
+
+
+def test_get_records_wire_and_decoded_bytes(gzip_server_url: str):
+    metrics.REGISTRY.reset()
+
+    response = fetching.get(gzip_server_url)
+
+    fetch = metrics.REGISTRY.run_summary()["fetches"][0]
+    assert response.content == _GzipHandler.body
+    assert fetch["bytes"] == len(_GzipHandler.body)
+    assert fetch["wire_bytes"] == len(gzip.compress(_GzipHandler.body))
+    assert 'encoding="gzip",host="127.0.0.1"' in "".join(
+        metrics.REGISTRY.run_summary()["metrics"]["news_crawlers_fetch_wire_bytes_total"]
+    )
+    metrics.REGISTRY.reset()
+
+
+def test_get_records_wire_bytes_of_chunked_response(chunked_gzip_server_url: str):
+    metrics.REGISTRY.reset()
+
+    response = fetching.get(chunked_gzip_server_url)
+
+    fetch = metrics.REGISTRY.run_summary()["fetches"][0]
+    assert "Content-Length" not in response.headers
+    assert response.content == _GzipHandler.body
+    # compressed body and the chunk framing (size lines and line endings of each chunk)
+    compressed_size = len(gzip.compress(_GzipHandler.body))
+    assert compressed_size <= fetch["wire_bytes"] < fetch["bytes"]
+    metrics.REGISTRY.reset()
+
+
+def test_request_timeout_is_limited_by_deadline(monkeypatch):
+    timeouts = []
+
+    def mock_get(url: str, headers: dict[str, str], timeout: float, **kwargs) -> requests.Response:
+        # slow host, which does not respond before the timeout
+        timeouts.append(timeout)
+        time.sleep(timeout)
+        raise requests.Timeout("read timed out")
+
+    monkeypatch.setattr(requests, "get", mock_get)
+    fetcher = fetching.Fetcher(configuration.FetchConfig(timeout=10, retries=3))
+
+    with fetching.deadline(0.05), pytest.raises(fetching.DeadlineExceededError):
+        fetcher.get("https://slow.example.com")
+
+    assert len(timeouts) == 1
+    assert timeouts[0] <= 0.05
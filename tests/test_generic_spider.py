@@ -0,0 +1,101 @@
+import pathlib
+
+import pytest
+import requests
+
+from news_crawlers import configuration
+from news_crawlers import scrape
+from news_crawlers import spiders
+
+# pylint: disable=unused-argument
+
+SHOP_URL = "https://shop.example.com/search?q=lego"
+
+
+def _page(listing_ids: list[int], num_pages: int = 0) -> str:
+    rows = "".join(
+        f'<article><h2> Lego {listing_id} </h2><a href="/items/{listing_id}">details</a></article>'
+        for listing_id in listing_ids
+    )
+    links = "".join(f'<a class="page" href="/search?q=lego&p={page}">{page}</a>' for page in range(1, num_pages + 1))
+    return f"<html><body>{rows}<nav>{links}</nav></body></html>"
+
+
+def _mock_site(monkeypatch, pages: dict[str, str]) -> list[str]:
+    requested_urls = []
+
+    def mock_get(
+        session: requests.Session, url: str, headers: dict[str, str], timeout: float, **kwargs
+    ) -> requests.Response:
+        requested_urls.append(url)
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200 if url in pages else 404
+        response.encoding = "utf8"
+        response._content = pages.get(url, "").encode("utf8")  # pylint: disable=protected-access
+        return response
+
+    monkeypatch.setattr(requests.Session, "get", mock_get)
+    return requested_urls
+
+
+def _spider_config(pagination: dict[str, str] | None = None) -> configuration.SpiderConfig:
+    return configuration.SpiderConfig.model_validate(
+        {
+            "type": "generic",
+            "notifications": {},
+            "urls": {"lego": SHOP_URL},
+            "extraction": {
+                "rows": "article",
+                "fields": {
+                    "title": {"selector": "h2", "strip": "value"},
+                    "url": {"selector": "a", "attribute": "href"},
+                },
+                "pagination": pagination,
+            },
+        }
+    )
+
+
+def test_pages_are_discovered_from_pagination_links(monkeypatch):
+    requested_urls = _mock_site(
+        monkeypatch,
+        {
+            SHOP_URL: _page([1, 2], num_pages=3),
+            SHOP_URL + "&p=2": _page([3, 4], num_pages=3),
+            SHOP_URL + "&p=3": _page([5], num_pages=3),
+        },
+    )
+
+    items = spiders.GenericSpider.from_config(_spider_config({"page_param": "p", "links": "nav a.page"})).run()
+
+    assert [item["title"] for item in items] == ["Lego 1", "Lego 2", "Lego 3", "Lego 4", "Lego 5"]
+    assert items[0] == {"query": "lego", "title": "Lego 1", "url": "https://shop.example.com/items/1"}
+    assert sorted(requested_urls) == [SHOP_URL, SHOP_URL + "&p=2", SHOP_URL + "&p=3"]
+
+
+def test_pages_are_crawled_until_empty_page(monkeypatch):
+    requested_urls = _mock_site(
+        monkeypatch,
+        {SHOP_URL: _page([1, 2]), SHOP_URL + "&p=2": _page([3]), SHOP_URL + "&p=3": _page([])},
+    )
+
+    items = spiders.GenericSpider.from_config(_spider_config({"page_param": "p"})).run()
+
+    assert len(items) == 3
+    assert requested_urls == [SHOP_URL, SHOP_URL + "&p=2", SHOP_URL + "&p=3"]
+
+
+def test_generic_spider_is_run_by_scrape(monkeypatch, tmp_path: pathlib.Path):
+    _mock_site(monkeypatch, {SHOP_URL: _page([1, 2])})
+    report = scrape.RunReport()
+
+    diff = scrape.scrape(["lego_shop"], {"lego_shop": _spider_config()}, tmp_path, report)
+
+    assert not report.errors
+    assert len(diff["lego_shop"]) == 2
+
+
+def test_generic_spider_requires_extraction_config():
+    with pytest.raises(ValueError):
+        spiders.GenericSpider.from_config(configuration.SpiderConfig(type="generic", notifications={}, urls={}))
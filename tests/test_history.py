@@ -0,0 +1,106 @@
+import pathlib
+
+import pytest
+
+from news_crawlers import configuration
+from news_crawlers import history
+from news_crawlers import metrics
+from news_crawlers import scrape
+from news_crawlers import spiders
+from news_crawlers.__main__ import main
+
+# pylint: disable=unused-argument
+
+
+def _report(started: float, duration: float, pages: int, failed: bool = False) -> scrape.RunReport:
+    return scrape.RunReport(
+        started=started,
+        duration=duration + 1.0,
+        queries=[
+            scrape.QueryReport(
+                spider="bolha",
+                query="books",
+                items=pages * 10,
+                new_items=1,
+                duration=duration,
+                pages=pages,
+                bytes=pages * 1000,
+                error="RuntimeError: failed" if failed else None,
+            )
+        ],
+    )
+
+
+@pytest.fixture(name="run_history")
+def run_history_fixture(tmp_path: pathlib.Path) -> history.RunHistory:
+    run_history = history.RunHistory(tmp_path / history.HISTORY_FILE_NAME)
+    for run in range(10):
+        run_history.record(_report(started=1000.0 + run, duration=2.0 + run % 2, pages=5))
+    return run_history
+
+
+def test_query_stats(run_history: history.RunHistory):
+    run_history.record(_report(started=2000.0, duration=50.0, pages=5, failed=True))
+
+    stats = history.get_query_stats(run_history.queries(last=100))
+
+    assert len(stats) == 1
+    assert (stats[0].runs, stats[0].failures, stats[0].new_items_total) == (11, 1, 11)
+    assert (stats[0].duration_p50, stats[0].duration_p99) == (2.0, 3.0)
+    assert (stats[0].pages_p50, stats[0].items_p50) == (5, 50)
+    assert len(run_history.runs(last=3)) == 3
+    assert run_history.runs(last=3)[-1].started == 2000.0
+
+
+def test_regressions_are_found_in_recent_runs(run_history: history.RunHistory):
+    assert not history.find_regressions(run_history.runs(100), run_history.queries(100), recent=1, threshold=2.0)
+
+    # site has changed, only a single page is found, and the query has become slow
+    run_history.record(_report(started=2000.0, duration=10.0, pages=1))
+
+    regressions = history.find_regressions(run_history.runs(100), run_history.queries(100), recent=1, threshold=2.0)
+
+    assert [(regression.subject, regression.metric, regression.value) for regression in regressions] == [
+        ("run", "duration", 11.0),
+        ("bolha:books", "duration", 10.0),
+        ("bolha:books", "pages", 1.0),
+    ]
+    assert regressions[1].baseline == 2.0
+
+
+def test_percentile():
+    assert history.percentile([], 0.5) == 0.0
+    assert history.percentile([3.0, 1.0, 2.0, 4.0], 0.5) == 2.0
+    assert history.percentile([3.0, 1.0, 2.0, 4.0], 0.9) == 4.0
+
+
+class FetchingSpider(spiders.Spider):
+    name = "fetching"
+
+    def run_query(self, query: str, url: str) -> list[spiders.SpiderItem]:
+        for page in range(3):
+            metrics.record_fetch(f"{url}?page={page}", "200", 100, 0.1)
+        metrics.record_fetch(url, "error", 0, 0.1)
+        return [{"query": query}]
+
+
+def test_query_report_counts_fetched_pages(monkeypatch, tmp_path: pathlib.Path):
+    monkeypatch.setattr(spiders, "get_spider_by_name", lambda name: FetchingSpider)
+    report = scrape.RunReport()
+
+    scrape.scrape(
+        ["fetching"], {"fetching": configuration.SpiderConfig(notifications={}, urls={"q": "url"})}, tmp_path, report
+    )
+
+    assert (report.queries[0].pages, report.queries[0].bytes) == (3, 300)
+
+
+def test_stats_command(run_history: history.RunHistory, capsys):
+    run_history.record(_report(started=2000.0, duration=10.0, pages=5))
+
+    assert main(("stats", "--cache", str(run_history.path.parent), "--recent", "1")) == 0
+
+    out, _ = capsys.readouterr()
+    assert out.startswith("11 runs since ")
+    assert "bolha:books" in out
+    assert "bolha:books duration: 10.0 (baseline 2.0)" in out
@@ -0,0 +1,43 @@
+import json
+import logging
+import pathlib
+import threading
+
+from news_crawlers import logs
+
+
+def test_diff_summary_samples_items():
+    diff = {"bolha": [{"title": str(index)} for index in range(5)], "avtonet": [{"title": "x" * 500}]}
+
+    summary = str(logs.DiffSummary(diff, sample_size=2))
+
+    assert summary.startswith('bolha: 5 new [{"title": "0"}, {"title": "1"}, ... 3 more]; avtonet: 1 new [{"title": "x')
+    assert len(summary) < 300
+    assert logs.DiffSummary(diff).counts() == {"bolha": 5, "avtonet": 1}
+    assert str(logs.DiffSummary({})) == "no new items"
+
+
+def test_records_are_written_as_json_on_background_thread(tmp_path: pathlib.Path):
+    log_path = tmp_path / "news_crawlers.log"
+    logger = logging.getLogger("news_crawlers.test_logs")
+    logger.setLevel(logging.DEBUG)
+    writing_threads = []
+
+    class ThreadRecordingHandler(logging.Handler):
+        def emit(self, record: logging.LogRecord) -> None:
+            writing_threads.append(threading.current_thread())
+
+    logs.start_queue_logging([logs.create_file_handler(log_path, 7, "json"), ThreadRecordingHandler()], [logger])
+    try:
+        logger.info("Found new items: %s", logs.DiffSummary({"bolha": [{"title": "a"}]}), extra={"spider": "bolha"})
+    finally:
+        logs.stop_queue_logging()
+
+    event = json.loads(log_path.read_text(encoding="utf8"))
+    assert event["level"] == "INFO"
+    assert event["logger"] == "news_crawlers.test_logs"
+    assert event["message"] == 'Found new items: bolha: 1 new [{"title": "a"}]'
+    assert event["spider"] == "bolha"
+    assert event["new_items"] == {"bolha": 1}
+    assert writing_threads and writing_threads[0] is not threading.current_thread()
+    assert not logger.handlers
@@ -1,4 +1,5 @@
 import json
+import logging
 import os
 import pathlib
 import re
@@ -6,6 +7,7 @@ import re
 import pytest
 
 from news_crawlers.__main__ import main
+from news_crawlers import logs
 from news_crawlers import notificators
 from tests import mocks
 
@@ -64,15 +66,29 @@ def test_version(capsys):
 
 def test_log_option_creates_log_file(dummy_config, tmp_path: pathlib.Path):
     log_path = tmp_path / "news_crawlers.log"
-    main(("scrape", "--config", str(tmp_path / "news_crawlers.yaml")))
+    main(("scrape", "--config", str(tmp_path / "news_crawlers.yaml"), "--cache", str(tmp_path / ".nc_cache")))
 
     assert not log_path.exists()
 
-    main(("--log", str(log_path), "scrape", "--config", str(tmp_path / "news_crawlers.yaml")))
+    main(("--log", str(log_path), "scrape", "--config", str(tmp_path / "news_crawlers.yaml"), "--cache", str(tmp_path)))
 
     assert log_path.exists()
 
 
+def test_json_log_format(dummy_config, tmp_path: pathlib.Path, caplog):
+    caplog.set_level(logging.DEBUG, logger="main")
+    log_path = tmp_path / "news_crawlers.log"
+
+    config_path = tmp_path / "news_crawlers.yaml"
+
+    main(("--log", str(log_path), "--log_format", "json", "scrape", "-c", str(config_path), "--cache", str(tmp_path)))
+    logs.stop_queue_logging()
+
+    events = [json.loads(line) for line in log_path.read_text(encoding="utf8").splitlines()]
+    assert events[0]["message"] == "Application started."
+    assert all(event["logger"] == "main" for event in events)
+
+
 @pytest.mark.usefixtures("mock_request_avtonet")
 def test_running_scrape_command_returns_expected_items(monkeypatch, tmp_path: pathlib.Path, avtonet_dummy_config):
     monkeypatch.setattr(notificators.EmailNotificator, "send_text", mocks.send_text_mock)
@@ -92,10 +108,39 @@ def test_running_scrape_command_returns_expected_items(monkeypatch, tmp_path: pa
         )
     )
 
-    cache_file_path = tmp_path / ".nc_cache" / "avtonet_cached.json"
+    cache_file_path = tmp_path / ".nc_cache" / "avtonet" / "dummy_url.json"
     assert cache_file_path.exists()
 
     with open(cache_file_path, encoding="utf8") as cache_file:
         listings = json.load(cache_file)
 
     assert len(listings) == 2
+
+
+@pytest.mark.usefixtures("mock_request_avtonet")
+def test_scrape_with_work_queue_crawls_tick_once(monkeypatch, tmp_path: pathlib.Path, avtonet_dummy_config):
+    monkeypatch.setattr(notificators.EmailNotificator, "send_text", mocks.send_text_mock)
+    monkeypatch.setattr(os, "environ", {"EMAIL_USER": "dummy_email", "EMAIL_PASS": "dummy_pass"})
+
+    args = (
+        "scrape",
+        "--config",
+        str(tmp_path / "news_crawlers.yaml"),
+        "--cache",
+        str(tmp_path / ".nc_cache"),
+        "--queue",
+        str(tmp_path / "queue.sqlite"),
+        "--tick_seconds",
+        "3600",
+        "--report",
+        str(tmp_path / "report.json"),
+    )
+    main(args)
+    # second run in the same tick finds no work left
+    main(args)
+
+    with open(tmp_path / "report.json", encoding="utf8") as file:
+        report = json.load(file)
+
+    assert (tmp_path / ".nc_cache" / "avtonet" / "dummy_url.json").exists()
+    assert report["queries"] == []
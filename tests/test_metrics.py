@@ -0,0 +1,73 @@
+import json
+import urllib.request
+
+import pytest
+
+from news_crawlers import metrics
+from news_crawlers import spiders
+
+
+@pytest.fixture(name="registry")
+def registry_fixture():
+    metrics.REGISTRY.reset()
+    yield metrics.REGISTRY
+    metrics.REGISTRY.reset()
+
+
+def test_counter_is_rendered_with_context_labels(registry: metrics.MetricsRegistry):
+    with metrics.labels(spider="bolha"):
+        metrics.inc("news_crawlers_items_total", 3)
+
+    assert 'news_crawlers_items_total{spider="bolha"} 3.0' in registry.render_prometheus()
+
+
+def test_histogram_is_rendered_with_buckets(registry: metrics.MetricsRegistry):
+    metrics.observe("news_crawlers_parse_seconds", 0.02, spider="avtonet")
+
+    text = registry.render_prometheus()
+
+    assert 'news_crawlers_parse_seconds_bucket{spider="avtonet",le="0.01"} 0' in text
+    assert 'news_crawlers_parse_seconds_bucket{spider="avtonet",le="0.025"} 1' in text
+    assert 'news_crawlers_parse_seconds_count{spider="avtonet"} 1' in text
+
+
+def test_run_summary_only_contains_current_run(registry: metrics.MetricsRegistry):
+    metrics.inc("news_crawlers_new_items_total", 5, spider="bolha")
+    registry.begin_run()
+    metrics.inc("news_crawlers_new_items_total", 2, spider="bolha")
+
+    summary = registry.run_summary()
+
+    assert summary["metrics"]["news_crawlers_new_items_total"] == {'spider="bolha"': 2.0}
+
+
+@pytest.mark.usefixtures("mock_request_avtonet")
+def test_spider_run_records_fetch_and_parse_metrics(registry: metrics.MetricsRegistry):
+    with metrics.labels(spider="avtonet"):
+        spiders.AvtonetSpider({"test_query": "https://www.avto.net/results"}).run()
+
+    summary = registry.run_summary()
+
+    assert summary["fetches"][0]["url"] == "https://www.avto.net/results"
+    assert summary["fetches"][0]["query"] == "test_query"
+    assert summary["fetches"][0]["bytes"] > 0
+    assert summary["metrics"]["news_crawlers_pages_total"] == {
+        'host="www.avto.net",query="test_query",spider="avtonet"': 1.0
+    }
+    assert 'query="test_query",spider="avtonet"' in summary["metrics"]["news_crawlers_parse_seconds"]
+
+
+@pytest.mark.usefixtures("registry")
+def test_http_server_serves_metrics_and_summary():
+    metrics.inc("news_crawlers_items_total", spider="bolha")
+    server = metrics.start_http_server(0, "127.0.0.1")
+    port = server.server_address[1]
+
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert b'news_crawlers_items_total{spider="bolha"} 1.0' in response.read()
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/summary", timeout=5) as response:
+            assert "metrics" in json.load(response)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -4,12 +4,15 @@ Contains tests for Notificator classes.
 from __future__ import annotations
 
 from itertools import product
+import json
 import os
 
 import pytest
+import requests
 
+from news_crawlers import fetching
 from news_crawlers import notificators
-from tests.mocks import HttpsSessionMock, SmtpMock
+from tests.mocks import HttpsSessionMock, LocalHttpServer, SmtpMock
 
 
 def get_test_messages_combinations() -> list[tuple[str, int, int, int]]:
@@ -143,6 +146,7 @@ def _send_test_items(pushover, num_test_items, text_length, num_users, send_sepa
     [
         ("email", notificators.EmailNotificator),
         ("pushover", notificators.PushoverNotificator),
+        ("webhook", notificators.WebhookNotificator),
     ],
 )
 def test_get_notificator_by_name(notificator_name: str, expected: notificators.Notificator) -> None:
@@ -188,3 +192,123 @@ def test_handle_secrets_in_configuration():
         {"test_key_1": "__env_TEST_1", "test_key_2": "test_val_2"}
     )
     assert parsed_config == {"test_key_1": "test_val_1", "test_key_2": "test_val_2"}
+
+
+def test_digest_is_divided_and_sent_through_single_session(monkeypatch) -> None:
+    opened_sessions = []
+
+    def open_session() -> HttpsSessionMock:
+        opened_sessions.append(HttpsSessionMock())
+        return opened_sessions[-1]
+
+    pushover = notificators.PushoverNotificator({"app_token": "app_token", "recipients": "user_key_1"})
+    monkeypatch.setattr(pushover, "_open_session", open_session)
+
+    sections = [
+        notificators.DigestSection("avtonet", [{"title": "a" * 600}], "{title}\n"),
+        notificators.DigestSection("bolha", [{"title": "b" * 600}], "{title}\n"),
+    ]
+    pushover.send_digest("digest", sections)
+
+    assert len(opened_sessions) == 1
+    assert opened_sessions[0].simulated_messages == [
+        "avtonet (1 new)\n" + "a" * 600 + "\n\nbolha (1 new)\n",
+        "b" * 600 + "\n",
+    ]
+
+
+def test_webhook_sends_batches_to_all_endpoints_over_kept_alive_connections() -> None:
+    items = [{"title": f"item_{ind}"} for ind in range(7)]
+
+    with LocalHttpServer() as first_server, LocalHttpServer() as second_server:
+        webhook = notificators.WebhookNotificator(
+            {"urls": f"{first_server.url},{second_server.url}", "max_batch_items": "3", "token": "secret"}
+        )
+        try:
+            webhook.send_items("bolha news", items, "{title}\n")
+        finally:
+            webhook.close()
+
+    for server in (first_server, second_server):
+        assert [[message["item"] for message in body["messages"]] for body in server.bodies] == [
+            items[:3],
+            items[3:6],
+            items[6:],
+        ]
+        assert len(set(server.client_ports)) == 1
+    assert first_server.bodies[0]["subject"] == "bolha news"
+    assert first_server.bodies[0]["messages"][0]["text"] == "item_0\n"
+
+
+def test_webhook_batches_are_limited_by_size() -> None:
+    webhook = notificators.WebhookNotificator({"urls": "http://127.0.0.1/hook", "max_batch_bytes": "300"})
+    messages = [{"text": "č" * length} for length in range(1, 60, 5)]
+
+    payloads = webhook.get_payloads("subject", messages)
+
+    assert len(payloads) > 1
+    assert all(len(payload) <= 300 for payload in payloads)
+    assert [message for payload in payloads for message in json.loads(payload)["messages"]] == messages
+    # a batch is only closed when the next message does not fit into it
+    for payload, next_payload in zip(payloads, payloads[1:]):
+        next_message = json.loads(next_payload)["messages"][0]
+        assert len(payload) + len(json.dumps(next_message, ensure_ascii=False).encode("utf8")) + 2 > 300
+
+
+def test_webhook_retries_failed_requests() -> None:
+    with LocalHttpServer() as server:
+        server.statuses.extend([503, 500])
+        webhook = notificators.WebhookNotificator({"urls": server.url, "retry_backoff_seconds": "0"})
+        try:
+            webhook.send_text("subject", "message")
+        finally:
+            webhook.close()
+
+    assert [body["messages"] for body in server.bodies] == [[{"text": "message"}]] * 3
+
+
+def test_webhook_retry_after_is_limited_by_max_backoff(monkeypatch) -> None:
+    sleeps = []
+    monkeypatch.setattr(notificators.time, "sleep", sleeps.append)
+    with LocalHttpServer() as server:
+        server.statuses.append(429)
+        server.retry_after = "86400"
+        webhook = notificators.WebhookNotificator({"urls": server.url, "max_backoff_seconds": "5"})
+        try:
+            webhook.send_text("subject", "message")
+        finally:
+            webhook.close()
+
+    assert sleeps == [5]
+    assert len(server.bodies) == 2
+
+
+def test_webhook_does_not_wait_past_deadline(monkeypatch) -> None:
+    sleeps = []
+    monkeypatch.setattr(notificators.time, "sleep", sleeps.append)
+    with LocalHttpServer() as server:
+        server.statuses.append(503)
+        server.retry_after = "60"
+        webhook = notificators.WebhookNotificator({"urls": server.url})
+        try:
+            with fetching.deadline(10), pytest.raises(fetching.DeadlineExceededError):
+                webhook.send_text("subject", "message")
+        finally:
+            webhook.close()
+
+    assert not sleeps
+    assert len(server.bodies) == 1
+
+
+def test_webhook_failure_of_one_endpoint_does_not_stop_others() -> None:
+    with LocalHttpServer() as failing_server, LocalHttpServer() as server:
+        failing_server.statuses.append(400)
+        webhook = notificators.WebhookNotificator({"urls": f"{failing_server.url},{server.url}", "retries": "0"})
+
+        try:
+            with pytest.raises(requests.HTTPError):
+                webhook.send_text("subject", "message")
+        finally:
+            webhook.close()
+
+    assert len(server.bodies) == 1
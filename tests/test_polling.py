@@ -0,0 +1,98 @@
+import pathlib
+import time
+
+import pytest
+
+from news_crawlers import cache
+from news_crawlers import configuration
+from news_crawlers import polling
+from news_crawlers import scrape
+from news_crawlers import spiders
+
+# pylint: disable=unused-argument
+
+POLLING_CONFIG = configuration.PollingConfig(min_interval_minutes=10, max_interval_minutes=160, smoothing=0.5)
+
+
+def test_interval_grows_while_query_finds_no_new_items(tmp_path: pathlib.Path):
+    intervals = []
+    for poll in range(4):
+        state = polling.record_poll(tmp_path, "bolha", "books", 1 if poll == 0 else 0, POLLING_CONFIG, poll * 3600.0)
+        intervals.append(polling.get_interval(state, POLLING_CONFIG) / 60)
+
+    # change rate is halved with each poll without new items
+    assert intervals == pytest.approx([10, 10 * 16**0.5, 10 * 16**0.75, 10 * 16**0.875])
+
+    state = polling.record_poll(tmp_path, "bolha", "books", 3, POLLING_CONFIG, 4 * 3600.0)
+
+    assert polling.get_interval(state, POLLING_CONFIG) / 60 == pytest.approx(10 * 16 ** (1 - 0.5625))
+
+
+def test_query_is_due_once_its_interval_has_passed(tmp_path: pathlib.Path):
+    assert polling.is_due(tmp_path, "bolha", "books", POLLING_CONFIG, 0.0)
+
+    polling.record_poll(tmp_path, "bolha", "books", 0, POLLING_CONFIG, 0.0)
+
+    # change rate of 0.5 after a poll without new items, so the interval is 40 minutes
+    assert not polling.is_due(tmp_path, "bolha", "books", POLLING_CONFIG, 30 * 60.0)
+    assert polling.is_due(tmp_path, "bolha", "books", POLLING_CONFIG, 40 * 60.0)
+
+
+def test_min_interval_must_not_exceed_max_interval():
+    with pytest.raises(ValueError):
+        configuration.PollingConfig(min_interval_minutes=60, max_interval_minutes=10)
+
+
+class CountingSpider(spiders.Spider):
+    name = "counting"
+    crawled: list[str] = []
+
+    def run_query(self, query: str, url: str) -> list[spiders.SpiderItem]:
+        self.crawled.append(query)
+        return [{"query": query, "url": url}]
+
+
+def test_scrape_skips_queries_which_are_not_due(monkeypatch, tmp_path: pathlib.Path):
+    monkeypatch.setattr(spiders, "get_spider_by_name", lambda name: CountingSpider)
+    monkeypatch.setattr(CountingSpider, "crawled", [])
+    spiders_configuration = {
+        "counting": configuration.SpiderConfig(
+            notifications={}, urls={"books": "url_1", "games": "url_2"}, polling=POLLING_CONFIG
+        )
+    }
+    # 'games' was polled a minute ago
+    polling.record_poll(tmp_path, "counting", "games", 0, POLLING_CONFIG, time.time() - 60)
+
+    report = scrape.RunReport()
+    diff = scrape.scrape(["counting"], spiders_configuration, tmp_path, report)
+
+    assert CountingSpider.crawled == ["books"]
+    assert diff == {"counting": [{"query": "books", "url": "url_1"}]}
+    assert [query_report.query for query_report in report.queries] == ["books"]
+    assert not polling.is_due(tmp_path, "counting", "books", POLLING_CONFIG, time.time())
+
+    # polling state is removed along with the query's cache
+    scrape.prune_cache(tmp_path, ["counting"], {"counting": configuration.SpiderConfig(notifications={}, urls={})})
+
+    assert not cache.query_state_path(tmp_path, "counting", "books").exists()
+    assert not cache.query_state_path(tmp_path, "counting", "games").exists()
+
+
+def test_query_with_corrupt_polling_state_is_due(monkeypatch, tmp_path: pathlib.Path):
+    monkeypatch.setattr(spiders, "get_spider_by_name", lambda name: CountingSpider)
+    monkeypatch.setattr(CountingSpider, "crawled", [])
+    spiders_configuration = {
+        "counting": configuration.SpiderConfig(
+            notifications={}, urls={"books": "url_1", "games": "url_2"}, polling=POLLING_CONFIG
+        )
+    }
+    polling.record_poll(tmp_path, "counting", "games", 0, POLLING_CONFIG, time.time() - 60)
+    cache.query_state_path(tmp_path, "counting", "books").write_text("{", encoding="utf8")
+
+    report = scrape.RunReport()
+    scrape.scrape(["counting"], spiders_configuration, tmp_path, report)
+
+    assert CountingSpider.crawled == ["books"]
+    assert not report.errors
+    # corrupt state is replaced by the poll
+    assert not polling.is_due(tmp_path, "counting", "books", POLLING_CONFIG, time.time())
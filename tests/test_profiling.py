@@ -0,0 +1,54 @@
+import concurrent.futures
+import pathlib
+import pstats
+
+from news_crawlers import profiling
+
+
+def _busy_work() -> int:
+    return sum(len(str(i)) for i in range(10000))
+
+
+def test_profiler_writes_pstats_and_allocation_reports(tmp_path: pathlib.Path):
+    profiler = profiling.Profiler(tmp_path / "profiles", trace_memory=True)
+    profiler.start_run()
+
+    with profiler.profile("avtonet"):
+        _busy_work()
+
+    pstats_files = list((tmp_path / "profiles").glob("*_avtonet.pstats"))
+    allocation_files = list((tmp_path / "profiles").glob("*_avtonet_allocations.txt"))
+
+    assert len(pstats_files) == 1
+    assert len(allocation_files) == 1
+    assert pstats.Stats(str(pstats_files[0])).total_calls > 0
+
+
+def test_profiler_profiles_only_every_nth_run(tmp_path: pathlib.Path):
+    profiler = profiling.Profiler(tmp_path, every=2)
+
+    profiled_runs = []
+    for _ in range(4):
+        profiled_runs.append(profiler.start_run())
+        with profiler.profile("bolha"):
+            _busy_work()
+
+    assert profiled_runs == [True, False, True, False]
+    assert len(list(tmp_path.glob("*.pstats"))) == 2
+
+
+def _task_work() -> int:
+    return _busy_work()
+
+
+def test_tasks_are_run_in_profiled_thread(tmp_path: pathlib.Path):
+    profiler = profiling.Profiler(tmp_path)
+    profiler.start_run()
+
+    with profiler.profile("bolha"), profiling.create_executor(2) as executor:
+        futures = [executor.submit(_task_work) for _ in range(3)]
+        assert [future.result() for future in futures] == [_busy_work()] * 3
+
+    stats = pstats.Stats(str(next(tmp_path.glob("*_bolha.pstats"))))
+    assert [calls for (_, _, function), (calls, *_) in stats.stats.items() if function == "_task_work"] == [3]
+    assert isinstance(profiling.create_executor(2), concurrent.futures.ThreadPoolExecutor)
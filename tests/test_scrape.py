@@ -1,15 +1,23 @@
 import json
+import time
 
 import pytest
+import requests
 
+from news_crawlers import cache
+from news_crawlers import configuration
+from news_crawlers import notificators
 from news_crawlers import scrape
+from news_crawlers import spiders
+
+# pylint: disable=unused-argument
 
 INITIAL_CACHE_CONTENT = [{"item_1": "some_content_1"}]
 
 
 @pytest.fixture(name="initial_cache_file")
 def initial_cache_file_fixture(tmp_path):
-    cache_file_path = tmp_path / ".nc_cache" / "avtonet_cached.json"
+    cache_file_path = tmp_path / ".nc_cache" / "avtonet" / "query.json"
     cache_file_path.parent.mkdir(exist_ok=True, parents=True)
     with open(cache_file_path, "w+", encoding="utf8") as cache_file:
         json.dump(INITIAL_CACHE_CONTENT, cache_file)
@@ -18,19 +26,198 @@ def initial_cache_file_fixture(tmp_path):
 
 
 def test_check_diff(initial_cache_file):
-    crawled_data = {"avtonet": [{"item_2": "some_content_2"}]}
-    diff = scrape.check_diff(initial_cache_file.parent, crawled_data)
+    cache_folder = initial_cache_file.parent.parent
+    diff = scrape.check_diff(cache_folder, "avtonet", "query", [{"item_2": "some_content_2"}])
+
+    assert diff == [{"item_2": "some_content_2"}]
+
+    newly_crawled_items = [{"item_2": "some_content_2"}, {"item_3": "some_content_3"}]
+    diff = scrape.check_diff(cache_folder, "avtonet", "query", newly_crawled_items)
+
+    assert diff == [{"item_3": "some_content_3"}]
+
+
+def test_check_diff_returns_empty_list_if_no_new_items(initial_cache_file):
+    diff = scrape.check_diff(initial_cache_file.parent.parent, "avtonet", "query", INITIAL_CACHE_CONTENT)
+
+    assert not diff
+
+
+def test_check_diff_only_touches_cache_of_its_query(initial_cache_file):
+    cache_folder = initial_cache_file.parent.parent
+
+    diff = scrape.check_diff(cache_folder, "avtonet", "other/query", INITIAL_CACHE_CONTENT)
+
+    assert diff == INITIAL_CACHE_CONTENT
+    assert cache.read_items(initial_cache_file) == INITIAL_CACHE_CONTENT
+    assert (cache_folder / "avtonet" / "other%2Fquery.json").exists()
+
+
+def test_legacy_spider_cache_is_migrated_per_query(tmp_path):
+    cache.write_items(
+        cache.legacy_path(tmp_path, "bolha"),
+        [{"query": "books", "title": "book"}, {"query": "games", "title": "game"}],
+    )
+
+    assert not scrape.check_diff(tmp_path, "bolha", "books", [{"query": "books", "title": "book"}])
+    assert cache.legacy_path(tmp_path, "bolha").exists()
+
+    scrape.prune_cache(tmp_path, ["bolha"], {"bolha": _spider_config({"books": "url_1"})})
+
+    assert not cache.legacy_path(tmp_path, "bolha").exists()
+
+
+def test_prune_cache_removes_queries_which_are_no_longer_configured(tmp_path):
+    for query in ("books", "games"):
+        scrape.check_diff(tmp_path, "bolha", query, [{"query": query}])
+
+    scrape.prune_cache(tmp_path, ["bolha"], {"bolha": _spider_config({"books": "url_1"})})
+
+    assert cache.read_query_items(tmp_path, "bolha", "books") == [{"query": "books"}]
+    assert not cache.query_path(tmp_path, "bolha", "games").exists()
+
+
+def test_select_queries():
+    spiders_configuration = {
+        "bolha": _spider_config({"books": "url_1", "games": "url_2"}),
+        "avtonet": _spider_config({"books": "url_3", "cars": "url_4"}),
+    }
+
+    selected = scrape.select_queries(spiders_configuration, ["books", "avtonet:cars"])
+
+    assert selected["bolha"].urls == {"books": "url_1"}
+    assert selected["avtonet"].urls == {"books": "url_3", "cars": "url_4"}
+
+
+class FlakySpider(spiders.Spider):
+    name = "flaky"
+
+    def run_query(self, query: str, url: str) -> list[spiders.SpiderItem]:
+        if url == "fail":
+            raise RuntimeError(f"query {query} failed")
+        return [{"query": query, "url": url}]
+
+
+def _spider_config(urls: dict[str, str]) -> configuration.SpiderConfig:
+    return configuration.SpiderConfig(notifications={}, urls=urls)
+
+
+def test_scrape_isolates_failing_queries_and_spiders(monkeypatch, tmp_path):
+    def get_spider_by_name(name: str) -> type[spiders.Spider]:
+        if name == "missing":
+            raise KeyError(name)
+        return FlakySpider
+
+    monkeypatch.setattr(spiders, "get_spider_by_name", get_spider_by_name)
+
+    spiders_configuration = {
+        "flaky": _spider_config({"first": "url_1", "broken": "fail", "last": "url_3"}),
+        "missing": _spider_config({"query": "url"}),
+    }
+    report = scrape.RunReport()
+
+    diff = scrape.scrape(["missing", "flaky"], spiders_configuration, tmp_path, report)
+
+    assert diff == {"flaky": [{"query": "first", "url": "url_1"}, {"query": "last", "url": "url_3"}]}
+    assert [(error.spider, error.query) for error in report.errors] == [("missing", None), ("flaky", "broken")]
+    assert [query_report.new_items for query_report in report.queries] == [1, 0, 1]
+    assert report.queries[1].error == "RuntimeError: query broken failed"
+
+    # new items of successful queries were committed to cache
+    assert not scrape.check_diff(tmp_path, "flaky", "first", diff["flaky"][:1])
+
+
+def test_notify_records_failing_notificator_and_continues(monkeypatch):
+    sent = []
+
+    def failing_send_text(obj, subject, message):
+        raise ConnectionError("SMTP server unavailable")
+
+    monkeypatch.setattr(notificators.EmailNotificator, "send_text", failing_send_text)
+    monkeypatch.setattr(notificators.PushoverNotificator, "send_text", lambda obj, subject, msg: sent.append(msg))
+
+    notifications = {
+        "email": {"email_user": "user", "email_password": "pass", "recipients": "a", "message_body_format": "{url}"},
+        "pushover": {"app_token": "token", "recipients": "b", "message_body_format": "{url}"},
+    }
+    report = scrape.RunReport()
+
+    spiders_configuration = {"flaky": configuration.SpiderConfig(notifications=notifications, urls={})}
+    scrape.notify({"flaky": [{"url": "url_1"}]}, spiders_configuration, report)
+
+    assert sent == ["url_1"]
+    assert [(error.stage, error.notificator) for error in report.errors] == [("notify", "email")]
+
+
+def test_digest_sends_single_message_per_notification_target(monkeypatch):
+    sent = []
+    instances = []
+    monkeypatch.setattr(
+        notificators.EmailNotificator, "send_text", lambda obj, subject, msg: sent.append((obj.recipients, msg))
+    )
+    # functions (unlike bound methods) receive the notificator as first argument when set on the class
+    # pylint: disable=unnecessary-lambda
+    monkeypatch.setattr(notificators.EmailNotificator, "close", lambda obj: instances.append(obj))
+
+    def email(recipients: str, message_body_format: str) -> dict[str, str | bool]:
+        return {
+            "email_user": "user",
+            "email_password": "pass",
+            "recipients": recipients,
+            "message_body_format": message_body_format,
+        }
+
+    spiders_configuration = {
+        "avtonet": configuration.SpiderConfig(notifications={"email": email("a", "{title}\n")}, urls={}),
+        "bolha": configuration.SpiderConfig(notifications={"email": email("a", "{url}\n")}, urls={}),
+        "nepremicnine": configuration.SpiderConfig(notifications={"email": email("b", "{url}\n")}, urls={}),
+    }
+    diff = {
+        "avtonet": [{"title": "Kia", "url": "url_1"}],
+        "bolha": [{"url": "url_2"}, {"url": "url_3"}],
+        "nepremicnine": [{"url": "url_4"}],
+    }
+
+    scrape.notify(diff, spiders_configuration, scrape.RunReport(), digest=True)
+
+    assert sent == [
+        (["a"], "avtonet (1 new)\nKia\n\nbolha (2 new)\nurl_2\nurl_3\n"),
+        (["b"], "nepremicnine (1 new)\nurl_4\n"),
+    ]
+    assert len(instances) == 2
+
+
+class SlowSpider(spiders.Spider):
+    """
+    Spider, whose first page takes longer than its deadline.
+    """
+
+    name = "slow"
 
-    assert diff == {"avtonet": [{"item_2": "some_content_2"}]}
+    def run_query(self, query: str, url: str) -> list[spiders.SpiderItem]:
+        first_page_items = [{"query": query, "url": url}]
+        time.sleep(0.2)
+        return first_page_items + self._crawl_pages(query, [url + "?page=2"], first_page_items, self._crawl_page)
 
-    newly_crawled_data = {"avtonet": [{"item_2": "some_content_2"}, {"item_3": "some_content_3"}]}
-    diff = scrape.check_diff(initial_cache_file.parent, newly_crawled_data)
+    def _crawl_page(self, query: str, url: str) -> list[spiders.SpiderItem]:
+        self.fetcher.get_html(url)
+        return [{"query": query, "url": url}]
 
-    assert diff == {"avtonet": [{"item_3": "some_content_3"}]}
 
+def test_partial_results_are_committed_and_unfinished_queries_reported(monkeypatch, tmp_path):
+    monkeypatch.setattr(spiders, "get_spider_by_name", lambda name: SlowSpider)
+    monkeypatch.setattr(
+        requests, "get", lambda url, headers, timeout, **kwargs: pytest.fail("request sent after deadline")
+    )
+    spiders_configuration = {
+        "slow": configuration.SpiderConfig(
+            notifications={}, urls={"first": "https://a.com", "second": "https://b.com"}, deadline_seconds=0.1
+        )
+    }
+    report = scrape.RunReport()
 
-def test_check_diff_returns_empty_dict_if_no_new_items(initial_cache_file):
-    crawled_data = {"avtonet": INITIAL_CACHE_CONTENT}
-    diff = scrape.check_diff(initial_cache_file.parent, crawled_data)
+    diff = scrape.scrape(["slow"], spiders_configuration, tmp_path, report)
 
-    assert diff == {}  # pylint: disable=use-implicit-booleaness-not-comparison
+    assert diff == {"slow": [{"query": "first", "url": "https://a.com"}]}
+    assert [(query.items, query.unfinished) for query in report.queries] == [(1, True), (0, True)]
+    assert not report.errors
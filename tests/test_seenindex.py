@@ -0,0 +1,120 @@
+import pathlib
+
+import pytest
+
+from news_crawlers import cache
+from news_crawlers import configuration
+from news_crawlers import metrics
+from news_crawlers import scrape
+from news_crawlers import seenindex
+
+INDEX_CONFIG = configuration.SeenIndexConfig(capacity=1000, false_positive_rate=0.01)
+
+
+@pytest.fixture(name="index")
+def index_fixture(tmp_path: pathlib.Path):
+    index = seenindex.SeenIndex(tmp_path / "bolha", INDEX_CONFIG)
+    yield index
+    index.close()
+
+
+def test_bloom_filter_false_positive_rate(tmp_path: pathlib.Path):
+    bloom_filter = seenindex.BloomFilter(tmp_path / "seen.bloom", 1000, 0.01)
+    added = [seenindex.get_digest("query", {"id": str(index)}) for index in range(1000)]
+    for digest in added:
+        bloom_filter.add(digest)
+
+    false_positives = sum(
+        bloom_filter.might_contain(seenindex.get_digest("other", {"id": str(index)})) for index in range(10000)
+    )
+    bloom_filter.close()
+
+    assert all(seenindex.BloomFilter(tmp_path / "seen.bloom", 1000, 0.01).might_contain(digest) for digest in added)
+    assert false_positives < 200
+
+
+def test_only_new_items_are_added(index: seenindex.SeenIndex):
+    metrics.REGISTRY.reset()
+
+    assert index.add_new("books", [{"title": "a"}, {"title": "b"}, {"title": "a"}]) == [{"title": "a"}, {"title": "b"}]
+    assert index.add_new("books", [{"title": "b"}, {"title": "c"}]) == [{"title": "c"}]
+    # same item found by another query is new for that query
+    assert index.add_new("games", [{"title": "a"}]) == [{"title": "a"}]
+
+    assert index.all_seen("books", [{"title": "c"}, {"title": "a"}])
+    assert not index.all_seen("books", [{"title": "a"}, {"title": "d"}])
+    assert not index.all_seen("games", [{"title": "b"}])
+    lookups = metrics.REGISTRY.run_summary()["metrics"]["news_crawlers_seen_index_lookups_total"]
+    assert lookups['result="seen"'] == 1
+    assert lookups['result="new"'] + lookups.get('result="false_positive"', 0) == 4
+
+
+def test_filter_is_rebuilt_when_its_configuration_changes(index: seenindex.SeenIndex, tmp_path: pathlib.Path):
+    index.add_new("books", [{"title": "a"}])
+    index.close()
+
+    resized = seenindex.SeenIndex(tmp_path / "bolha", configuration.SeenIndexConfig(capacity=10))
+    try:
+        assert resized.bloom_filter.created
+        assert resized.bloom_filter.might_contain(seenindex.get_digest("books", {"title": "a"}))
+        assert not resized.add_new("books", [{"title": "a"}])
+    finally:
+        resized.close()
+
+
+def test_items_missed_by_stale_filter_are_not_new(index: seenindex.SeenIndex, tmp_path: pathlib.Path):
+    index.add_new("books", [{"title": "a"}])
+    index.close()
+    # filter without the committed item, e.g. restored from an older backup
+    seenindex.BloomFilter(tmp_path / "stale.bloom", 1000, 0.01).close()
+    (tmp_path / "stale.bloom").replace(tmp_path / "bolha" / seenindex.FILTER_FILE_NAME)
+
+    reopened = seenindex.SeenIndex(tmp_path / "bolha", INDEX_CONFIG)
+    try:
+        assert reopened.add_new("books", [{"title": "a"}, {"title": "b"}]) == [{"title": "b"}]
+        assert not reopened.add_new("books", [{"title": "a"}, {"title": "b"}])
+    finally:
+        reopened.close()
+
+
+def test_scrape_diffs_with_seen_index(tmp_path: pathlib.Path):
+    # items cached before the index was enabled are moved to it
+    cache.write_query_items(tmp_path, "bolha", "books", [{"title": "cached"}])
+    index = seenindex.SeenIndex(cache.spider_folder(tmp_path, "bolha"), INDEX_CONFIG)
+
+    new_items = scrape.check_diff(
+        tmp_path, "bolha", "books", [{"title": "cached"}, {"title": "new"}], scrape.ItemStore(index)
+    )
+    index.close()
+
+    assert new_items == [{"title": "new"}]
+    assert cache.read_query_items(tmp_path, "bolha", "books") == [{"title": "cached"}]
+
+    scrape.prune_cache(tmp_path, ["bolha"], {"bolha": configuration.SpiderConfig(notifications={}, urls={})})
+
+    index = seenindex.SeenIndex(tmp_path / "bolha", INDEX_CONFIG)
+    assert not index.has_query("books")
+    index.close()
+
+
+def test_seen_pages_are_looked_up_in_cache_or_index(tmp_path: pathlib.Path):
+    spider_configuration = configuration.SpiderConfig(
+        type="avtonet", notifications={}, urls={"books": "url"}, stop_at_seen_page=True
+    )
+    cache.write_query_items(tmp_path, "bolha", "books", [{"title": "a"}])
+    create_spider = scrape._create_spider  # pylint: disable=protected-access
+
+    spider = create_spider("bolha", spider_configuration, tmp_path)
+    assert spider.all_seen is not None
+    assert spider.all_seen("books", [{"title": "a"}])
+    assert not spider.all_seen("books", [{"title": "a"}, {"title": "b"}])
+
+    index = seenindex.SeenIndex(cache.spider_folder(tmp_path, "bolha"), INDEX_CONFIG)
+    try:
+        index.add_new("books", [{"title": "b"}])
+        spider = create_spider("bolha", spider_configuration, tmp_path, index)
+        assert spider.all_seen is not None
+        assert spider.all_seen("books", [{"title": "b"}])
+        assert not spider.all_seen("books", [{"title": "a"}])
+    finally:
+        index.close()
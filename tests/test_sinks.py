@@ -0,0 +1,113 @@
+import json
+import sqlite3
+
+import pytest
+
+from news_crawlers import configuration
+from news_crawlers import notificators
+from news_crawlers import scrape
+from news_crawlers import sinks
+from tests.mocks import LocalHttpServer
+
+ITEMS = [{"title": "book", "url": "https://www.bolha.com/1"}, {"title": "game", "url": "https://www.bolha.com/2"}]
+
+
+@pytest.fixture(autouse=True, name="close_sinks")
+def close_sinks_fixture():
+    yield
+    sinks.close_sinks()
+
+
+def _spiders_configuration(sinks_config: dict) -> dict[str, configuration.SpiderConfig]:
+    return {
+        spider_name: configuration.SpiderConfig(notifications={}, urls={}, sinks=sinks_config)
+        for spider_name in ("bolha", "avtonet")
+    }
+
+
+def test_items_of_all_spiders_are_appended_to_jsonl_file(tmp_path):
+    spiders_configuration = _spiders_configuration({"jsonl": {"path": str(tmp_path / "items.jsonl")}})
+
+    scrape.write_sinks({"bolha": ITEMS, "avtonet": ITEMS[:1]}, spiders_configuration)
+    scrape.write_sinks({"bolha": ITEMS[1:]}, spiders_configuration)
+
+    with open(tmp_path / "items.jsonl", encoding="utf8") as file:
+        records = [json.loads(line) for line in file]
+    assert [(record["spider"], record["item"]) for record in records] == [
+        ("bolha", ITEMS[0]),
+        ("bolha", ITEMS[1]),
+        ("avtonet", ITEMS[0]),
+        ("bolha", ITEMS[1]),
+    ]
+
+
+def test_items_are_inserted_into_sqlite_table(tmp_path):
+    spiders_configuration = _spiders_configuration({"sqlite": {"path": str(tmp_path / "items.db"), "table": "found"}})
+
+    scrape.write_sinks({"bolha": ITEMS}, spiders_configuration)
+    scrape.write_sinks({"avtonet": ITEMS[:1]}, spiders_configuration)
+
+    with sqlite3.connect(tmp_path / "items.db") as connection:
+        rows = connection.execute("SELECT spider, item FROM found ORDER BY rowid").fetchall()
+    connection.close()
+    assert [(spider, json.loads(item)) for spider, item in rows] == [
+        ("bolha", ITEMS[0]),
+        ("bolha", ITEMS[1]),
+        ("avtonet", ITEMS[0]),
+    ]
+
+
+def test_sqlite_table_name_is_validated(tmp_path):
+    with pytest.raises(ValueError):
+        sinks.SqliteSink({"path": str(tmp_path / "items.db"), "table": "items; DROP TABLE items"})
+
+
+def test_each_run_is_posted_once_over_a_kept_alive_connection():
+    with LocalHttpServer() as server:
+        spiders_configuration = _spiders_configuration({"webhook": {"url": server.url, "token": "secret"}})
+
+        scrape.write_sinks({"bolha": ITEMS, "avtonet": ITEMS}, spiders_configuration)
+        scrape.write_sinks({"bolha": ITEMS[:1]}, spiders_configuration)
+
+    assert [len(body["records"]) for body in server.bodies] == [4, 1]
+    assert len(set(server.client_ports)) == 1
+
+
+def test_sink_failure_is_reported():
+    with LocalHttpServer() as server:
+        server.statuses.append(500)
+        report = scrape.RunReport()
+
+        spiders_configuration = _spiders_configuration({"webhook": {"url": server.url, "retries": "0"}})
+
+        scrape.write_sinks({"bolha": ITEMS}, spiders_configuration, report)
+
+    assert [(error.stage, error.spider, error.sink) for error in report.errors] == [("sink", "bolha", "webhook")]
+
+
+def test_failed_webhook_post_is_retried():
+    with LocalHttpServer() as server:
+        server.statuses.extend([503, 500])
+        report = scrape.RunReport()
+        spiders_configuration = _spiders_configuration(
+            {"webhook": {"url": server.url, "token": "secret", "retry_backoff_seconds": "0"}}
+        )
+
+        scrape.write_sinks({"bolha": ITEMS}, spiders_configuration, report)
+
+    assert not report.errors
+    assert [len(body["records"]) for body in server.bodies] == [2, 2, 2]
+
+
+def test_webhook_retry_after_is_limited_by_max_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(notificators.time, "sleep", sleeps.append)
+    with LocalHttpServer() as server:
+        server.statuses.append(503)
+        server.retry_after = "86400"
+        spiders_configuration = _spiders_configuration({"webhook": {"url": server.url, "max_backoff_seconds": "2"}})
+
+        scrape.write_sinks({"bolha": ITEMS}, spiders_configuration, scrape.RunReport())
+
+    assert sleeps == [2]
+    assert len(server.bodies) == 2
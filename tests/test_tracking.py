@@ -0,0 +1,66 @@
+import pytest
+
+from news_crawlers import cache
+from news_crawlers import configuration
+from news_crawlers import scrape
+from news_crawlers import tracking
+
+STORE = scrape.ItemStore(identity_key="url")
+
+
+def test_changed_item_is_updated_in_place(tmp_path):
+    cache.write_query_items(tmp_path, "avtonet", "cars", [{"url": "a", "price": "100"}, {"url": "b", "price": "5"}])
+
+    items = scrape.check_diff(
+        tmp_path, "avtonet", "cars", [{"url": "a", "price": "90"}, {"url": "c", "price": "7"}], STORE
+    )
+
+    assert items == [
+        {"url": "c", "price": "7"},
+        {"url": "a", "price": "90", "changed": "price", "previous_price": "100"},
+    ]
+    assert cache.read_query_items(tmp_path, "avtonet", "cars") == [
+        {"url": "a", "price": "90"},
+        {"url": "b", "price": "5"},
+        {"url": "c", "price": "7"},
+    ]
+    assert not scrape.check_diff(tmp_path, "avtonet", "cars", [{"url": "a", "price": "90"}], STORE)
+
+
+def test_duplicate_cached_items_are_merged():
+    cached_items = [{"url": "a", "price": "100"}, {"url": "a", "price": "90"}, {"title": "no url"}]
+
+    tracked = tracking.diff_items(cached_items, [{"url": "a", "price": "90"}, {"title": "no url"}], "url")
+
+    assert not tracked.items
+    assert tracked.cached_items == [{"url": "a", "price": "90"}, {"title": "no url"}]
+    assert tracked.modified
+
+
+def test_notifications_are_sent_for_selected_changes():
+    items = [
+        {"url": "c", "price": "7"},
+        {"url": "a", "price": "90", "changed": "price", "previous_price": "100"},
+        {"url": "b", "title": "new", "changed": "title", "previous_title": "old"},
+    ]
+    spider_configuration = configuration.SpiderConfig(
+        notifications={"email": {}}, urls={}, identity_key="url", notify_on=["changed:price"]
+    )
+
+    outgoing = scrape.get_outgoing_notifications({"avtonet": items}, {"avtonet": spider_configuration})
+
+    assert outgoing == [scrape.OutgoingNotification("avtonet", "email", [items[1]])]
+    assert tracking.select_notified(items, ["new", "changed:title"]) == [items[0], items[2]]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"notify_on": ["changed:price"]},
+        {"identity_key": "url", "notify_on": ["removed"]},
+        {"identity_key": "url", "seen_index": {}},
+    ],
+)
+def test_invalid_change_tracking_configuration(options: dict):
+    with pytest.raises(ValueError):
+        configuration.SpiderConfig(notifications={}, urls={}, **options)
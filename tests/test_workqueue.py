@@ -0,0 +1,127 @@
+import multiprocessing
+import pathlib
+
+import pytest
+
+from news_crawlers import cache
+from news_crawlers import configuration
+from news_crawlers import scrape
+from news_crawlers import spiders
+from news_crawlers import workqueue
+
+# pylint: disable=unused-argument
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture(name="clock")
+def clock_fixture() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture(name="queue")
+def queue_fixture(tmp_path: pathlib.Path, clock: FakeClock) -> workqueue.WorkQueue:
+    return workqueue.WorkQueue(tmp_path / "queue.sqlite", lease_seconds=60, clock=clock.time)
+
+
+def test_enqueue_is_idempotent(queue: workqueue.WorkQueue):
+    assert queue.enqueue(1, [("bolha", "books"), ("bolha", "games")]) == 2
+    assert queue.enqueue(1, [("bolha", "books"), ("bolha", "games")]) == 0
+    assert queue.enqueue(2, [("bolha", "books")]) == 1
+
+
+def test_unit_is_claimed_by_single_worker(queue: workqueue.WorkQueue):
+    queue.enqueue(1, [("bolha", "books")])
+
+    unit = queue.claim(1, "worker_1", ["bolha"])
+
+    assert unit is not None
+    assert queue.claim(1, "worker_2", ["bolha"]) is None
+
+    with queue.committing(unit):
+        pass
+
+    assert queue.states(1) == {("bolha", "books"): "done"}
+
+
+def test_units_of_other_spiders_are_not_claimed(queue: workqueue.WorkQueue):
+    queue.enqueue(1, [("bolha", "books")])
+
+    assert queue.claim(1, "worker", ["avtonet"]) is None
+
+
+def test_expired_lease_is_claimed_again_and_old_owner_cannot_commit(queue: workqueue.WorkQueue, clock: FakeClock):
+    queue.enqueue(1, [("bolha", "books")])
+    stale_unit = queue.claim(1, "crashed_worker", ["bolha"])
+    assert stale_unit is not None
+
+    clock.now += 61
+    unit = queue.claim(1, "worker", ["bolha"])
+
+    assert unit is not None
+    assert unit.owner == "worker"
+    with pytest.raises(workqueue.LeaseLostError):
+        with queue.committing(stale_unit):
+            pass
+
+
+def test_failed_commit_does_not_complete_unit(queue: workqueue.WorkQueue):
+    queue.enqueue(1, [("bolha", "books")])
+    unit = queue.claim(1, "worker", ["bolha"])
+    assert unit is not None
+
+    with pytest.raises(RuntimeError):
+        with queue.committing(unit):
+            raise RuntimeError("disk full")
+
+    assert queue.states(1) == {("bolha", "books"): "leased"}
+
+    queue.fail(unit, "RuntimeError: disk full")
+    assert queue.states(1) == {("bolha", "books"): "failed"}
+
+
+class CountingSpider(spiders.Spider):
+    """
+    Spider, which records each crawl to a log file, shared by all processes.
+    """
+
+    name = "counting"
+    crawl_log = pathlib.Path()
+
+    def run_query(self, query: str, url: str) -> list[spiders.SpiderItem]:
+        with open(self.crawl_log, "a", encoding="utf8") as file:
+            file.write(query + "\n")
+        return [{"query": query, "url": url}]
+
+
+def _work(queue: workqueue.WorkQueue, tick: int, cache_folder: pathlib.Path) -> int:
+    spiders_configuration = {
+        "counting": configuration.SpiderConfig(notifications={}, urls={f"query_{i}": f"url_{i}" for i in range(20)})
+    }
+    diff = scrape.scrape_queue(queue, tick, ["counting"], spiders_configuration, cache_folder)
+    return len(diff.get("counting", []))
+
+
+def test_units_are_crawled_exactly_once_by_several_processes(monkeypatch, tmp_path: pathlib.Path):
+    monkeypatch.setattr(CountingSpider, "crawl_log", tmp_path / "crawls.log")
+    monkeypatch.setattr(spiders, "get_spider_by_name", lambda name: CountingSpider)
+    queue = workqueue.WorkQueue(tmp_path / "queue.sqlite")
+
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        new_items = pool.starmap(_work, [(queue, 1, tmp_path / "cache")] * 4)
+
+    crawled_queries = (tmp_path / "crawls.log").read_text(encoding="utf8").split()
+    cached_items = [
+        item for i in range(20) for item in cache.read_query_items(tmp_path / "cache", "counting", f"query_{i}")
+    ]
+
+    assert sum(new_items) == 20
+    assert sorted(crawled_queries) == sorted(f"query_{i}" for i in range(20))
+    assert len(cached_items) == 20
+    assert set(queue.states(1).values()) == {"done"}